@@ -0,0 +1,60 @@
+# 目錄共用 benchmark：st.cache_data（每次 rerun 反序列化出一份新的 DataFrame）vs. 登錄表裡的共用 CatalogIndex
+#
+#   python benchmarks/bench_catalog_share.py
+
+import os
+import sys
+import time
+import pickle
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from catalog import load_catalog, load_catalog_index  # noqa: E402
+
+EXCEL_PATH = os.path.join(os.path.dirname(__file__), "..", "產品碳足跡3.xlsx")
+N_RERUNS = 200
+
+
+def cache_data_rerun(blob: bytes):
+    # st.cache_data 命中時的行為：pickle.loads 出新的 DataFrame，再依 code 切出 6 個子表
+    df = pickle.loads(blob)
+    return [df[df["code"] == c].copy() for c in ("1", "1-1", "1-2", "2", "3", "4-1")]
+
+
+def registry_rerun():
+    cat = load_catalog_index(EXCEL_PATH)
+    return [cat.count(c) for c in ("1", "1-1", "1-2", "2", "3", "4-1")]
+
+
+def retained_bytes(fn) -> float:
+    tracemalloc.start()
+    base = tracemalloc.get_traced_memory()[0]
+    kept = [fn() for _ in range(N_RERUNS)]
+    used = tracemalloc.get_traced_memory()[0] - base
+    tracemalloc.stop()
+    del kept
+    return used / N_RERUNS
+
+
+def best_of(fn, repeat=200):
+    best = float("inf")
+    for _ in range(repeat):
+        t = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t)
+    return best
+
+
+def main():
+    blob = pickle.dumps(load_catalog(EXCEL_PATH).copy())
+    registry_rerun()  # 先登錄好，只量命中的情況
+
+    old_t, new_t = best_of(lambda: cache_data_rerun(blob)), best_of(registry_rerun)
+    print(f"per-rerun catalog access   cache_data {old_t * 1e6:8.1f} us   registry {new_t * 1e6:6.1f} us")
+    # 每個還在跑的 rerun / session 各握著一份（cache_data）vs. 全部指向同一個物件（registry）
+    old_b, new_b = retained_bytes(lambda: cache_data_rerun(blob)), retained_bytes(registry_rerun)
+    print(f"per-rerun retained memory  cache_data {old_b / 1024:8.1f} KiB  registry {new_b / 1024:6.2f} KiB")
+
+
+if __name__ == "__main__":
+    main()
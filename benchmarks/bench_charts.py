@@ -0,0 +1,70 @@
+# 每次 rerun 畫結果圖表的成本：原本 DataFrame + Altair 重建 vs. 依類別數值快取的 Vega-Lite spec
+#
+#   python benchmarks/bench_charts.py
+#
+# 兩邊都算到「交給前端的 JSON 字串」為止（st.altair_chart 也會 to_dict + 轉 Arrow 後序列化）。
+
+import os
+import sys
+import json
+import time
+
+import pandas as pd
+import altair as alt
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from charts import bar_spec, chart_key, pie_spec  # noqa: E402
+
+TOTALS = [("Food", 6.0), ("Cooking", 1.696), ("Drink", 0.13), ("Transport", 0.09), ("Dessert", 3.317), ("Packaging", 0.8)]
+
+
+def rerun_old():
+    chart_data = pd.DataFrame([{"cat": c, "kgCO2e": v} for c, v in TOTALS])
+    chart_data = chart_data[chart_data["kgCO2e"] > 0].copy()
+    denom = float(chart_data["kgCO2e"].sum()) or 1.0
+    chart_data["pct"] = chart_data["kgCO2e"] / denom
+    chart_data["pct_label"] = (chart_data["pct"] * 100).round(0).astype(int).astype(str) + "%"
+    tooltip = ["cat", alt.Tooltip("kgCO2e:Q", format=".3f"), alt.Tooltip("pct:Q", format=".0%")]
+    bar = (
+        alt.Chart(chart_data)
+        .mark_bar()
+        .encode(y=alt.Y("cat:N", sort="-x", title=""), x=alt.X("kgCO2e:Q", title="kgCO₂e"), tooltip=tooltip)
+        .properties(height=200)
+    )
+    pie = (
+        alt.Chart(chart_data)
+        .mark_arc()
+        .encode(
+            theta=alt.Theta("kgCO2e:Q"),
+            color=alt.Color("cat:N", legend=alt.Legend(orient="right", title="Category")),
+            tooltip=tooltip,
+        )
+        .properties(height=280)
+    )
+    labels = alt.Chart(chart_data).mark_text(radius=120).encode(theta=alt.Theta("kgCO2e:Q"), text=alt.Text("pct_label:N"))
+    return json.dumps(bar.to_dict()), json.dumps((pie + labels).to_dict())
+
+
+def rerun_new():
+    key = chart_key(TOTALS)
+    return json.dumps(bar_spec(key, 200)), json.dumps(pie_spec(key, 280, 120))
+
+
+def best_of(fn, repeat=50):
+    best = float("inf")
+    for _ in range(repeat):
+        t = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t)
+    return best
+
+
+def main():
+    old_s, new_s = rerun_old(), rerun_new()
+    print(f"per-rerun charts        old {best_of(rerun_old) * 1e3:8.2f} ms    new {best_of(rerun_new) * 1e3:8.3f} ms")
+    print(f"spec JSON size          old {sum(map(len, old_s)):8d} B     new {sum(map(len, new_s)):8d} B")
+    print(f"spec cache              {bar_spec.cache_info()}")
+
+
+if __name__ == "__main__":
+    main()
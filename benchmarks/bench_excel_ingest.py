@@ -0,0 +1,73 @@
+# Excel 讀取 benchmark：pd.read_excel 整張表再切前 4 欄 vs. openpyxl read_only 串流只取 4 欄
+# 用一份模擬供應商匯出的大檔（很多欄 + 多個工作表）量峰值記憶體與時間
+#
+#   python benchmarks/bench_excel_ingest.py [列數]
+
+import os
+import sys
+import time
+import tempfile
+import tracemalloc
+from io import BytesIO
+
+import pandas as pd
+from openpyxl import Workbook
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from catalog import read_catalog_columns  # noqa: E402
+
+N_ROWS = int(sys.argv[1]) if len(sys.argv) > 1 else 20_000
+N_EXTRA_COLS = 12
+N_EXTRA_SHEETS = 2
+
+
+def make_workbook(path: str) -> None:
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("catalog")
+    ws.append(["編號", "品名", "碳足跡", "宣告單位"] + [f"備註{j}" for j in range(N_EXTRA_COLS)])
+    codes = ["1", "1-1", "1-2", "2", "3", "4-1"]
+    for i in range(N_ROWS):
+        ws.append(
+            [codes[i % len(codes)], f"產品{i}", f"{(i % 900) + 100}.00g", f"每包產品{i}"]
+            + [f"供應商資料 {i}-{j} " * 3 for j in range(N_EXTRA_COLS)]
+        )
+    for k in range(N_EXTRA_SHEETS):
+        extra = wb.create_sheet(f"sheet{k}")
+        for i in range(N_ROWS // 2):
+            extra.append([f"其他 {i}-{j}" for j in range(N_EXTRA_COLS)])
+    wb.save(path)
+
+
+def old_read(path: str):
+    with open(path, "rb") as f:
+        file_bytes = f.read()
+    df = pd.read_excel(BytesIO(file_bytes), engine="openpyxl")
+    return df.iloc[:, :4].copy()
+
+
+def measure(fn, path):
+    # 時間與峰值記憶體分開量（tracemalloc 本身會拖慢好幾倍）
+    t = time.perf_counter()
+    out = fn(path)
+    elapsed = time.perf_counter() - t
+    tracemalloc.start()
+    fn(path)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return out, elapsed, peak
+
+
+def main():
+    with tempfile.TemporaryDirectory() as d:
+        path = os.path.join(d, "big.xlsx")
+        make_workbook(path)
+        print(f"workbook: {N_ROWS:,} rows x {4 + N_EXTRA_COLS} cols + {N_EXTRA_SHEETS} sheets, {os.path.getsize(path) / 1e6:.1f} MB")
+        old, old_t, old_peak = measure(old_read, path)
+        new, new_t, new_peak = measure(read_catalog_columns, path)
+        assert len(old) == len(new["cf_gco2e"])
+        print(f"pd.read_excel + iloc[:, :4]   {old_t:6.2f} s   peak {old_peak / 2**20:7.1f} MiB")
+        print(f"read_only streaming (4 cols)  {new_t:6.2f} s   peak {new_peak / 2**20:7.1f} MiB")
+
+
+if __name__ == "__main__":
+    main()
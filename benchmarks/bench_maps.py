@@ -0,0 +1,86 @@
+# 分店地圖每次 rerun 的成本：原本重建 folium.Map + st_folium vs. maps.render_map（底圖快取 + 動態圖層）
+#
+#   python benchmarks/bench_maps.py
+#
+# 前端元件換掉，只量 Python 端產生元件參數的時間；另外數「元件 key 變了幾次」
+# （key 一變，瀏覽器就整個 iframe 重新載入地圖）。
+
+import os
+import sys
+import time
+import logging
+
+import folium
+import streamlit_folium
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+import maps  # noqa: E402
+from maps import MapBadge, MapMarker, fit_view, render_map  # noqa: E402
+
+logging.getLogger("streamlit").setLevel(logging.ERROR)
+
+ORIGIN = (24.1436, 120.6736)
+RESULTS = [
+    {"name": f"全聯 {i}", "display_name": f"全聯福利中心 {i} 號店", "lat": ORIGIN[0] + 0.004 * i, "lng": ORIGIN[1] - 0.003 * i, "dist_km": 0.5 * i}
+    for i in range(1, 6)
+]
+# 一連串操作：沒搜尋 → 搜尋 → 點別的 widget（內容不變）×3 → 確認分店 → 清空
+STEPS = [([], []), (RESULTS, []), (RESULTS, []), (RESULTS, []), (RESULTS, []), (RESULTS, RESULTS[:1]), ([], RESULTS[:1])]
+
+
+def rerun_old(search, stores):
+    m = folium.Map(location=list(ORIGIN), zoom_start=14)
+    folium.Marker(list(ORIGIN), tooltip="起點", icon=folium.Icon(color="blue", icon="user")).add_to(m)
+    for p in stores:
+        folium.Marker([p["lat"], p["lng"]], tooltip=f"已確認：{p['name']}", popup=p["display_name"], icon=folium.Icon(color="green", icon="shopping-cart")).add_to(m)
+    bounds = [list(ORIGIN)]
+    for i, r in enumerate(search, start=1):
+        bounds.append([r["lat"], r["lng"]])
+        folium.Marker([r["lat"], r["lng"]], tooltip=f"{i}. {r['name']}", popup=r["display_name"], icon=folium.Icon(color="orange", icon="info-sign")).add_to(m)
+        folium.Marker([r["lat"], r["lng"]], icon=folium.DivIcon(html=f"<div>{i}</div>")).add_to(m)
+    if len(bounds) >= 2:
+        m.fit_bounds(bounds)
+    return streamlit_folium.st_folium(m, height=420, use_container_width=True, key="store_map")
+
+
+def rerun_new(search, stores):
+    layer = [MapMarker(p["lat"], p["lng"], tooltip=f"已確認：{p['name']}", popup=p["display_name"], color="green", icon="shopping-cart") for p in stores]
+    bounds = [ORIGIN]
+    for i, r in enumerate(search, start=1):
+        bounds.append((r["lat"], r["lng"]))
+        layer.append(MapMarker(r["lat"], r["lng"], tooltip=f"{i}. {r['name']}", popup=r["display_name"], color="orange", icon="info-sign"))
+        layer.append(MapBadge(r["lat"], r["lng"], str(i)))
+    return render_map(
+        "store_map",
+        ORIGIN,
+        14,
+        base=[MapMarker(*ORIGIN, tooltip="起點", color="blue", icon="user")],
+        layer=layer,
+        view=fit_view(bounds, 420) if len(bounds) >= 2 else None,
+        returned_objects=["last_object_clicked"],
+    )
+
+
+def run(fn):
+    keys = []
+    streamlit_folium._component_func = lambda **kw: keys.append(kw["key"]) or kw["default"]
+    t = time.perf_counter()
+    for search, stores in STEPS:
+        fn(search, stores)
+    elapsed = time.perf_counter() - t
+    reloads = sum(1 for a, b in zip(keys, keys[1:]) if a != b)
+    return elapsed / len(STEPS), reloads
+
+
+def main():
+    run(rerun_old)  # 暖機（jinja 樣板編譯等）
+    old_t, old_r = min(run(rerun_old) for _ in range(5))
+    maps.clear_map_cache()
+    first_t, _ = run(rerun_new)
+    new_t, new_r = min(run(rerun_new) for _ in range(5))
+    print(f"per-rerun store map     old {old_t * 1e3:8.2f} ms    new {new_t * 1e3:8.3f} ms  (cold cache {first_t * 1e3:.2f} ms)")
+    print(f"iframe reloads / {len(STEPS) - 1} steps  old {old_r:8d}       new {new_r:8d}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+# profiler benchmark：每段計時本身要花多少時間（span / Sections），以及多執行緒同時記錄
+#
+#   python benchmarks/bench_profiler.py [次數]
+#
+# 一次 rerun 大約記 10~20 筆，每筆幾微秒，相對整頁幾十毫秒可以忽略。
+
+import os
+import sys
+import time
+import threading
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from profiler import Profiler  # noqa: E402
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    prof = Profiler()
+
+    t = time.perf_counter()
+    for _ in range(n):
+        with prof.span("span"):
+            pass
+    span_us = (time.perf_counter() - t) / n * 1e6
+
+    sections = prof.sections()
+    t = time.perf_counter()
+    for _ in range(n):
+        sections.enter("section")
+    sections.close()
+    section_us = (time.perf_counter() - t) / n * 1e6
+
+    threads = [threading.Thread(target=lambda: [prof.record("threads", 1.0) for _ in range(n // 8)]) for _ in range(8)]
+    t = time.perf_counter()
+    for th in threads:
+        th.start()
+    for th in threads:
+        th.join()
+    thread_us = (time.perf_counter() - t) / (n // 8 * 8) * 1e6
+
+    t = time.perf_counter()
+    rows = prof.summary()
+    summary_ms = (time.perf_counter() - t) * 1e3
+    t = time.perf_counter()
+    out = prof.to_jsonl()
+    export_ms = (time.perf_counter() - t) * 1e3
+
+    print(f"span {span_us:6.2f} us    section {section_us:6.2f} us    8 threads record {thread_us:6.2f} us")
+    print(f"summary ({len(rows)} sections x {prof.window}) {summary_ms:6.2f} ms    JSONL export ({out.count(chr(10))} lines) {export_ms:6.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+# 道路距離 benchmark：合成的棋盤狀道路網（OSM XML），A* / 多目標 Dijkstra vs. 查起點格子快取
+#
+#   python benchmarks/bench_routing.py [格數]
+#
+# 沒有真的台中道路檔也能跑；棋盤路網的最短路 = 曼哈頓距離，順便檢查結果對不對。
+
+import os
+import sys
+import time
+import tempfile
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from geo import haversine_km  # noqa: E402
+from routing import RouteCache, Router, load_road_graph  # noqa: E402
+
+LAT0, LNG0 = 24.10, 120.62
+STEP = 0.001  # 約 100 m
+
+
+def write_grid_osm(path: str, n: int) -> None:
+    with open(path, "w", encoding="utf-8") as f:
+        f.write('<?xml version="1.0" encoding="UTF-8"?>\n<osm version="0.6">\n')
+        for i in range(n):
+            for j in range(n):
+                f.write(f'  <node id="{i * n + j + 1}" lat="{LAT0 + i * STEP:.7f}" lon="{LNG0 + j * STEP:.7f}"/>\n')
+        wid = 1
+        for i in range(n):  # 東西向
+            refs = "".join(f'<nd ref="{i * n + j + 1}"/>' for j in range(n))
+            f.write(f'  <way id="{wid}">{refs}<tag k="highway" v="residential"/></way>\n')
+            wid += 1
+        for j in range(n):  # 南北向
+            refs = "".join(f'<nd ref="{i * n + j + 1}"/>' for i in range(n))
+            f.write(f'  <way id="{wid}">{refs}<tag k="highway" v="residential"/></way>\n')
+            wid += 1
+        f.write("</osm>\n")
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 120
+    rng = np.random.default_rng(0)
+    with tempfile.TemporaryDirectory() as tmp:
+        osm = os.path.join(tmp, "grid.osm")
+        write_grid_osm(osm, n)
+
+        t = time.perf_counter()
+        graph = load_road_graph(osm, cache_dir=tmp)
+        parse_s = time.perf_counter() - t
+        t = time.perf_counter()
+        load_road_graph(osm, cache_dir=tmp)
+        reload_s = time.perf_counter() - t
+        print(f"graph {len(graph)} nodes, {graph.edges('car')} edges   parse {parse_s:6.2f} s   reload (.npz) {reload_s * 1e3:6.1f} ms")
+
+        router = Router(graph, RouteCache(os.path.join(tmp, "routes.sqlite3")))
+        queries = []
+        for _ in range(50):
+            i0, j0 = rng.integers(0, n, 2)
+            dests = [tuple(rng.integers(0, n, 2)) for _ in range(5)]
+            queries.append(((LAT0 + i0 * STEP, LNG0 + j0 * STEP), [(LAT0 + i * STEP, LNG0 + j * STEP) for i, j in dests]))
+
+        t = time.perf_counter()
+        cold = [router.distances_km("car", o[0], o[1], d) for o, d in queries]
+        cold_ms = (time.perf_counter() - t) / len(queries) * 1e3
+        t = time.perf_counter()
+        warm = [router.distances_km("car", o[0], o[1], d) for o, d in queries]
+        warm_ms = (time.perf_counter() - t) / len(queries) * 1e3
+        assert cold == warm
+
+        # 棋盤路網：道路距離 = 南北段 + 東西段（直線距離的 1~1.41 倍）
+        err, ratio = 0.0, []
+        for (o, dests), kms in zip(queries, cold):
+            for d, km in zip(dests, kms):
+                manhattan = haversine_km(o[0], o[1], d[0], o[1]) + haversine_km(d[0], o[1], d[0], d[1])
+                err = max(err, abs(km - manhattan))
+                line = haversine_km(o[0], o[1], d[0], d[1])
+                if line > 0:
+                    ratio.append(km / line)
+        print(f"origin -> 5 branches    route {cold_ms:8.2f} ms    cached {warm_ms:8.3f} ms")
+        print(f"max |road - manhattan| {err * 1000:.1f} m;  road / straight-line  mean {np.mean(ratio):.2f}  max {np.max(ratio):.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+# 每個 session 的記憶體 benchmark：原本在 session_state 放 DataFrame / dict 副本 vs. 只放目錄列位置
+#
+#   python benchmarks/bench_session_state.py
+
+import os
+import sys
+import time
+import pickle
+import tracemalloc
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from catalog import CatalogIndex, load_catalog_index  # noqa: E402
+
+EXCEL_PATH = os.path.join(os.path.dirname(__file__), "..", "產品碳足跡3.xlsx")
+N_SESSIONS = 200
+
+
+def old_session(cat: CatalogIndex, rng) -> dict:
+    # 對照組：原本 safe_sample / pick_one 的結果（DataFrame 切片 + 每列一個 dict）
+    food = cat.frame("1")
+    dessert = cat.frame("3")
+    return {
+        "meal_items": food.sample(n=3, random_state=int(rng.integers(10_000))).reset_index(drop=True),
+        "cook_picks": {i: cat.row_dict(int(rng.choice(cat.rows("1-2")))) for i in range(3)},
+        "drink_pick": cat.row_dict(int(rng.choice(cat.rows("2")))),
+        "dessert_pool": dessert.sample(n=5, random_state=int(rng.integers(10_000))).reset_index(drop=True),
+        "dessert_pick_names": [],
+        "packaging_pick": [],
+    }
+
+
+def new_session(cat: CatalogIndex, rng) -> dict:
+    return {
+        "meal_rows": tuple(int(r) for r in rng.choice(cat.rows("1"), 3, replace=False)),
+        "cook_rows": {i: int(rng.choice(cat.rows("1-2"))) for i in range(3)},
+        "drink_row": int(rng.choice(cat.rows("2"))),
+        "dessert_pool_rows": tuple(int(r) for r in rng.choice(cat.rows("3"), 5, replace=False)),
+        "dessert_pick_rows": [],
+        "packaging_pick_rows": [],
+    }
+
+
+def retained_bytes(build) -> float:
+    tracemalloc.start()
+    base = tracemalloc.get_traced_memory()[0]
+    sessions = [build() for _ in range(N_SESSIONS)]
+    used = tracemalloc.get_traced_memory()[0] - base
+    tracemalloc.stop()
+    del sessions
+    return used / N_SESSIONS
+
+
+def best_of(fn, repeat=200):
+    best = float("inf")
+    for _ in range(repeat):
+        t = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t)
+    return best
+
+
+def main():
+    cat = load_catalog_index(EXCEL_PATH)
+    for codes in (("1",), ("3",)):
+        cat.frame(*codes)  # 共用切片先建好，不算進 session
+
+    rng = np.random.default_rng(0)
+    old_b = retained_bytes(lambda: old_session(cat, rng))
+    new_b = retained_bytes(lambda: new_session(cat, rng))
+    print(f"per-session memory      old {old_b / 1024:8.1f} KiB   new {new_b / 1024:8.2f} KiB")
+
+    old_s, new_s = old_session(cat, rng), new_session(cat, rng)
+    print(f"pickled session state   old {len(pickle.dumps(old_s)):8d} B     new {len(pickle.dumps(new_s)):8d} B")
+
+    # 每次 rerun 的工作：原本 reset_index + dessert_pool.copy()；現在查欄位陣列
+    def rerun_old():
+        meal_df = old_s["meal_items"].reset_index(drop=True)
+        pool = old_s["dessert_pool"].copy()
+        return meal_df["product_name"].tolist(), pool["product_name"].tolist()
+
+    def rerun_new():
+        return cat.names[list(new_s["meal_rows"])], cat.names[list(new_s["dessert_pool_rows"])]
+
+    print(f"per-rerun resolve       old {best_of(rerun_old) * 1e6:8.1f} us    new {best_of(rerun_new) * 1e6:8.1f} us")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+# 冷啟動 benchmark：新的 process 第一次跑到報到頁 / 主頁時匯入了哪些套件、各花多少時間
+# 以 python -X importtime 記錄（子行程裡用 streamlit AppTest 跑 app）
+#
+#   python benchmarks/bench_startup.py
+#
+# 報到頁若載入了 HOME_FORBIDDEN 裡的套件，以 exit code 1 結束（可直接放進 CI 抓退步）
+
+import os
+import re
+import sys
+import subprocess
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+APP = os.path.join(ROOT, "tomato_egg_app.py")
+
+# 報到頁不該載入的重套件
+HOME_FORBIDDEN = ("pandas", "pyarrow", "altair", "folium", "streamlit_folium", "branca", "requests", "openpyxl")
+WATCH = HOME_FORBIDDEN + ("numpy", "streamlit_geolocation")
+
+_MARK = "#bench-startup:"
+_CHILD = f"""
+import sys, logging
+logging.disable(logging.WARNING)
+from streamlit.testing.v1 import AppTest
+at = AppTest.from_file({APP!r}, default_timeout=120)
+print({_MARK!r} + "home", file=sys.stderr, flush=True)
+at.run()
+assert not at.exception, at.exception
+print({_MARK!r} + "main", file=sys.stderr, flush=True)
+next(b for b in at.button if b.label.startswith("直接開始")).click().run()
+assert not at.exception, at.exception
+print({_MARK!r} + "end", file=sys.stderr, flush=True)
+"""
+_RE_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+
+
+def run_child() -> dict:
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", _CHILD],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+        check=False,
+    )
+    if proc.returncode != 0:
+        sys.exit(proc.stderr[-2000:])
+
+    phases, phase = {}, None
+    for line in proc.stderr.splitlines():
+        if line.startswith(_MARK):
+            phase = line[len(_MARK):]
+            phases[phase] = {}
+            continue
+        m = _RE_LINE.match(line)
+        if m and phase in ("home", "main") and len(m.group(3)) <= 1:
+            # 只記這個階段最上層的匯入（cumulative 已含底下的子模組），依最上層套件名加總
+            pkg = m.group(4).split(".")[0]
+            phases[phase][pkg] = phases[phase].get(pkg, 0) + int(m.group(2))
+    return phases
+
+
+def report(title: str, pkgs: dict) -> None:
+    print(f"{title}: {len(pkgs)} packages, imports {sum(pkgs.values()) / 1000:7.1f} ms")
+    for name in WATCH:
+        if name in pkgs:
+            print(f"    {name:22s} {pkgs[name] / 1000:7.1f} ms")
+
+
+def main():
+    phases = run_child()
+    home, main_ = phases.get("home", {}), phases.get("main", {})
+    report("報到頁（首次載入）", home)
+    report("主頁（直接開始之後）", main_)
+
+    leaked = [n for n in HOME_FORBIDDEN if n in home]
+    if leaked:
+        print(f"❌ 報到頁載入了：{', '.join(leaked)}")
+        sys.exit(1)
+    print("✅ 報到頁沒有載入重套件")
+
+
+if __name__ == "__main__":
+    main()
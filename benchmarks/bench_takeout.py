@@ -0,0 +1,58 @@
+# 帶回距離 benchmark：每次選分店都跑一次最短路（Router，無快取） vs. 事先算好的分店 × 校區距離表
+#
+#   python benchmarks/bench_takeout.py [分店數] [格數]
+#
+# 用 bench_routing 的合成棋盤道路網；順便確認查表結果與 Router 算的一樣。
+
+import os
+import sys
+import time
+import tempfile
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, os.path.dirname(__file__))
+from bench_routing import LAT0, LNG0, STEP, write_grid_osm  # noqa: E402
+from routing import Router, load_road_graph  # noqa: E402
+from takeout import load_takeout_table  # noqa: E402
+
+
+def main():
+    n_branch = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    n = int(sys.argv[2]) if len(sys.argv) > 2 else 120
+    rng = np.random.default_rng(0)
+    span = (n - 1) * STEP
+    lat = LAT0 + rng.random(n_branch) * span
+    lng = LNG0 + rng.random(n_branch) * span
+    campuses = {"A": (LAT0 + span / 2, LNG0 + span / 2), "B": (LAT0 + span / 4, LNG0 + span * 0.8)}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        osm = os.path.join(tmp, "grid.osm")
+        write_grid_osm(osm, n)
+        graph = load_road_graph(osm, cache_dir=tmp)
+
+        t = time.perf_counter()
+        table = load_takeout_table(lat, lng, campuses, graph, cache_dir=tmp)
+        build_s = time.perf_counter() - t
+        t = time.perf_counter()
+        load_takeout_table(lat, lng, campuses, graph, cache_dir=tmp)
+        load_ms = (time.perf_counter() - t) * 1e3
+        print(f"{n_branch} branches x {len(campuses)} campuses x 3 modes   build {build_s:6.2f} s   reload (.npz) {load_ms:6.1f} ms")
+
+        picks = rng.integers(0, n_branch, 200)
+        router = Router(graph)  # 不接快取：每次都實際跑最短路
+        t = time.perf_counter()
+        routed = [router.distance_km("car", lat[i], lng[i], *campuses["A"]) for i in picks]
+        route_ms = (time.perf_counter() - t) / len(picks) * 1e3
+
+        t = time.perf_counter()
+        looked = [table.lookup(int(i), lat[i], lng[i], "A", "car") for i in picks]
+        lookup_us = (time.perf_counter() - t) / len(picks) * 1e6
+
+        err = max(abs(a - b[0]) for a, b in zip(routed, looked) if a is not None)
+        print(f"branch -> campus   route {route_ms:8.2f} ms    table lookup {lookup_us:8.2f} us    max diff {err * 1000:.2f} m")
+
+
+if __name__ == "__main__":
+    main()
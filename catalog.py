@@ -0,0 +1,663 @@
+# catalog.py：產品碳足跡目錄（解析 / 索引 / 快取）
+#
+# 這裡只放「純資料」的邏輯，不呼叫 streamlit，
+# 方便 tomato_egg_app.py 以外的地方（教師分析、離線批次）共用。
+
+from __future__ import annotations
+
+import os
+import re
+import json
+import shutil
+import hashlib
+import threading
+import unicodedata
+import importlib.util
+from io import BytesIO
+from collections import OrderedDict
+
+import numpy as np
+
+from lazy import lazy_module
+
+# pandas 只在解析 Excel / 需要 DataFrame 時才載入（讀二進位快取建索引用不到）
+pd = lazy_module("pandas")
+
+
+# =========================
+# 1) CF 解析：統一成 gCO2e
+#    支援：800.00g、0.8kg、1.00k、"155.00gCO2e"、"1.00kgCO2e"...
+# =========================
+# 單純數字：若 <= 50 當 kg（多數產品 kgCO2e 不會 >50）、否則當 g
+KG_THRESHOLD = 50
+
+# 兩種解析都先做 NFKC（全形數字/單位、CO₂ 的下標 → 半形），之後只認 ASCII 數字：
+# Arrow 的 regex（RE2）\d 只比對 ASCII，逐格版也用 re.ASCII，兩邊結果才會一樣
+_NUM = r"[-+]?[0-9]*\.?[0-9]+"
+_RE_K_SUFFIX = re.compile(rf"{_NUM}k", re.ASCII)
+_RE_NUM_UNIT_END = re.compile(rf"({_NUM})(kg|g)?$", re.ASCII)
+_RE_NUM_UNIT_ANY = re.compile(rf"({_NUM})\s*(kg|g)", re.ASCII)
+_RE_NUM_ANY = re.compile(rf"({_NUM})", re.ASCII)
+
+# 向量化版本：整段字串「數字 + (k|kg|g)?」一次比對（等同 _RE_K_SUFFIX + _RE_NUM_UNIT_END）
+_PAT_FULL = rf"^({_NUM})(kg|k|g)?$"
+_PAT_UNIT_ANY = rf"({_NUM})(kg|g)"
+_PAT_NUM_ANY = rf"({_NUM})"
+
+# 有裝 pyarrow 時字串運算走 Arrow compute（C++ 迴圈）；沒有就用一般 object 字串
+# （只查有沒有安裝，不在這裡 import：pyarrow 很大，用到時 pandas 自己會載入）
+_STR_DTYPE = "string[pyarrow]" if importlib.util.find_spec("pyarrow") is not None else None
+
+
+def parse_cf_to_g(value) -> float:
+    if value is None or (isinstance(value, float) and pd.isna(value)):
+        return float("nan")
+
+    # 數字：預設當作「g」還是「kg」？
+    # 你的資料混用，單純數字很難判斷
+    # 這裡採最保守：若數字 <= 50 當 kg（多數產品 kgCO2e 不會 >50）、否則當 g
+    if isinstance(value, (int, float)):
+        v = float(value)
+        if v <= KG_THRESHOLD:
+            return v * 1000.0
+        return v
+
+    s = unicodedata.normalize("NFKC", str(value)).strip().lower()
+    s = s.replace(" ", "")
+    s = s.replace("kgco2e", "kg").replace("gco2e", "g")
+
+    # 1.00k 代表 1.00kg
+    if _RE_K_SUFFIX.fullmatch(s):
+        kg = float(s[:-1])
+        return kg * 1000.0
+
+    # 末尾單位
+    m = _RE_NUM_UNIT_END.match(s)
+    if m:
+        num = float(m.group(1))
+        unit = m.group(2)
+        if unit == "kg":
+            return num * 1000.0
+        if unit == "g":
+            return num
+        # 沒單位：同上，<=50 當 kg
+        return num * 1000.0 if num <= KG_THRESHOLD else num
+
+    # 字串內含單位（例如：'800.00g(每瓶...)'）
+    m2 = _RE_NUM_UNIT_ANY.search(s)
+    if m2:
+        num = float(m2.group(1))
+        unit = m2.group(2)
+        return num * 1000.0 if unit == "kg" else num
+
+    # 兜底：抓第一個數字
+    m3 = _RE_NUM_ANY.search(s)
+    if m3:
+        num = float(m3.group(1))
+        return num * 1000.0 if num <= KG_THRESHOLD else num
+
+    return float("nan")
+
+
+def g_to_kg(g):
+    return float(g) / 1000.0
+
+
+def _bare_number_to_g(num: np.ndarray) -> np.ndarray:
+    return np.where(num <= KG_THRESHOLD, num * 1000.0, num)
+
+
+def _parse_cf_strings_to_g(s: pd.Series) -> np.ndarray:
+    s = s.str.normalize("NFKC").str.strip()
+    if _STR_DTYPE is not None:
+        s = s.astype(_STR_DTYPE)
+    s = s.str.lower().str.replace(" ", "", regex=False)
+    s = s.str.replace("kgco2e", "kg", regex=False).str.replace("gco2e", "g", regex=False)
+    out = np.full(len(s), np.nan, dtype="float64")
+
+    # 數字 + 末尾單位（含 1.00k）：九成以上的資料長這樣，用 fullmatch + 去尾巴直接轉 float
+    done = s.str.fullmatch(_PAT_FULL).to_numpy(dtype=bool, na_value=False)
+    if done.any():
+        head = s[done]
+        num = head.str.replace(r"(?:kg|k|g)$", "", regex=True).astype("float64").to_numpy()
+        kg_unit = (head.str.endswith("kg") | head.str.endswith("k")).to_numpy(dtype=bool)
+        g_unit = ~kg_unit & head.str.endswith("g").to_numpy(dtype=bool)
+        out[done] = np.where(kg_unit, num * 1000.0, np.where(g_unit, num, _bare_number_to_g(num)))
+
+    # 字串內含單位（例如：'800.00g(每瓶...)'）
+    if not done.all():
+        rest = np.flatnonzero(~done)
+        part = s.iloc[rest].str.extract(_PAT_UNIT_ANY)
+        num = pd.to_numeric(part[0], errors="coerce").to_numpy(dtype="float64", na_value=np.nan)
+        unit = part[1].to_numpy(dtype=object)
+        hit = ~np.isnan(num)
+        out[rest[hit]] = np.where(unit[hit] == "kg", num[hit] * 1000.0, num[hit])
+        done[rest[hit]] = True
+
+    # 兜底：抓第一個數字
+    if not done.all():
+        rest = np.flatnonzero(~done)
+        part = s.iloc[rest].str.extract(_PAT_NUM_ANY)
+        num = pd.to_numeric(part[0], errors="coerce").to_numpy(dtype="float64", na_value=np.nan)
+        hit = ~np.isnan(num)
+        out[rest[hit]] = _bare_number_to_g(num[hit])
+
+    return out
+
+
+def parse_cf_series_to_g(values) -> tuple[np.ndarray, np.ndarray]:
+    """整欄一次解析成 gCO2e，規則與 parse_cf_to_g 相同。
+
+    回傳 (g, unparsed)：g 為 float64 陣列；unparsed 為「有值但解析不出來」的列位置。
+    """
+    col = pd.Series(values).reset_index(drop=True)
+    if len(col) == 0:
+        return np.empty(0, dtype="float64"), np.empty(0, dtype="int64")
+
+    # 整欄都是數字（Excel 欄位為數值格式）：直接套 <=50 規則
+    if pd.api.types.is_numeric_dtype(col.dtype):
+        num = col.to_numpy(dtype="float64", na_value=np.nan)
+        return _bare_number_to_g(num), np.empty(0, dtype="int64")
+
+    # 同一份目錄裡 "1.00kg"、"500.00g" 這類值大量重複：只解析不重複的值，再用代碼貼回
+    # 空白格的代碼是 -1，剛好對到最後補上的 NaN
+    codes, uniq = pd.factorize(col)
+    uniq_g = np.append(_parse_cf_cells_to_g(pd.Series(uniq, dtype=object)), np.nan)
+    out = uniq_g[codes]
+    unparsed = np.flatnonzero((codes >= 0) & np.isnan(out))
+    return out, unparsed
+
+
+def _parse_cf_cells_to_g(cells: pd.Series) -> np.ndarray:
+    out = np.full(len(cells), np.nan, dtype="float64")
+    # cells 是不重複值，逐個判斷型別很便宜；整段都是數字時 .str 會直接報錯，先把非字串遮掉
+    is_str = np.array([isinstance(v, str) for v in cells], dtype=bool)
+    as_str = cells.where(is_str).str.strip()
+
+    # 非字串的儲存格：能轉數字就走數字規則；其餘（例如日期）比照原本 str(value) 處理
+    other = np.flatnonzero(~is_str)
+    if len(other):
+        num = pd.to_numeric(cells.iloc[other], errors="coerce").to_numpy(dtype="float64", na_value=np.nan)
+        ok = ~np.isnan(num)
+        out[other[ok]] = _bare_number_to_g(num[ok])
+        fallback = other[~ok]
+        if len(fallback):
+            as_str.iloc[fallback] = cells.iloc[fallback].astype(str).str.strip()
+            is_str[fallback] = True
+
+    if is_str.any():
+        out[is_str] = _parse_cf_strings_to_g(as_str[is_str])
+    return out
+
+
+def check_cf_parser_compat(values) -> pd.DataFrame:
+    """拿舊的逐格 parse_cf_to_g 對照向量化結果；回傳不一致的列（空表 = 完全相容）。"""
+    col = pd.Series(values).reset_index(drop=True)
+    fast, _ = parse_cf_series_to_g(col)
+    slow = np.array([parse_cf_to_g(v) for v in col.astype(object)], dtype="float64")
+    same = np.isclose(fast, slow, rtol=1e-12, atol=0.0, equal_nan=True)
+    bad = np.flatnonzero(~same)
+    return pd.DataFrame({"row": bad, "value": col.iloc[bad].to_numpy(), "scalar_g": slow[bad], "vector_g": fast[bad]})
+
+
+# =========================
+# 2) CatalogIndex：每個目錄版本只建一次的唯讀索引
+#    code → 列位置、連續的 cf 陣列、類別代碼；分類切片/抽樣都只是查表
+#    欄位全是唯讀 NumPy 陣列（品名/單位為固定寬度 <U..）；
+#    從二進位快取建立時直接用 memory-map 的陣列，不另外複製
+# =========================
+def _readonly(a: np.ndarray) -> np.ndarray:
+    a.setflags(write=False)
+    return a
+
+
+def _column(values, dtype=None) -> np.ndarray:
+    # memmap / 已是正確型別的陣列：只取 ndarray 視圖（不複製）；其他（pandas 欄位）才轉型
+    a = np.asarray(values, dtype=dtype)
+    if dtype is None and a.dtype.kind != "U":
+        a = a.astype(str)
+    return _readonly(np.ascontiguousarray(a))
+
+
+_NO_ROWS = _readonly(np.empty(0, dtype=np.int64))
+
+
+class CatalogIndex:
+    """整份目錄的唯讀索引（跨 session 共用，請勿修改內容）。
+
+    data 可以是 DataFrame，或 {欄名: 陣列}（例如二進位快取 memory-map 出來的欄位）。
+    """
+
+    __slots__ = (
+        "version", "unparsed", "code_labels", "code_ids", "cf_kg", "cf_g", "names", "units",
+        "rows_by_code", "_data", "_df", "_frames",
+    )
+
+    def __init__(self, data, version: str = "", unparsed=None):
+        self.version = version
+        if unparsed is None:
+            unparsed = getattr(data, "attrs", {}).get("cf_unparsed", [])
+        # 解析不出來、已略過的列（{"excel_row", "value"}）
+        self.unparsed = tuple(unparsed)
+        self._data = data
+        self._df = None if isinstance(data, dict) else data
+
+        code = _column(data["code"])
+        labels, ids = np.unique(code, return_inverse=True)
+        self.code_labels = tuple(str(c) for c in labels)
+        self.code_ids = _readonly(ids.astype(np.int16))
+        self.cf_kg = _column(data["cf_kgco2e"], dtype="float64")
+        self.cf_g = _column(data["cf_gco2e"], dtype="float64")
+        self.names = _column(data["product_name"])
+        self.units = _column(data["declared_unit"])
+
+        # 依類別代碼穩定排序後切段：每個 code 的列位置維持原本 Excel 順序
+        order = np.argsort(self.code_ids, kind="stable")
+        bounds = np.searchsorted(self.code_ids[order], np.arange(len(self.code_labels) + 1))
+        self.rows_by_code = {
+            label: _readonly(order[bounds[i] : bounds[i + 1]].astype(np.int64))
+            for i, label in enumerate(self.code_labels)
+        }
+        self._frames = {}
+
+    def __len__(self) -> int:
+        return len(self.cf_kg)
+
+    @property
+    def df(self) -> pd.DataFrame:
+        # 只有需要 DataFrame 的地方（下載、除錯）才建；app 的每次 rerun 只用上面的陣列
+        if self._df is None:
+            df = pd.DataFrame({c: np.asarray(self._data[c]) for c in self._data})
+            df.attrs["cf_unparsed"] = list(self.unparsed)
+            df.attrs["catalog_version"] = self.version
+            self._df = df
+        return self._df
+
+    def rows(self, *codes: str) -> np.ndarray:
+        if len(codes) == 1:
+            return self.rows_by_code.get(codes[0], _NO_ROWS)
+        parts = [self.rows_by_code[c] for c in codes if c in self.rows_by_code]
+        return _readonly(np.sort(np.concatenate(parts))) if parts else _NO_ROWS
+
+    def count(self, *codes: str) -> int:
+        return sum(len(self.rows_by_code.get(c, _NO_ROWS)) for c in codes)
+
+    def frame(self, *codes: str) -> pd.DataFrame:
+        # 每組 code 只切一次，之後每次 rerun 都拿同一個 DataFrame（唯讀）
+        sub = self._frames.get(codes)
+        if sub is None:
+            sub = self.df.iloc[self.rows(*codes)]
+            self._frames[codes] = sub
+        return sub
+
+    def code_of(self, i: int) -> str:
+        return self.code_labels[self.code_ids[i]]
+
+    def row_dict(self, i: int) -> dict:
+        return {
+            "row": int(i),
+            "code": self.code_labels[self.code_ids[i]],
+            "product_name": str(self.names[i]),
+            "cf_gco2e": float(self.cf_g[i]),
+            "cf_kgco2e": float(self.cf_kg[i]),
+            "declared_unit": str(self.units[i]),
+        }
+
+
+# =========================
+# 3) 讀 Excel（前 4 欄：編號/品名/碳足跡/宣告單位）
+#    -> 統一生成 cf_gco2e / cf_kgco2e
+#    openpyxl read_only 逐列串流，只取前 4 欄；每 CATALOG_CHUNK_ROWS 列轉成一段型別陣列，
+#    不論 Excel 有多少欄、多少工作表，記憶體只跟「這 4 欄」的大小有關
+# =========================
+CATALOG_COLUMNS = ["code", "product_name", "product_carbon_footprint_data", "declared_unit"]
+CATALOG_CHUNK_ROWS = 4096
+_HASH_BLOCK = 1 << 20
+_RE_FLOAT_INT = re.compile(r"\.0$")
+
+
+class CatalogColumns(dict):
+    """{欄名: NumPy 陣列}，另附 attrs（cf_unparsed / catalog_version），用法同 DataFrame 的 df[c] / df.attrs。"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.attrs = {}
+
+
+def catalog_version_of(source) -> str:
+    """內容雜湊：bytes / 路徑 / 檔案物件都可以（後兩者分塊讀，不整份讀進記憶體）。"""
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return hashlib.sha1(source).hexdigest()[:12]
+    h = hashlib.sha1()
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, "rb") as f:
+            for block in iter(lambda: f.read(_HASH_BLOCK), b""):
+                h.update(block)
+    else:
+        source.seek(0)
+        for block in iter(lambda: source.read(_HASH_BLOCK), b""):
+            h.update(block)
+        source.seek(0)
+    return h.hexdigest()[:12]
+
+
+def _cell_text(v) -> str:
+    # 與 pandas astype(str).str.strip() 相同：空白格為 "nan"、整數值的浮點數去掉 ".0"
+    if v is None:
+        return "nan"
+    return str(v).strip()
+
+
+def _chunk_arrays(rows: list, excel_rows: list, has_unit: bool, header_unit):
+    code = np.array([_RE_FLOAT_INT.sub("", _cell_text(r[0])) for r in rows], dtype=str)
+    name = np.array([_cell_text(r[1]) for r in rows], dtype=str)
+    unit = np.array([_cell_text(r[3]) if has_unit else "" for r in rows], dtype=str)
+    raw_cells = [r[2] for r in rows]
+    raw = np.array([str(v) if v is not None else "nan" for v in raw_cells], dtype=str)
+
+    # 整段一次解析（pandas 字串運算 + NumPy），不逐格呼叫 parse_cf_to_g
+    cf_g, unparsed = parse_cf_series_to_g(pd.Series(raw_cells, dtype=object))
+    if header_unit == "kg":
+        # 碳足跡欄標題寫明 kg（例如「碳足跡(kg)」）：純數字（含文字格式的 "1.00"）一律當 kg，不套 <=50 規則
+        kg = pd.to_numeric(pd.Series(raw_cells, dtype=object), errors="coerce").to_numpy(dtype="float64", na_value=np.nan)
+        num = ~np.isnan(kg)
+        cf_g[num] = kg[num] * 1000.0
+        unparsed = unparsed[~num[unparsed]]
+    bad = [{"excel_row": excel_rows[i], "value": raw[i]} for i in unparsed]
+
+    keep = ~np.isnan(cf_g)
+    return (code[keep], name[keep], raw[keep], unit[keep], cf_g[keep]), bad
+
+
+def read_catalog_columns(source, chunk_rows: int = CATALOG_CHUNK_ROWS) -> CatalogColumns:
+    """串流讀第一個工作表的前 4 欄（source 可為路徑或檔案物件）。
+
+    解析不出碳足跡的列會被丟掉，記在 attrs["cf_unparsed"]。
+    """
+    from openpyxl import load_workbook
+
+    wb = load_workbook(source, read_only=True, data_only=True)
+    try:
+        ws = wb.worksheets[0]
+        # 有些匯出檔記錄的範圍（dimension）不對，重新掃描才不會少讀欄/列
+        ws.reset_dimensions()
+        it = ws.iter_rows(max_col=4, values_only=True)
+        header = list(next(it, ()))
+        while header and header[-1] is None:
+            header.pop()
+
+        if header and str(header[0]).strip() == "product_name":
+            # 環境部原始匯出（例如 產品碳足跡2.xlsx）：第一欄就是品名，沒有類別編號
+            raise ValueError("Excel 第一欄應為類別編號（1、1-1、2…），這份檔案沒有編號欄。")
+        if len(header) < 3:
+            raise ValueError("Excel 欄位太少：至少 3 欄（編號、品名、碳足跡；宣告單位可省略）。")
+        # 只有 3 欄的精簡格式（例如 產品碳足跡4.xlsx）：編號 / 品名 / 碳足跡，沒有宣告單位
+        has_unit = len(header) >= 4
+        header_unit = "kg" if "kg" in str(header[2]).lower() else None
+
+        parts, bad_rows = [], []
+        rows, excel_rows = [], []
+        for excel_row, r in enumerate(it, start=2):
+            if r is None or all(v is None for v in r):
+                continue
+            r = tuple(r) + (None,) * (4 - len(r))
+            rows.append(r)
+            excel_rows.append(excel_row)
+            if len(rows) >= chunk_rows:
+                arrays, bad = _chunk_arrays(rows, excel_rows, has_unit, header_unit)
+                parts.append(arrays)
+                bad_rows.extend(bad)
+                rows, excel_rows = [], []
+        if rows or not parts:
+            arrays, bad = _chunk_arrays(rows, excel_rows, has_unit, header_unit)
+            parts.append(arrays)
+            bad_rows.extend(bad)
+    finally:
+        wb.close()
+
+    code, name, raw, unit, cf_g = (np.concatenate(col) for col in zip(*parts))
+    cols = CatalogColumns(
+        code=code,
+        product_name=name,
+        product_carbon_footprint_data=raw,
+        declared_unit=unit,
+        cf_gco2e=cf_g,
+        # cf_kgco2e 方便計算
+        cf_kgco2e=cf_g / 1000.0,
+    )
+    # 解析不出來的列（已被丟掉）：excel_row 為 Excel 上看到的列號（含標題列）
+    cols.attrs["cf_unparsed"] = bad_rows
+    return cols
+
+
+def columns_from_excel_bytes(file_bytes: bytes) -> CatalogColumns:
+    cols = read_catalog_columns(BytesIO(file_bytes))
+    # 目錄版本：同一份檔案內容 → 同一個版本（CatalogIndex 以此為快取 key）
+    cols.attrs["catalog_version"] = catalog_version_of(file_bytes)
+    return cols
+
+
+def frame_from_excel_bytes(file_bytes: bytes) -> pd.DataFrame:
+    cols = columns_from_excel_bytes(file_bytes)
+    df = pd.DataFrame(dict(cols))
+    df.attrs.update(cols.attrs)
+    return df
+
+
+# =========================
+# 4) 目錄二進位快取（.npy 欄位檔，可 memory-map）
+#    xlsx 只在內容變了才重新用 openpyxl 解析；
+#    同一個 process 內，檔案 size/mtime 沒變就直接回傳登錄表（CATALOGS）中的同一份目錄
+# =========================
+CATALOG_CACHE_DIR = ".catalog_cache"
+_ARTIFACT_FORMAT = 3  # 解析規則改了就加 1，舊的快取自動作廢
+_TEXT_COLUMNS = ("code", "product_name", "product_carbon_footprint_data", "declared_unit")
+_NUM_COLUMNS = ("cf_gco2e", "cf_kgco2e")
+
+_LOADED = {}  # abspath -> ((size, mtime_ns), catalog_version)
+_LOAD_LOCK = threading.Lock()
+
+
+def _write_json_atomic(path: str, obj) -> None:
+    tmp = f"{path}.tmp-{os.getpid()}-{threading.get_ident()}"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(obj, f, ensure_ascii=False)
+    os.replace(tmp, path)
+
+
+def _read_manifest(cache_dir: str) -> dict:
+    try:
+        with open(os.path.join(cache_dir, "manifest.json"), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def write_catalog_artifact(df, art_dir: str) -> None:
+    # df：DataFrame 或 CatalogColumns
+    # 先寫到暫存資料夾再整個 rename，其他 process 不會讀到寫一半的檔案
+    tmp = f"{art_dir}.tmp-{os.getpid()}-{threading.get_ident()}"
+    os.makedirs(tmp, exist_ok=True)
+    try:
+        for c in _TEXT_COLUMNS:
+            # 固定寬度 unicode（<U..），才能 memory-map
+            np.save(os.path.join(tmp, f"{c}.npy"), np.asarray(df[c]).astype(str))
+        for c in _NUM_COLUMNS:
+            np.save(os.path.join(tmp, f"{c}.npy"), np.asarray(df[c], dtype="float64"))
+        meta = {
+            "format": _ARTIFACT_FORMAT,
+            "rows": int(len(df["cf_gco2e"])),
+            "catalog_version": df.attrs.get("catalog_version", ""),
+            "cf_unparsed": df.attrs.get("cf_unparsed", []),
+        }
+        _write_json_atomic(os.path.join(tmp, "meta.json"), meta)
+        os.replace(tmp, art_dir)
+    except OSError:
+        # 另一個 process 已經搶先寫好同一份（或磁碟不可寫）：用現成的即可
+        shutil.rmtree(tmp, ignore_errors=True)
+        if not os.path.isdir(art_dir):
+            raise
+
+
+def _read_artifact_columns(art_dir: str):
+    # 回傳 ({欄名: 唯讀 memmap}, meta)；檔案缺漏 / 格式不符 → None
+    try:
+        with open(os.path.join(art_dir, "meta.json"), encoding="utf-8") as f:
+            meta = json.load(f)
+        if meta.get("format") != _ARTIFACT_FORMAT:
+            return None
+        cols = {c: np.load(os.path.join(art_dir, f"{c}.npy"), mmap_mode="r") for c in _TEXT_COLUMNS + _NUM_COLUMNS}
+    except (OSError, ValueError):
+        return None
+    if any(len(a) != meta["rows"] for a in cols.values()):
+        return None
+    return cols, meta
+
+
+def read_catalog_artifact(art_dir: str):
+    got = _read_artifact_columns(art_dir)
+    if got is None:
+        return None
+    cols, meta = got
+    df = pd.DataFrame({c: cols[c] for c in _TEXT_COLUMNS + _NUM_COLUMNS}, copy=False)
+    df.attrs["cf_unparsed"] = meta.get("cf_unparsed", [])
+    df.attrs["catalog_version"] = meta.get("catalog_version", "")
+    return df
+
+
+def load_catalog_index(path: str, cache_dir: str = CATALOG_CACHE_DIR) -> CatalogIndex:
+    """讀目錄並登錄到 CATALOGS：process 內快取 → 二進位快取 → 最後才用 openpyxl 解析 xlsx。
+
+    回傳的 CatalogIndex 為所有 session 共用的同一個物件（欄位唯讀）。
+    """
+    apath = os.path.abspath(path)
+    st_ = os.stat(apath)
+    stat_key = (st_.st_size, st_.st_mtime_ns)
+
+    hit = _LOADED.get(apath)
+    if hit is not None and hit[0] == stat_key:
+        cat = CATALOGS.get(hit[1])
+        if cat is not None:
+            return cat
+
+    with _LOAD_LOCK:
+        hit = _LOADED.get(apath)
+        if hit is not None and hit[0] == stat_key:
+            cat = CATALOGS.get(hit[1])
+            if cat is not None:
+                return cat
+
+        # 清單記錄 (path, size, mtime) → 內容雜湊；stat 沒變就不必讀檔算 hash
+        manifest = _read_manifest(cache_dir)
+        entry = manifest.get(apath) or {}
+        if (entry.get("size"), entry.get("mtime_ns")) == stat_key and entry.get("sha1"):
+            sha1 = entry["sha1"]
+        else:
+            h = hashlib.sha1()
+            with open(apath, "rb") as f:
+                for block in iter(lambda: f.read(_HASH_BLOCK), b""):
+                    h.update(block)
+            sha1 = h.hexdigest()
+
+        art_dir = os.path.join(cache_dir, sha1[:16])
+        version = sha1[:12]  # 同 catalog_version_of
+
+        def build() -> CatalogIndex:
+            got = _read_artifact_columns(art_dir)
+            if got is None:
+                # 直接從檔案串流讀，不先整份讀成 bytes
+                df = read_catalog_columns(apath)
+                df.attrs["catalog_version"] = version
+                try:
+                    os.makedirs(cache_dir, exist_ok=True)
+                    write_catalog_artifact(df, art_dir)
+                except OSError:
+                    # 唯讀部署環境：只留在記憶體
+                    return CatalogIndex(df, version=version)
+                got = _read_artifact_columns(art_dir)
+                if got is None:
+                    return CatalogIndex(df, version=version)
+            # 直接用 memory-map 的欄位：資料在 OS page cache，多個 process 也只有一份
+            cols, meta = got
+            return CatalogIndex(cols, version=version, unparsed=meta.get("cf_unparsed", []))
+
+        cat = CATALOGS.get_or_build(version, build)
+
+        new_entry = {"size": stat_key[0], "mtime_ns": stat_key[1], "sha1": sha1}
+        if entry != new_entry:
+            manifest[apath] = new_entry
+            try:
+                os.makedirs(cache_dir, exist_ok=True)
+                _write_json_atomic(os.path.join(cache_dir, "manifest.json"), manifest)
+            except OSError:
+                pass
+
+        _LOADED[apath] = (stat_key, version)
+        return cat
+
+
+def load_catalog(path: str, cache_dir: str = CATALOG_CACHE_DIR) -> pd.DataFrame:
+    """同 load_catalog_index，但回傳 DataFrame（共用物件，請勿就地修改）。"""
+    return load_catalog_index(path, cache_dir).df
+
+
+def catalog_from_file(f) -> CatalogIndex:
+    """上傳的檔案（檔案物件）：同一份內容（同版本）在整個 process 只解析、保存一次。"""
+    version = catalog_version_of(f)
+    return CATALOGS.get_or_build(version, lambda: CatalogIndex(read_catalog_columns(f), version=version))
+
+
+# =========================
+# 5) 跨 session 共用的目錄登錄表
+#    catalog_version → CatalogIndex；同一版本在整個 process 只有一份
+#    Excel 換了內容 → 新版本另外登錄；最多留 max_versions 個，最久沒用的先移除
+# =========================
+class CatalogRegistry:
+    """以目錄版本為 key 的共用 CatalogIndex（執行緒安全；同一版本同時只會建一次）。"""
+
+    def __init__(self, max_versions: int = 4):
+        self.max_versions = max_versions
+        self._items = OrderedDict()  # version -> CatalogIndex（最近用過的在後面）
+        self._building = {}          # version -> Lock
+        self._lock = threading.Lock()
+
+    def get(self, version: str):
+        with self._lock:
+            cat = self._items.get(version)
+            if cat is not None:
+                self._items.move_to_end(version)
+            return cat
+
+    def get_or_build(self, version: str, build) -> CatalogIndex:
+        cat = self.get(version)
+        if cat is not None:
+            return cat
+        with self._lock:
+            lock = self._building.setdefault(version, threading.Lock())
+        with lock:
+            # 等鎖期間別的執行緒可能已經建好
+            cat = self.get(version)
+            if cat is None:
+                cat = self.put(build())
+            with self._lock:
+                self._building.pop(version, None)
+            return cat
+
+    def put(self, cat: CatalogIndex) -> CatalogIndex:
+        with self._lock:
+            self._items[cat.version] = cat
+            self._items.move_to_end(cat.version)
+            while len(self._items) > self.max_versions:
+                self._items.popitem(last=False)
+        return cat
+
+    def drop(self, version: str) -> None:
+        with self._lock:
+            self._items.pop(version, None)
+
+    def versions(self) -> list:
+        with self._lock:
+            return list(self._items)
+
+
+CATALOGS = CatalogRegistry()
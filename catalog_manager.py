@@ -0,0 +1,225 @@
+# catalog_manager.py：監看資料夾裡的各版產品碳足跡 Excel，背景更新共用目錄
+#
+# 不呼叫 streamlit。背景執行緒每隔幾秒 stat 一次資料夾，只有 size/mtime 變了的檔案
+# 才交給 load_catalog_index 解析（內容沒變會直接用二進位快取）；
+# 使用中的目錄（current）解析好、算完和舊版的逐列差異後才一次換掉，
+# rerun 只讀 current，不會卡在 openpyxl 上。解析失敗的檔案只記錄錯誤，繼續用舊版。
+
+import os
+import re
+import glob
+import threading
+
+import numpy as np
+
+from catalog import CATALOG_CACHE_DIR, CatalogIndex, load_catalog_index
+from footprint import NO_ROW
+
+CATALOG_GLOB = "產品碳足跡*.xlsx"
+MAX_ROW_MAPS = 16  # 最多記住幾個舊版本 → 目前版本的列對照
+
+
+# =========================
+# 1) 兩個目錄版本的逐列差異
+#    以 (code, 品名) 對應；同名重複出現時依出現順序一對一配對
+# =========================
+class CatalogDiff:
+    """old → new 的逐列差異；row_map[舊列] = 新列（對不到為 NO_ROW）。"""
+
+    __slots__ = ("old_version", "new_version", "row_map", "added", "removed", "changed")
+
+    def __init__(self, old_version, new_version, row_map, added, removed, changed):
+        self.old_version = old_version
+        self.new_version = new_version
+        self.row_map = row_map    # (len(old),) int64，唯讀
+        self.added = added        # 新版多出來的列
+        self.removed = removed    # 舊版被刪掉的列
+        self.changed = changed    # 對得到但 cf / 宣告單位不同的 (舊列, 新列)
+
+    def summary(self) -> dict:
+        return {"added": len(self.added), "removed": len(self.removed), "changed": len(self.changed)}
+
+
+def diff_catalogs(old: CatalogIndex, new: CatalogIndex) -> CatalogDiff:
+    by_key = {}
+    for j in range(len(new)):
+        by_key.setdefault((new.code_of(j), str(new.names[j])), []).append(j)
+    for rows in by_key.values():
+        rows.reverse()  # 之後 pop() 由前往後取
+
+    row_map = np.full(len(old), NO_ROW, dtype=np.int64)
+    changed = []
+    for i in range(len(old)):
+        rows = by_key.get((old.code_of(i), str(old.names[i])))
+        if not rows:
+            continue
+        j = rows.pop()
+        row_map[i] = j
+        if not np.isclose(old.cf_g[i], new.cf_g[j]) or old.units[i] != new.units[j]:
+            changed.append((i, j))
+    row_map.setflags(write=False)
+
+    matched = np.zeros(len(new), dtype=bool)
+    matched[row_map[row_map >= 0]] = True
+    return CatalogDiff(
+        old.version,
+        new.version,
+        row_map,
+        added=np.flatnonzero(~matched).tolist(),
+        removed=np.flatnonzero(row_map < 0).tolist(),
+        changed=changed,
+    )
+
+
+def remap_rows(row_map, rows) -> list:
+    """舊版本的列位置 → 新版本的列位置；對不到的列直接去掉（row_map 為 None 時全部對不到）。"""
+    if row_map is None or not len(rows):
+        return []
+    return [int(r) for r in row_map[list(rows)] if r >= 0]
+
+
+# =========================
+# 2) CatalogManager：監看 + 背景解析 + 原子切換
+# =========================
+def _natural_key(path: str):
+    # 產品碳足跡10.xlsx 排在 產品碳足跡9.xlsx 後面
+    return [int(t) if t.isdigit() else t for t in re.split(r"(\d+)", os.path.basename(path))]
+
+
+class CatalogManager:
+    def __init__(
+        self,
+        directory: str = ".",
+        active: str = None,
+        pattern: str = CATALOG_GLOB,
+        cache_dir: str = CATALOG_CACHE_DIR,
+        poll_seconds: float = 5.0,
+    ):
+        self.directory = directory
+        self.pattern = pattern
+        self.cache_dir = cache_dir
+        self.poll_seconds = poll_seconds
+        # 使用中的檔名；None = 資料夾裡編號最大、可以解析的那一份
+        self.active = os.path.basename(active) if active else None
+        self.last_diff = None     # 最近一次切換的 CatalogDiff
+        self._current = None      # 使用中的 CatalogIndex（整個物件一次換掉）
+        self._files = {}          # 檔名 -> {"stat", "catalog", "error"}
+        self._row_maps = {}       # 舊版本 -> 對到目前版本的列位置陣列
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._thread = None
+
+    @property
+    def current(self):
+        return self._current
+
+    def workbooks(self) -> list:
+        """資料夾裡的各份 Excel：[{"name", "version", "rows", "error", "active"}]。"""
+        cur = self._current
+        out = []
+        for name, f in sorted(self._files.items(), key=lambda kv: _natural_key(kv[0])):
+            cat = f["catalog"]
+            out.append(
+                {
+                    "name": name,
+                    "version": cat.version if cat is not None else None,
+                    "rows": len(cat) if cat is not None else 0,
+                    "error": f["error"],
+                    "active": cat is not None and cur is not None and cat.version == cur.version,
+                }
+            )
+        return out
+
+    def use(self, name: str) -> None:
+        """改用另一份 Excel（下一輪背景掃描時切換；已解析過的話立即切換）。"""
+        self.active = os.path.basename(name)
+        self.refresh()
+
+    def row_map(self, version: str):
+        """version 的列位置 → 目前版本的列位置（對不到為 NO_ROW）；不認識的版本回傳 None。"""
+        cur = self._current
+        if cur is not None and version == cur.version:
+            return None
+        return self._row_maps.get(version)
+
+    def refresh(self, only: str = None) -> None:
+        """掃一次資料夾：解析有變動的檔案，必要時切換 current（only：只看這一份）。"""
+        with self._lock:
+            paths = glob.glob(os.path.join(self.directory, self.pattern))
+            names = {os.path.basename(p): p for p in paths if not os.path.basename(p).startswith("~$")}
+            if only is not None:
+                names = {only: names[only]} if only in names else {}
+            else:
+                for name in list(self._files):
+                    if name not in names:
+                        del self._files[name]
+
+            for name, path in names.items():
+                try:
+                    st_ = os.stat(path)
+                except OSError:
+                    continue
+                stat_key = (st_.st_size, st_.st_mtime_ns)
+                f = self._files.get(name)
+                if f is not None and f["stat"] == stat_key:
+                    continue
+                try:
+                    cat, err = load_catalog_index(path, self.cache_dir), None
+                except Exception as e:
+                    # 壞檔 / 格式不符：記錄下來，舊的那份（如果有）繼續用
+                    cat, err = (f["catalog"] if f else None), str(e)
+                self._files[name] = {"stat": stat_key, "catalog": cat, "error": err}
+
+            target = self._pick_target()
+            if target is not None and (self._current is None or target.version != self._current.version):
+                self._swap(target)
+
+    def _pick_target(self):
+        if self.active is not None:
+            f = self._files.get(self.active)
+            return f["catalog"] if f else None
+        for name in sorted(self._files, key=_natural_key, reverse=True):
+            if self._files[name]["catalog"] is not None:
+                return self._files[name]["catalog"]
+        return None
+
+    def _swap(self, new: CatalogIndex) -> None:
+        old = self._current
+        if old is not None:
+            diff = diff_catalogs(old, new)
+            # 之前的舊版本先經過原本的對照，再接上這次的對照
+            maps = {}
+            for v, m in self._row_maps.items():
+                if v != new.version:
+                    maps[v] = np.where(m >= 0, diff.row_map[np.maximum(m, 0)], NO_ROW)
+            maps[old.version] = diff.row_map
+            while len(maps) > MAX_ROW_MAPS:
+                maps.pop(next(iter(maps)))
+            for m in maps.values():
+                m.setflags(write=False)
+            self._row_maps = maps
+            self.last_diff = diff
+        self._current = new
+
+    def start(self) -> "CatalogManager":
+        # 第一次只同步讀使用中的那一份（有二進位快取就很快），其餘檔案交給背景執行緒
+        if self._current is None:
+            self.refresh(only=self.active)
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name="catalog-watch", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._wake.set()
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                self.refresh()
+            except Exception:
+                pass  # 資料夾暫時讀不到等：下一輪再試
+            self._wake.wait(timeout=self.poll_seconds)
+            self._wake.clear()
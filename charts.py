@@ -0,0 +1,76 @@
+# charts.py：碳足跡長條圖 / 圓餅圖的 Vega-Lite spec（依各類別數值快取）
+#
+# 不呼叫 streamlit。spec 直接寫成 Vega-Lite dict（與原本 Altair 的寫法相同），
+# 資料以 values 內嵌在 layer 裡：st.vega_lite_chart 不必建 DataFrame、不必轉 Arrow。
+# 各類別數值四捨五入到畫面顯示的位數後當 key，數字沒變就直接拿同一份 spec
+# （點地圖等不相關的操作不會重建圖表，前端收到一模一樣的 spec 也不會重畫）。
+
+from functools import lru_cache
+
+CHART_DECIMALS = 3  # 與畫面上 kgCO₂e 的顯示位數相同
+
+_TOOLTIP = [
+    {"field": "cat", "type": "nominal"},
+    {"field": "kgCO2e", "type": "quantitative", "format": ".3f"},
+    {"field": "pct", "type": "quantitative", "format": ".0%"},
+]
+
+
+def chart_key(totals) -> tuple:
+    """[(類別, kgCO2e), ...] → 快取 key：只留 > 0 的類別，數值四捨五入。"""
+    key = tuple((cat, round(float(v), CHART_DECIMALS)) for cat, v in totals)
+    key = tuple((cat, v) for cat, v in key if v > 0)
+    return key or (("Food", 0.0),)
+
+
+def _values(key: tuple) -> list:
+    # pct 只用來顯示到整數 %，留 4 位小數就夠，spec 也比較短
+    denom = sum(v for _, v in key) or 1.0
+    return [{"cat": cat, "kgCO2e": v, "pct": round(v / denom, 4), "pct_label": f"{round(v / denom * 100)}%"} for cat, v in key]
+
+
+@lru_cache(maxsize=1024)
+def bar_spec(key: tuple, height: int) -> dict:
+    """長條圖（回傳的 dict 為共用物件，請勿修改）。"""
+    return {
+        "height": height,
+        "layer": [
+            {
+                "data": {"values": _values(key)},
+                "mark": {"type": "bar"},
+                "encoding": {
+                    "y": {"field": "cat", "type": "nominal", "sort": "-x", "title": ""},
+                    "x": {"field": "kgCO2e", "type": "quantitative", "title": "kgCO₂e"},
+                    "tooltip": _TOOLTIP,
+                },
+            }
+        ],
+    }
+
+
+@lru_cache(maxsize=1024)
+def pie_spec(key: tuple, height: int, label_radius: int) -> dict:
+    """圓餅圖 + 百分比標籤（回傳的 dict 為共用物件，請勿修改）。"""
+    data = {"values": _values(key)}
+    return {
+        "height": height,
+        "layer": [
+            {
+                "data": data,
+                "mark": {"type": "arc"},
+                "encoding": {
+                    "theta": {"field": "kgCO2e", "type": "quantitative"},
+                    "color": {"field": "cat", "type": "nominal", "legend": {"orient": "right", "title": "Category"}},
+                    "tooltip": _TOOLTIP,
+                },
+            },
+            {
+                "data": data,
+                "mark": {"type": "text", "radius": label_radius},
+                "encoding": {
+                    "theta": {"field": "kgCO2e", "type": "quantitative"},
+                    "text": {"field": "pct_label", "type": "nominal"},
+                },
+            },
+        ],
+    }
@@ -0,0 +1,128 @@
+# footprint.py：一餐的碳足跡計算（第一、二階段共用）
+#
+# 不呼叫 streamlit。一餐只用「目錄列位置 + 距離」描述，
+# 單筆（畫面上的結果）與批次（一次算上千、上萬餐）走同一段向量化程式。
+
+import numpy as np
+
+from catalog import CatalogIndex
+
+CATEGORIES = ("Food", "Cooking", "Drink", "Transport", "Dessert", "Packaging", "Takeout")
+NO_ROW = -1  # 沒有這一項（例如不喝飲料）；批次時也拿來補齊長度不一的列
+
+
+class Meal:
+    """一餐的內容：目錄列位置（CatalogIndex 的列）+ 交通里程（km）+ 排放係數（kgCO2e/km）。"""
+
+    __slots__ = ("food", "cooking", "drink", "dessert", "packaging", "transport_km", "takeout_km", "ef")
+
+    def __init__(
+        self,
+        food=(),
+        cooking=(),
+        drink: int = NO_ROW,
+        dessert=(),
+        packaging=(),
+        transport_km: float = 0.0,
+        takeout_km: float = 0.0,
+        ef: float = 0.0,
+    ):
+        self.food = tuple(food)
+        self.cooking = tuple(cooking)
+        self.drink = drink
+        self.dessert = tuple(dessert)
+        self.packaging = tuple(packaging)
+        self.transport_km = transport_km  # 已含來回
+        self.takeout_km = takeout_km      # 分店 → 學校（單程）
+        self.ef = ef
+
+
+class Breakdown:
+    """各類別碳足跡（kgCO2e）。"""
+
+    __slots__ = ("food", "cooking", "drink", "transport", "dessert", "packaging", "takeout")
+
+    def __init__(self, food, cooking, drink, transport, dessert, packaging, takeout):
+        self.food = float(food)
+        self.cooking = float(cooking)
+        self.drink = float(drink)
+        self.transport = float(transport)
+        self.dessert = float(dessert)
+        self.packaging = float(packaging)
+        self.takeout = float(takeout)
+
+    @property
+    def stage1_total(self) -> float:
+        return self.food + self.cooking + self.drink + self.transport
+
+    @property
+    def total(self) -> float:
+        return self.stage1_total + self.dessert + self.packaging + self.takeout
+
+    def as_dict(self) -> dict:
+        return dict(zip(CATEGORIES, (getattr(self, k) for k in self.__slots__)))
+
+
+class MealFootprint:
+    """以 CatalogIndex 的 cf 陣列查表計算碳足跡（每個目錄版本建一次，唯讀）。"""
+
+    __slots__ = ("version", "_cf")
+
+    def __init__(self, catalog: CatalogIndex):
+        self.version = catalog.version
+        # 最後多放一個 0：列位置 -1（NO_ROW）剛好查到 0，不用另外遮罩
+        cf = np.append(catalog.cf_kg, 0.0)
+        cf.flags.writeable = False
+        self._cf = cf
+
+    def _sum_rows(self, rows, n: int) -> np.ndarray:
+        if rows is None:
+            return np.zeros(n)
+        rows = np.asarray(rows, dtype=np.intp).reshape(n, -1)
+        return self._cf[rows].sum(axis=1)
+
+    def batch(
+        self,
+        food,
+        cooking=None,
+        drink=None,
+        dessert=None,
+        packaging=None,
+        transport_km=0.0,
+        takeout_km=0.0,
+        ef=0.0,
+    ) -> np.ndarray:
+        """一次計算 n 餐，回傳 (n, 7) 陣列，欄位順序同 CATEGORIES。
+
+        food / cooking / dessert / packaging 為 (n, k) 列位置（不足的補 NO_ROW），
+        drink 為 (n,)；transport_km / takeout_km / ef 可為純量或 (n,)。
+        """
+        food = np.asarray(food, dtype=np.intp)
+        n = len(food)
+        ef = np.asarray(ef, dtype="float64")
+        out = np.empty((n, len(CATEGORIES)))
+        out[:, 0] = self._sum_rows(food, n)
+        out[:, 1] = self._sum_rows(cooking, n)
+        out[:, 2] = self._sum_rows(drink, n)
+        out[:, 3] = np.asarray(transport_km, dtype="float64") * ef
+        out[:, 4] = self._sum_rows(dessert, n)
+        out[:, 5] = self._sum_rows(packaging, n)
+        out[:, 6] = np.asarray(takeout_km, dtype="float64") * ef
+        return out
+
+    def totals(self, *args, **kwargs) -> np.ndarray:
+        return self.batch(*args, **kwargs).sum(axis=1)
+
+    def breakdown(self, meal: Meal) -> Breakdown:
+        # 單筆也走 batch（n=1），畫面和批次分析的數字保證一致
+        row = self.batch(
+            [meal.food],
+            cooking=[meal.cooking],
+            drink=[meal.drink],
+            dessert=[meal.dessert],
+            packaging=[meal.packaging],
+            transport_km=meal.transport_km,
+            takeout_km=meal.takeout_km,
+            ef=meal.ef,
+        )[0]
+        return Breakdown(*row)
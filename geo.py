@@ -0,0 +1,615 @@
+# geo.py：距離計算與附近分店搜尋（OSM Nominatim）
+#
+# 不呼叫 streamlit；tomato_egg_app.py 以 st.cache_resource 包一層後使用。
+
+from __future__ import annotations
+
+import math
+import time
+import json
+import sqlite3
+import threading
+import collections
+import unicodedata
+from concurrent import futures
+
+import numpy as np
+
+from lazy import lazy_module
+
+# requests 只有線上搜尋、pandas 只有讀離線分店檔才用到：第一次用到才載入
+pd = lazy_module("pandas")
+requests = lazy_module("requests")
+
+
+# =========================
+# 1) 兩點直線距離（km）
+#    haversine_km_np 吃 NumPy 陣列並可 broadcast（起點 × 分店）；
+#    haversine_km 保留原本的純量介面
+# =========================
+EARTH_RADIUS_KM = 6371.0
+
+
+def haversine_km_np(lat1, lng1, lat2, lng2) -> np.ndarray:
+    lat1, lng1, lat2, lng2 = (np.radians(np.asarray(x, dtype="float64")) for x in (lat1, lng1, lat2, lng2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lng2 - lng1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    return float(haversine_km_np(lat1, lon1, lat2, lon2))
+
+
+def distance_matrix_km(origins, dests, chunk_rows: int = 4096, dtype="float64") -> np.ndarray:
+    """origins (n, 2)、dests (m, 2)（lat, lng）→ (n, m) 距離矩陣。
+
+    大矩陣（例如全班起點 × 全台中分店）分段計算，暫存記憶體只跟 chunk_rows × m 成正比；
+    dtype="float32" 可讓結果矩陣省一半記憶體。
+    """
+    o = np.radians(np.asarray(origins, dtype="float64").reshape(-1, 2))
+    d = np.radians(np.asarray(dests, dtype="float64").reshape(-1, 2))
+    out = np.empty((len(o), len(d)), dtype=dtype)
+    d_lat, d_lng = d[:, 0][None, :], d[:, 1][None, :]
+    cos_d = np.cos(d_lat)
+    for a in range(0, len(o), chunk_rows):
+        o_lat, o_lng = o[a : a + chunk_rows, 0][:, None], o[a : a + chunk_rows, 1][:, None]
+        h = np.sin((d_lat - o_lat) / 2) ** 2 + np.cos(o_lat) * cos_d * np.sin((d_lng - o_lng) / 2) ** 2
+        out[a : a + chunk_rows] = 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(h, 1.0)))
+    return out
+
+
+def topk_nearest(origins, dests, k: int = 5, chunk_rows: int = 4096):
+    """每個起點最近的 k 個目的地：回傳 (index (n, k), dist_km (n, k))，由近到遠。"""
+    o = np.asarray(origins, dtype="float64").reshape(-1, 2)
+    n_dest = len(np.asarray(dests).reshape(-1, 2))
+    k = min(k, n_dest)
+    idx = np.empty((len(o), k), dtype=np.int64)
+    dist = np.empty((len(o), k), dtype="float64")
+    if k == 0:
+        return idx, dist
+    for a in range(0, len(o), chunk_rows):
+        m = distance_matrix_km(o[a : a + chunk_rows], dests, chunk_rows=chunk_rows)
+        part = np.argpartition(m, k - 1, axis=1)[:, :k]
+        pd_ = np.take_along_axis(m, part, axis=1)
+        order = np.argsort(pd_, axis=1, kind="stable")
+        idx[a : a + chunk_rows] = np.take_along_axis(part, order, axis=1)
+        dist[a : a + chunk_rows] = np.take_along_axis(pd_, order, axis=1)
+    return idx, dist
+
+
+def nearest_index(lat: float, lng: float, points: list):
+    """points 為 [{'lat':..,'lng':..}, ...]；回傳 (最近的 index, 距離 km)，空清單回傳 (None, inf)。"""
+    if not points:
+        return None, float("inf")
+    d = haversine_km_np(lat, lng, [p["lat"] for p in points], [p["lng"] for p in points])
+    i = int(np.argmin(d))
+    return i, float(d[i])
+
+
+def rank_by_distance(lat: float, lng: float, points: list, k: int = None) -> list:
+    """每筆加上 dist_km，由近到遠排序（取前 k 筆）；不修改傳入的 dict。"""
+    if not points:
+        return []
+    d = haversine_km_np(lat, lng, [p["lat"] for p in points], [p["lng"] for p in points])
+    order = np.argsort(d, kind="stable")[:k]
+    return [dict(points[i], dist_km=float(d[i])) for i in order]
+
+
+# =========================
+# 2) 以中心點搜尋附近分店（OSM Nominatim）
+# =========================
+NOMINATIM_URL = "https://nominatim.openstreetmap.org"
+
+
+def nominatim_search_nearby(query, lat, lng, radius_km=5, limit=60, base_url=NOMINATIM_URL):
+    if not query.strip():
+        return []
+
+    lat_delta = radius_km / 111.0
+    lng_delta = radius_km / (111.0 * max(0.1, math.cos(math.radians(lat))))
+    viewbox = f"{lng-lng_delta},{lat+lat_delta},{lng+lng_delta},{lat-lat_delta}"
+
+    params = {
+        "q": query,
+        "format": "jsonv2",
+        "limit": str(limit),
+        "addressdetails": 1,
+        "viewbox": viewbox,
+        "bounded": 1,
+    }
+    headers = {
+        "User-Agent": "carbon-footprint-edu-app/1.0",
+        "Accept-Language": "zh-TW,zh,en",
+    }
+
+    r = requests.get(f"{base_url}/search", params=params, headers=headers, timeout=10)
+    r.raise_for_status()
+    data = r.json()
+
+    out = []
+    for x in data:
+        display_name = x.get("display_name", "")
+        out.append(
+            {
+                "display_name": display_name,
+                "name": (display_name.split(",")[0] if display_name else "").strip(),
+                "lat": float(x["lat"]),
+                "lng": float(x["lon"]),
+            }
+        )
+    return out
+
+
+# =========================
+# 3) 搜尋結果快取（磁碟 SQLite，TTL + LRU，跨 session / 跨 process 共用）
+#    key = 正規化關鍵字 + 半徑 + 起點所在的 geohash 格子
+#    同一格子內的學生共用同一次查詢（以格子中心查、半徑加上半個格子對角線）
+# =========================
+GEO_CACHE_PATH = ".geo_cache.sqlite3"
+GEOHASH_PRECISION = 6  # 約 1.2 km × 0.6 km
+
+_GEOHASH_BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+
+def geohash_encode(lat: float, lng: float, precision: int = GEOHASH_PRECISION) -> str:
+    lat_lo, lat_hi = -90.0, 90.0
+    lng_lo, lng_hi = -180.0, 180.0
+    out = []
+    bits = 0
+    n_bits = 0
+    even = True
+    while len(out) < precision:
+        if even:
+            mid = (lng_lo + lng_hi) / 2
+            if lng >= mid:
+                bits = (bits << 1) | 1
+                lng_lo = mid
+            else:
+                bits <<= 1
+                lng_hi = mid
+        else:
+            mid = (lat_lo + lat_hi) / 2
+            if lat >= mid:
+                bits = (bits << 1) | 1
+                lat_lo = mid
+            else:
+                bits <<= 1
+                lat_hi = mid
+        even = not even
+        n_bits += 1
+        if n_bits == 5:
+            out.append(_GEOHASH_BASE32[bits])
+            bits = 0
+            n_bits = 0
+    return "".join(out)
+
+
+def geohash_cell(code: str):
+    """回傳 (中心 lat, 中心 lng, 半高 deg, 半寬 deg)。"""
+    lat_lo, lat_hi = -90.0, 90.0
+    lng_lo, lng_hi = -180.0, 180.0
+    even = True
+    for ch in code:
+        v = _GEOHASH_BASE32.index(ch)
+        for shift in range(4, -1, -1):
+            bit = (v >> shift) & 1
+            if even:
+                mid = (lng_lo + lng_hi) / 2
+                lng_lo, lng_hi = (mid, lng_hi) if bit else (lng_lo, mid)
+            else:
+                mid = (lat_lo + lat_hi) / 2
+                lat_lo, lat_hi = (mid, lat_hi) if bit else (lat_lo, mid)
+            even = not even
+    return (lat_lo + lat_hi) / 2, (lng_lo + lng_hi) / 2, (lat_hi - lat_lo) / 2, (lng_hi - lng_lo) / 2
+
+
+def normalize_query(query: str) -> str:
+    # 全形/半形、大小寫、多餘空白都視為同一個關鍵字
+    q = unicodedata.normalize("NFKC", query or "").strip().lower()
+    return " ".join(q.split())
+
+
+class GeoSearchCache:
+    def __init__(self, path: str = GEO_CACHE_PATH, ttl_seconds: float = 7 * 24 * 3600, max_entries: int = 5000):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.hits = 0    # 本 process 計數；跨 process 的累計在 stats()
+        self.misses = 0
+        self._local = threading.local()
+
+        db = self._db()
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute(
+            """
+            CREATE TABLE IF NOT EXISTS search_cache (
+                key TEXT PRIMARY KEY,
+                results_json TEXT NOT NULL,
+                created REAL NOT NULL,
+                last_used REAL NOT NULL
+            )
+            """
+        )
+        db.execute("CREATE INDEX IF NOT EXISTS search_cache_lru ON search_cache (last_used)")
+        db.execute("CREATE TABLE IF NOT EXISTS search_stats (name TEXT PRIMARY KEY, n INTEGER NOT NULL)")
+        db.commit()
+
+    def _db(self):
+        # sqlite 連線不能跨執行緒共用：每個執行緒各開一條
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=30)
+            db.execute("PRAGMA synchronous=NORMAL")
+            self._local.db = db
+        return db
+
+    def _count(self, db, name: str) -> None:
+        db.execute(
+            "INSERT INTO search_stats (name, n) VALUES (?, 1) ON CONFLICT(name) DO UPDATE SET n = n + 1",
+            (name,),
+        )
+
+    def get(self, key: str):
+        now = time.time()
+        db = self._db()
+        row = db.execute("SELECT results_json, created FROM search_cache WHERE key = ?", (key,)).fetchone()
+        if row is not None and now - row[1] <= self.ttl_seconds:
+            db.execute("UPDATE search_cache SET last_used = ? WHERE key = ?", (now, key))
+            self._count(db, "hits")
+            db.commit()
+            self.hits += 1
+            return json.loads(row[0])
+        if row is not None:
+            db.execute("DELETE FROM search_cache WHERE key = ?", (key,))
+        self._count(db, "misses")
+        db.commit()
+        self.misses += 1
+        return None
+
+    def put(self, key: str, results: list) -> None:
+        now = time.time()
+        db = self._db()
+        db.execute(
+            "INSERT OR REPLACE INTO search_cache (key, results_json, created, last_used) VALUES (?, ?, ?, ?)",
+            (key, json.dumps(results, ensure_ascii=False), now, now),
+        )
+        # LRU：超過上限就刪掉最久沒用到的
+        db.execute(
+            """
+            DELETE FROM search_cache WHERE key IN (
+                SELECT key FROM search_cache ORDER BY last_used DESC LIMIT -1 OFFSET ?
+            )
+            """,
+            (self.max_entries,),
+        )
+        db.commit()
+
+    def stats(self) -> dict:
+        out = dict(self._db().execute("SELECT name, n FROM search_stats").fetchall())
+        out["entries"] = self._db().execute("SELECT COUNT(*) FROM search_cache").fetchone()[0]
+        return {"hits": out.get("hits", 0), "misses": out.get("misses", 0), "entries": out["entries"]}
+
+    def clear(self) -> None:
+        db = self._db()
+        db.execute("DELETE FROM search_cache")
+        db.execute("DELETE FROM search_stats")
+        db.commit()
+
+
+def search_cache_key(query: str, lat: float, lng: float, radius_km: float, limit: int) -> str:
+    return f"{normalize_query(query)}|{float(radius_km):g}|{int(limit)}|{geohash_encode(lat, lng)}"
+
+
+def cached_search_nearby(
+    query,
+    lat,
+    lng,
+    radius_km=5,
+    limit=60,
+    cache: GeoSearchCache = None,
+    fetch=nominatim_search_nearby,
+    scheduler: "RequestScheduler" = None,
+    on_wait=None,
+):
+    if not query.strip():
+        return []
+
+    key = search_cache_key(query, lat, lng, radius_km, limit)
+    if cache is not None:
+        hit = cache.get(key)
+        if hit is not None:
+            return hit
+        # 以格子中心查，半徑加上半個格子對角線：格子內任何起點的搜尋範圍都被涵蓋
+        c_lat, c_lng, h_lat, h_lng = geohash_cell(key.rsplit("|", 1)[1])
+        pad_km = math.hypot(h_lat * 111.0, h_lng * 111.0 * math.cos(math.radians(c_lat)))
+        args = (normalize_query(query), c_lat, c_lng)
+        kwargs = {"radius_km": radius_km + pad_km, "limit": limit}
+    else:
+        key = f"{key}|{lat:.6f},{lng:.6f}"
+        args = (query, lat, lng)
+        kwargs = {"radius_km": radius_km, "limit": limit}
+
+    if scheduler is not None:
+        results = scheduler.run(key, fetch, *args, on_wait=on_wait, **kwargs)
+    else:
+        results = fetch(*args, **kwargs)
+    if cache is not None:
+        cache.put(key, results)
+    return results
+
+
+# =========================
+# 4) Nominatim 請求排程（整個 process 共用）
+#    - 相同的查詢正在排隊/進行中：直接共用同一個結果（single-flight）
+#    - 不同的查詢：token bucket 限速（Nominatim 使用規範：每秒 1 次）
+#    - 被回 429：依 Retry-After（或指數退避）暫停整個佇列後重試
+#    - 呼叫端等待時可拿到目前排第幾位，顯示給學生看
+# =========================
+def _is_throttled(e: Exception) -> bool:
+    status = getattr(getattr(e, "response", None), "status_code", None)
+    return status in (429, 503)
+
+
+def _retry_after_seconds(e: Exception):
+    headers = getattr(getattr(e, "response", None), "headers", None) or {}
+    try:
+        return max(0.0, float(headers.get("Retry-After")))
+    except (TypeError, ValueError):
+        return None
+
+
+class RequestScheduler:
+    def __init__(
+        self,
+        rate_per_sec: float = 1.0,
+        burst: int = 1,
+        max_retries: int = 4,
+        backoff_base: float = 2.0,
+        name: str = "nominatim-scheduler",
+    ):
+        self.rate_per_sec = rate_per_sec
+        self.burst = burst
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.name = name
+        self.stats = {"upstream": 0, "coalesced": 0, "throttled": 0}
+
+        self._cond = threading.Condition()
+        self._pending = collections.OrderedDict()  # key -> (future, fn, args, kwargs)，FIFO
+        self._inflight = {}                        # key -> future（排隊中 + 進行中）
+        self._tokens = float(burst)
+        self._stamp = time.monotonic()
+        self._blocked_until = 0.0
+        self._thread = None
+
+    def submit(self, key, fn, *args, **kwargs) -> futures.Future:
+        with self._cond:
+            fut = self._inflight.get(key)
+            if fut is not None:
+                self.stats["coalesced"] += 1
+                return fut
+            fut = futures.Future()
+            self._inflight[key] = fut
+            self._pending[key] = (fut, fn, args, kwargs)
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+                self._thread.start()
+            self._cond.notify()
+            return fut
+
+    def position(self, key) -> int:
+        """0 = 正在查詢（或已完成）；n = 前面還有 n - 1 筆在排隊。"""
+        with self._cond:
+            for i, k in enumerate(self._pending, start=1):
+                if k == key:
+                    return i
+            return 0
+
+    def run(self, key, fn, *args, on_wait=None, timeout: float = 60.0, **kwargs):
+        fut = self.submit(key, fn, *args, **kwargs)
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                return fut.result(timeout=0.25)
+            except futures.TimeoutError:
+                if time.monotonic() >= deadline:
+                    raise
+                if on_wait is not None:
+                    on_wait(self.position(key))
+
+    def _take_token(self) -> None:
+        while True:
+            with self._cond:
+                now = time.monotonic()
+                self._tokens = min(float(self.burst), self._tokens + (now - self._stamp) * self.rate_per_sec)
+                self._stamp = now
+                wait = max(self._blocked_until - now, 0.0)
+                if wait == 0.0 and self._tokens >= 1.0:
+                    self._tokens -= 1.0
+                    return
+                if wait == 0.0:
+                    wait = (1.0 - self._tokens) / self.rate_per_sec
+            time.sleep(wait)
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                while not self._pending:
+                    self._cond.wait()
+                key, (fut, fn, args, kwargs) = self._pending.popitem(last=False)
+
+            attempt = 0
+            while True:
+                self._take_token()
+                self.stats["upstream"] += 1
+                try:
+                    result = fn(*args, **kwargs)
+                except Exception as e:
+                    if _is_throttled(e) and attempt < self.max_retries:
+                        attempt += 1
+                        self.stats["throttled"] += 1
+                        delay = _retry_after_seconds(e)
+                        if delay is None:
+                            delay = self.backoff_base * (2 ** (attempt - 1))
+                        with self._cond:
+                            self._blocked_until = max(self._blocked_until, time.monotonic() + delay)
+                        continue
+                    fut.set_exception(e)
+                else:
+                    fut.set_result(result)
+                break
+
+            with self._cond:
+                self._inflight.pop(key, None)
+
+
+# =========================
+# 5) 離線分店索引（不連網）：本機 POI 檔 + 格網空間索引
+#    支援 CSV（name, brand, lat, lng/lon）或 GeoJSON（Point；Overpass turbo 匯出格式）
+#    查「離起點最近、名稱/品牌含 X 的 k 家」：由近到遠一圈一圈展開格子，找到就停
+# =========================
+POI_PATH_DEFAULT = "stores_taichung.csv"
+
+
+def load_poi_file(path: str) -> pd.DataFrame:
+    if path.lower().endswith((".geojson", ".json")):
+        with open(path, encoding="utf-8") as f:
+            features = json.load(f).get("features", [])
+        rows = []
+        for ft in features:
+            geom = ft.get("geometry") or {}
+            if geom.get("type") != "Point":
+                continue
+            props = ft.get("properties") or {}
+            lng, lat = geom["coordinates"][:2]
+            rows.append(
+                {
+                    "name": props.get("name") or props.get("name:zh") or "",
+                    "brand": props.get("brand") or props.get("brand:zh") or "",
+                    "address": props.get("addr:full") or props.get("addr:street") or "",
+                    "lat": lat,
+                    "lng": lng,
+                }
+            )
+        df = pd.DataFrame(rows, columns=["name", "brand", "address", "lat", "lng"])
+    else:
+        df = pd.read_csv(path)
+        df = df.rename(columns={"lon": "lng", "longitude": "lng", "latitude": "lat"})
+        for c in ("brand", "address"):
+            if c not in df.columns:
+                df[c] = ""
+
+    df = df.dropna(subset=["lat", "lng"]).reset_index(drop=True)
+    for c in ("name", "brand", "address"):
+        df[c] = df[c].fillna("").astype(str).str.strip()
+    df["lat"] = df["lat"].astype("float64")
+    df["lng"] = df["lng"].astype("float64")
+    return df
+
+
+class PoiIndex:
+    def __init__(self, df: pd.DataFrame, cell_deg: float = 0.01):
+        self.cell_deg = cell_deg
+        self.lat = np.ascontiguousarray(df["lat"].to_numpy(dtype="float64"))
+        self.lng = np.ascontiguousarray(df["lng"].to_numpy(dtype="float64"))
+        self.names = df["name"].to_numpy(dtype=object)
+        self.brands = df["brand"].to_numpy(dtype=object)
+        self.addresses = df["address"].to_numpy(dtype=object)
+        # 比對用文字：品牌 + 名稱，先正規化好
+        self._text = (df["brand"] + " " + df["name"]).map(normalize_query)
+        self._masks = collections.OrderedDict()  # 正規化關鍵字 -> bool 陣列（LRU）
+
+        # 格網：依 (格列, 格欄) 排序後切段
+        ci = np.floor(self.lat / cell_deg).astype(np.int64)
+        cj = np.floor(self.lng / cell_deg).astype(np.int64)
+        order = np.lexsort((cj, ci))
+        self._order = order
+        self._cells = {}
+        if len(order):
+            keys = np.stack([ci[order], cj[order]], axis=1)
+            change = np.flatnonzero(np.any(np.diff(keys, axis=0) != 0, axis=1)) + 1
+            starts = np.concatenate([[0], change])
+            ends = np.concatenate([change, [len(order)]])
+            for a, b in zip(starts, ends):
+                self._cells[(int(keys[a, 0]), int(keys[a, 1]))] = (a, b)
+            self._ci_range = (int(ci.min()), int(ci.max()))
+            self._cj_range = (int(cj.min()), int(cj.max()))
+
+    def __len__(self) -> int:
+        return len(self.lat)
+
+    def _match_mask(self, query: str) -> np.ndarray:
+        q = normalize_query(query)
+        mask = self._masks.get(q)
+        if mask is None:
+            mask = self._text.str.contains(q, regex=False).to_numpy(dtype=bool) if q else np.ones(len(self), bool)
+            self._masks[q] = mask
+            if len(self._masks) > 256:
+                self._masks.popitem(last=False)
+        else:
+            self._masks.move_to_end(q)
+        return mask
+
+    def _ring(self, i0: int, j0: int, r: int):
+        if r == 0:
+            cells = [(i0, j0)]
+        else:
+            cells = [(i0 + di, j0 + dj) for di in (-r, r) for dj in range(-r, r + 1)]
+            cells += [(i0 + di, j0 + dj) for dj in (-r, r) for di in range(-r + 1, r)]
+        parts = [self._order[slice(*self._cells[c])] for c in cells if c in self._cells]
+        return np.concatenate(parts) if parts else np.empty(0, dtype=np.int64)
+
+    def nearest(self, query: str, lat: float, lng: float, k: int = 5, max_km: float = None) -> list:
+        """回傳格式與 nominatim_search_nearby 相同，另加 dist_km、poi_id，由近到遠。"""
+        if len(self) == 0:
+            return []
+        mask = self._match_mask(query)
+        if not mask.any():
+            return []
+        i0 = int(math.floor(lat / self.cell_deg))
+        j0 = int(math.floor(lng / self.cell_deg))
+        # 第 r 圈以外的點，距離至少 r 個格子寬（取經、緯方向較短的一邊）
+        cell_km = self.cell_deg * 111.0 * min(1.0, math.cos(math.radians(abs(lat) + self.cell_deg)))
+        max_r = max(
+            abs(i0 - self._ci_range[0]), abs(i0 - self._ci_range[1]), abs(j0 - self._cj_range[0]), abs(j0 - self._cj_range[1])
+        )
+
+        cand = []
+        best = np.empty(0)
+        # 起點在資料範圍外：直接從碰得到資料的那一圈開始
+        min_r = max(0, self._ci_range[0] - i0, i0 - self._ci_range[1], self._cj_range[0] - j0, j0 - self._cj_range[1])
+        for r in range(min_r, max_r + 1):
+            rows = self._ring(i0, j0, r)
+            rows = rows[mask[rows]]
+            if len(rows):
+                cand.append(rows)
+                allr = np.concatenate(cand)
+                best = haversine_km_np(lat, lng, self.lat[allr], self.lng[allr])
+            lower_bound = r * cell_km
+            if max_km is not None and lower_bound > max_km:
+                break
+            if len(best) >= k and np.partition(best, k - 1)[k - 1] <= lower_bound:
+                break
+
+        if not cand:
+            return []
+        allr = np.concatenate(cand)
+        if max_km is not None:
+            keep = best <= max_km
+            allr, best = allr[keep], best[keep]
+        top = np.argsort(best, kind="stable")[:k]
+        out = []
+        for i, d in zip(allr[top], best[top]):
+            name = self.names[i] or self.brands[i]
+            display = ", ".join(x for x in (name, self.addresses[i]) if x)
+            out.append(
+                {
+                    "display_name": display,
+                    "name": name,
+                    "lat": float(self.lat[i]),
+                    "lng": float(self.lng[i]),
+                    "dist_km": float(d),
+                    "poi_id": int(i),  # 離線分店檔的列位置（帶回距離表用它查）
+                }
+            )
+        return out
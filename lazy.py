@@ -0,0 +1,44 @@
+# lazy.py：延後匯入較重的套件（pandas / altair / folium / requests …）
+#
+# lazy_module("pandas") 先回傳一個代理物件，第一次取用屬性（pd.DataFrame…）時才真的 import。
+# 報到頁用不到這些套件，新的 server process 冷啟動就不必先付它們的匯入時間。
+# 真正的 import 走 importlib（有模組鎖），多個 session 執行緒同時第一次取用也安全。
+
+import importlib
+
+
+class _LazyModule:
+    __slots__ = ("_name", "_module")
+
+    def __init__(self, name: str):
+        self._name = name
+        self._module = None
+
+    def _load(self):
+        module = self._module
+        if module is None:
+            module = importlib.import_module(self._name)
+            self._module = module
+        return module
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+    def __setattr__(self, attr, value):
+        # 自己的欄位照常設定；其他（例如測試時替換 requests.get）轉給真正的模組
+        if attr in _LazyModule.__slots__:
+            object.__setattr__(self, attr, value)
+        else:
+            setattr(self._load(), attr, value)
+
+    def __delattr__(self, attr):
+        delattr(self._load(), attr)
+
+    def __repr__(self) -> str:
+        state = "loaded" if self._module is not None else "not loaded"
+        return f"<lazy module {self._name!r} ({state})>"
+
+
+def lazy_module(name: str):
+    """回傳 name 模組的延後匯入代理；用法與 import 進來的模組相同。"""
+    return _LazyModule(name)
@@ -0,0 +1,261 @@
+# maps.py：folium 地圖的快取與增量更新（直接餵 streamlit_folium 的前端元件）
+#
+# 原本每次 rerun 都重建 folium.Map，st_folium 重新產生整份 Leaflet HTML/JS；
+# 底圖裡只要有一點不同（fit_bounds、新的 marker），元件 key 就變、瀏覽器整個 iframe 重新載入。
+# 這裡把一張地圖拆成三部分：
+#   - 底圖（中心、縮放、固定的 marker）：依 (key, center, zoom, marker) 快取產生好的 HTML/JS；
+#     內容不變 → 元件 key 不變，前端不會重新載入
+#   - 動態圖層（搜尋結果、已選分店、路線）：以 feature group 的 JS 傳給前端，前端只換這一層
+#   - 視野：原本的 fit_bounds 改成算好 center/zoom 傳給前端，前端直接平移/縮放
+# marker 一律用下面的 NamedTuple 描述（可 hash），同樣的內容不會重建。
+
+from __future__ import annotations
+
+import math
+from functools import lru_cache
+from typing import NamedTuple
+
+from lazy import lazy_module
+from tiles import TILE_ATTRIBUTION
+
+folium = lazy_module("folium")
+streamlit_folium = lazy_module("streamlit_folium")
+
+MAP_WIDTH_PX = 360  # 算 fit 視野時假設的地圖寬度（手機直式；use_container_width 拿不到實際寬度）
+FIT_PADDING_PX = 24
+MAX_ZOOM = 18
+
+_BADGE_HTML = """
+<div style="
+    background: rgba(255,255,255,0.92);
+    border: 2px solid #ff9800;
+    border-radius: 999px;
+    width: 26px; height: 26px;
+    text-align: center;
+    line-height: 22px;
+    font-weight: 700;
+    font-size: 14px;
+">{text}</div>
+"""
+
+
+# =========================
+# 1) 地圖上的東西（可 hash，當快取 key）
+# =========================
+class MapMarker(NamedTuple):
+    lat: float
+    lng: float
+    tooltip: str = None
+    popup: str = None
+    color: str = None  # None = Leaflet 預設的藍色 marker
+    icon: str = "info-sign"
+
+
+class MapBadge(NamedTuple):
+    """圓形編號標籤（搜尋結果旁的 1~5）。"""
+
+    lat: float
+    lng: float
+    text: str
+
+
+class MapLine(NamedTuple):
+    points: tuple  # ((lat, lng), ...)
+    weight: int = 3
+
+
+def _add_items(parent, items) -> None:
+    for it in items:
+        if isinstance(it, MapMarker):
+            icon = folium.Icon(color=it.color, icon=it.icon) if it.color else None
+            folium.Marker([it.lat, it.lng], tooltip=it.tooltip, popup=it.popup, icon=icon).add_to(parent)
+        elif isinstance(it, MapBadge):
+            folium.Marker([it.lat, it.lng], icon=folium.DivIcon(html=_BADGE_HTML.format(text=it.text))).add_to(parent)
+        elif isinstance(it, MapLine):
+            folium.PolyLine([list(p) for p in it.points], weight=it.weight).add_to(parent)
+        else:
+            raise TypeError(f"不認識的地圖元素：{it!r}")
+
+
+# =========================
+# 2) 底圖 / 動態圖層的快取
+#    與 st_folium 產生的內容相同，只是算過一次就留著
+# =========================
+def _links(root) -> tuple:
+    css, js = [], []
+
+    def walk(e):
+        css.extend(href for _, href in getattr(e, "default_css", []))
+        js.extend(src for _, src in getattr(e, "default_js", []))
+        for child in getattr(e, "_children", {}).values():
+            walk(child)
+
+    walk(root)
+    return list(dict.fromkeys(css)), list(dict.fromkeys(js))
+
+
+# streamlit_folium 沒有公開「產生好的 HTML/JS 直接交給元件」的介面，下面用到它的內部函式
+# （requirements.txt 鎖在 0.27.*）；哪天改名了就退回公開的 st_folium（每次重建底圖，慢但結果一樣）
+_PRIVATE_API = (
+    "_component_func", "_get_html", "_get_header", "_get_map_string",
+    "get_full_id", "generate_js_hash", "_get_feature_group_string",
+)
+
+
+@lru_cache(maxsize=1)
+def _has_private_api() -> bool:
+    return all(hasattr(streamlit_folium, name) for name in _PRIVATE_API)
+
+
+def _new_map(center: tuple, zoom: int, items: tuple, tiles: str):
+    if tiles:
+        m = folium.Map(location=list(center), zoom_start=zoom, tiles=tiles, attr=TILE_ATTRIBUTION)
+    else:
+        m = folium.Map(location=list(center), zoom_start=zoom)
+    _add_items(m, items)
+    return m
+
+
+def _new_layer(items: tuple):
+    fg = folium.FeatureGroup(name="layer")
+    _add_items(fg, items)
+    return fg
+
+
+@lru_cache(maxsize=256)
+def _base_payload(key: str, center: tuple, zoom: int, items: tuple, tiles: str) -> dict:
+    sf = streamlit_folium
+    m = _new_map(center, zoom, items, tiles)
+    m.get_root().render()
+    m.render()
+
+    html = sf._get_html(m)
+    header = sf._get_header(m)
+    css_links, js_links = _links(m)
+    script = sf._get_map_string(m)
+    (s, w), (n, e) = m.get_bounds()
+    return {
+        "script": script,
+        "header": header,
+        "html": html,
+        "id": sf.get_full_id(m),
+        "key": sf.generate_js_hash(script, key, False),
+        "css_links": css_links,
+        "js_links": js_links,
+        "default": {
+            "last_clicked": None,
+            "last_object_clicked": None,
+            "last_object_clicked_count": None,
+            "last_object_clicked_tooltip": None,
+            "last_object_clicked_popup": None,
+            "all_drawings": None,
+            "last_active_drawing": None,
+            "bounds": {"_southWest": {"lat": s, "lng": w}, "_northEast": {"lat": n, "lng": e}},
+            "zoom": zoom,
+            "last_circle_radius": None,
+            "last_circle_polygon": None,
+            "selected_layers": None,
+            "selected_tags": None,
+            "last_geocoder_result": None,
+        },
+    }
+
+
+@lru_cache(maxsize=1024)
+def _layer_script(items: tuple) -> str:
+    # feature group 要掛在某張地圖上才能產生 JS；地圖變數會被換成前端固定的 map_div
+    m = folium.Map(tiles=None)
+    return streamlit_folium._get_feature_group_string(_new_layer(items), map=m, idx=0)
+
+
+def clear_map_cache() -> None:
+    _has_private_api.cache_clear()
+    _base_payload.cache_clear()
+    _layer_script.cache_clear()
+
+
+# =========================
+# 3) 視野：包含所有點的 center / zoom（與 Leaflet fitBounds 相同的 Web Mercator 算法）
+# =========================
+def _merc_y(lat: float) -> float:
+    lat = max(min(lat, 85.0), -85.0)
+    return math.log(math.tan(math.pi / 4 + math.radians(lat) / 2))
+
+
+def fit_view(points, height_px: int, width_px: int = MAP_WIDTH_PX, padding_px: int = FIT_PADDING_PX) -> tuple:
+    """points [(lat, lng), ...] → ((lat, lng), zoom)。"""
+    lats = [p[0] for p in points]
+    lngs = [p[1] for p in points]
+    y0, y1 = _merc_y(min(lats)), _merc_y(max(lats))
+    lat_c = math.degrees(2 * math.atan(math.exp((y0 + y1) / 2)) - math.pi / 2)
+    center = (round(lat_c, 6), round((min(lngs) + max(lngs)) / 2, 6))
+
+    zoom = MAX_ZOOM
+    dx = max(lngs) - min(lngs)
+    if dx > 0:
+        zoom = min(zoom, math.log2((width_px - 2 * padding_px) / 256 * 360 / dx))
+    if y1 > y0:
+        zoom = min(zoom, math.log2((height_px - 2 * padding_px) / 256 * 2 * math.pi / (y1 - y0)))
+    return center, max(1, int(math.floor(zoom)))
+
+
+# =========================
+# 4) 畫地圖
+# =========================
+def render_map(
+    key: str,
+    center,
+    zoom: int,
+    base=(),
+    layer=(),
+    view=None,
+    height: int = 420,
+    returned_objects=None,
+    tiles: str = None,
+):
+    """畫一張地圖，回傳值與 st_folium 相同（dict）。
+
+    base：跟著底圖快取的 marker；layer：會變動的 marker / 路線（只換這一層）；
+    view：(center, zoom) 要前端平移到的視野，None = 底圖的中心與縮放；
+    returned_objects：哪些互動要回傳（None = 全部；只列需要的，拖曳地圖就不會觸發 rerun）；
+    tiles：圖磚網址樣板（例如 tiles.TileServer 的網址），None = 直接用 OpenStreetMap。
+    """
+    center = (float(center[0]), float(center[1]))
+    layer = tuple(layer)
+    view_center, view_zoom = view if view is not None else (center, zoom)
+    if not _has_private_api():
+        return streamlit_folium.st_folium(
+            _new_map(center, int(zoom), tuple(base), tiles),
+            key=key,
+            height=height,
+            use_container_width=True,
+            returned_objects=returned_objects,
+            zoom=view_zoom,
+            center=tuple(view_center),
+            feature_group_to_add=_new_layer(layer) if layer else None,
+        )
+
+    p = _base_payload(key, center, int(zoom), tuple(base), tiles)
+    default = p["default"]
+    if returned_objects is not None:
+        default = {k: v for k, v in default.items() if k in returned_objects}
+    return streamlit_folium._component_func(
+        script=p["script"],
+        header=p["header"],
+        html=p["html"],
+        id=p["id"],
+        key=p["key"],
+        height=height,
+        width=None,  # use_container_width
+        returned_objects=returned_objects,
+        default=default,
+        zoom=view_zoom,
+        center=list(view_center),
+        feature_group=_layer_script(layer) if layer else None,
+        return_on_hover=False,
+        layer_control=None,
+        pixelated=False,
+        css_links=p["css_links"],
+        js_links=p["js_links"],
+        wrap_longitude=False,
+    )
@@ -0,0 +1,144 @@
+# profiler.py：rerun 各區段計時（p50 / p95），全部 session 共用一份，可匯出 JSONL
+#
+# 不呼叫 streamlit。app 在 process 裡只建一個 Profiler（st.cache_resource），每個區段
+# 只留最近 window 筆（ring buffer），課堂上跑一整節也不會一直長大。
+#   - 整頁腳本的編號區段：sections().enter("8 報到") 結束上一段、開始這一段，close() 結束最後一段
+#     （腳本是一整串頂層程式碼、中間還有 st.stop()，用 with 包不起來）
+#   - 函式 / 一小段程式：@profiler.timed("…") 或 with profiler.span("…")
+# 名稱是平的（不做巢狀）：fragment 自己重跑時跟整頁跑時記在同一個名稱下。
+# 中途被 st.stop() / st.rerun() / 例外打斷、沒 close 的區段不記（時間不完整）；span 則一律記。
+
+from __future__ import annotations
+
+import math
+import json
+import time
+import threading
+import functools
+from collections import deque
+from contextlib import contextmanager
+
+PROFILE_WINDOW = 512  # 每個區段保留最近幾筆
+
+
+def percentile(sorted_ms, p: float) -> float:
+    """nearest-rank 百分位（sorted_ms 已排序、非空）。"""
+    k = max(1, math.ceil(p / 100 * len(sorted_ms)))
+    return sorted_ms[min(k, len(sorted_ms)) - 1]
+
+
+# =========================
+# 1) 共用的計時紀錄
+# =========================
+class Profiler:
+    def __init__(self, window: int = PROFILE_WINDOW):
+        self.window = max(1, int(window))
+        self._lock = threading.Lock()
+        self._spans = {}  # 名稱 -> deque[(結束時間 epoch 秒, 毫秒)]
+        self.total = 0    # 本 process 記過幾筆（含已被擠出 ring buffer 的）
+
+    def record(self, name: str, ms: float, ts: float = None) -> None:
+        ts = time.time() if ts is None else ts
+        with self._lock:
+            buf = self._spans.get(name)
+            if buf is None:
+                buf = self._spans[name] = deque(maxlen=self.window)
+            buf.append((ts, ms))
+            self.total += 1
+
+    @contextmanager
+    def span(self, name: str):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, (time.perf_counter() - t0) * 1e3)
+
+    def timed(self, name: str):
+        """裝飾器：每次呼叫記一筆。"""
+
+        def deco(fn):
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                with self.span(name):
+                    return fn(*args, **kwargs)
+
+            return wrapper
+
+        return deco
+
+    def sections(self) -> "Sections":
+        return Sections(self)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._spans.clear()
+            self.total = 0
+
+    # =========================
+    # 2) 統計 / 匯出
+    # =========================
+    def _snapshot(self) -> dict:
+        with self._lock:
+            return {name: list(buf) for name, buf in self._spans.items()}
+
+    def summary(self) -> list:
+        """每個區段一列：筆數、p50 / p95 / 最大 / 最近一次（毫秒），依第一次記錄的順序。"""
+        rows = []
+        for name, recs in self._snapshot().items():
+            ms = sorted(m for _, m in recs)
+            rows.append(
+                {
+                    "section": name,
+                    "count": len(ms),
+                    "p50_ms": round(percentile(ms, 50), 2),
+                    "p95_ms": round(percentile(ms, 95), 2),
+                    "max_ms": round(ms[-1], 2),
+                    "last_ms": round(recs[-1][1], 2),
+                }
+            )
+        return rows
+
+    def records(self) -> list:
+        """ring buffer 裡所有紀錄，依時間排序。"""
+        out = [
+            {"ts": round(ts, 3), "section": name, "ms": round(ms, 3)}
+            for name, recs in self._snapshot().items()
+            for ts, ms in recs
+        ]
+        out.sort(key=lambda r: r["ts"])
+        return out
+
+    def to_jsonl(self) -> str:
+        return "".join(json.dumps(r, ensure_ascii=False) + "\n" for r in self.records())
+
+    def write_jsonl(self, path: str) -> int:
+        """附加到 path（一行一筆），回傳寫了幾筆。"""
+        recs = self.records()
+        with open(path, "a", encoding="utf-8") as f:
+            for r in recs:
+                f.write(json.dumps(r, ensure_ascii=False) + "\n")
+        return len(recs)
+
+
+# =========================
+# 3) 整頁腳本的編號區段
+# =========================
+class Sections:
+    __slots__ = ("profiler", "_name", "_t0")
+
+    def __init__(self, profiler: Profiler):
+        self.profiler = profiler
+        self._name = None
+        self._t0 = 0.0
+
+    def enter(self, name: str) -> None:
+        """結束目前的區段（有的話），開始 name。"""
+        self.close()
+        self._name = name
+        self._t0 = time.perf_counter()
+
+    def close(self) -> None:
+        if self._name is not None:
+            self.profiler.record(self._name, (time.perf_counter() - self._t0) * 1e3)
+            self._name = None
@@ -0,0 +1,463 @@
+# routing.py：離線道路距離（OSM 道路網 + A* / 多目標 Dijkstra + 磁碟快取）
+#
+# 不呼叫 streamlit；tomato_egg_app.py 以 st.cache_resource 包一層後使用。
+# 原本交通 / 帶回都用兩點直線距離（haversine），實際路程一定更長。
+# repo 根目錄放一份台中的 OSM 道路檔（.osm / .osm.gz / .osm.bz2，例如用 Overpass 匯出 highway=*），
+# 就改用道路距離，完全不連網：
+#   - 依交通方式（走路 / 機車 / 汽車）各建一份 CSR 鄰接表（走路不看單行道；機車不上國道）
+#   - 起點 → 分店的結果存在 SQLite，key = 起點所在的 geohash 格子（約 150 m）+ 分店座標，
+#     同一格子的學生共用；查快取只要零點幾毫秒
+#   - 解析好的道路網存成 .npz（依檔案大小 / 修改時間），重開 server 不必重新解析 XML
+# 沒有道路檔、或起終點離道路太遠 / 不連通時回傳 None，呼叫端改用直線距離。
+
+from __future__ import annotations
+
+import os
+import bz2
+import gzip
+import math
+import heapq
+import sqlite3
+import threading
+from array import array
+import xml.etree.ElementTree as ET
+
+import numpy as np
+
+from geo import EARTH_RADIUS_KM, geohash_encode, haversine_km_np
+
+ROAD_GRAPH_PATH_DEFAULT = "roads_taichung.osm"
+ROAD_GRAPH_CACHE_DIR = ".road_cache"
+ROUTE_CACHE_PATH = ".route_cache.sqlite3"
+ROUTE_CELL_PRECISION = 7   # geohash 7 碼：約 150 m × 150 m
+SNAP_MAX_KM = 0.5          # 起終點離最近的道路節點超過這個距離就不算道路距離
+_GRAPH_FORMAT = 1
+
+MODES = ("walk", "scooter", "car")
+
+# 各交通方式不能走的道路（highway=*）
+_NO_MOTOR = {"footway", "path", "pedestrian", "steps", "cycleway", "bridleway", "corridor", "elevator", "platform"}
+_NEVER = {"construction", "proposed", "abandoned", "raceway", "bus_guideway", "escape", "services", "rest_area"}
+_EXCLUDED = {
+    "walk": _NEVER | {"motorway", "motorway_link", "trunk", "trunk_link"},
+    "scooter": _NEVER | _NO_MOTOR | {"motorway", "motorway_link"},  # 機車不能上國道
+    "car": _NEVER | _NO_MOTOR,
+}
+_MODE_ACCESS_TAG = {"walk": "foot", "scooter": "motorcycle", "car": "motorcar"}
+
+
+# =========================
+# 1) 讀 OSM XML：道路（highway=*）的節點與路段
+# =========================
+def _open_osm(path: str):
+    if path.endswith(".gz"):
+        return gzip.open(path, "rb")
+    if path.endswith(".bz2"):
+        return bz2.open(path, "rb")
+    return open(path, "rb")
+
+
+def _allowed(mode: str, tags: dict) -> bool:
+    if tags.get("highway") in _EXCLUDED[mode] or tags.get("area") == "yes":
+        return False
+    own = tags.get(_MODE_ACCESS_TAG[mode])
+    if own is not None:
+        return own not in ("no", "private")
+    if mode != "walk" and tags.get("motor_vehicle") in ("no", "private"):
+        return False
+    return tags.get("access") not in ("no", "private")
+
+
+def _oneway(tags: dict) -> int:
+    """1 = 只能順著畫的方向、-1 = 只能逆向、0 = 雙向。"""
+    v = tags.get("oneway")
+    if v in ("yes", "1", "true"):
+        return 1
+    if v == "-1":
+        return -1
+    if v is None and (tags.get("junction") == "roundabout" or tags.get("highway") in ("motorway", "motorway_link")):
+        return 1
+    return 0
+
+
+def _osm_element(el, root, refs, tags, node_ids, node_lat, node_lng, seg_u, seg_v, seg_flags) -> None:
+    tag = el.tag
+    if tag == "nd":
+        refs.append(int(el.get("ref")))
+    elif tag == "tag":
+        tags[el.get("k")] = el.get("v")
+    elif tag == "node":
+        node_ids.append(int(el.get("id")))
+        node_lat.append(float(el.get("lat")))
+        node_lng.append(float(el.get("lon")))
+    elif tag == "way" and "highway" in tags and len(refs) >= 2:
+        flags = 1 if _allowed("walk", tags) else 0
+        ow = _oneway(tags)
+        for bit, mode in ((1, "scooter"), (3, "car")):
+            if _allowed(mode, tags):
+                if ow >= 0:
+                    flags |= 1 << bit
+                if ow <= 0:
+                    flags |= 1 << (bit + 1)
+        if flags:
+            seg_u.extend(refs[:-1])
+            seg_v.extend(refs[1:])
+            seg_flags.extend([flags] * (len(refs) - 1))
+    if tag in ("node", "way", "relation"):
+        # 一個元素處理完：清掉它的 nd / tag，整棵樹也不留（檔案再大記憶體都不會長）
+        refs.clear()
+        tags.clear()
+        root.clear()
+
+
+def parse_osm_roads(path: str) -> dict:
+    """OSM XML → 節點座標 + 路段（u, v）與各交通方式可走的方向。"""
+    node_ids, node_lat, node_lng = array("q"), array("d"), array("d")
+    seg_u, seg_v = array("q"), array("q")
+    # 每個路段一個位元組：bit 0 走路、bit 1/2 機車 順/逆向、bit 3/4 汽車 順/逆向
+    seg_flags = array("B")
+
+    refs, tags = [], {}
+    root = None
+    with _open_osm(path) as f:
+        for event, el in ET.iterparse(f, events=("start", "end")):
+            if root is None:
+                root = el
+            if event == "end":
+                _osm_element(el, root, refs, tags, node_ids, node_lat, node_lng, seg_u, seg_v, seg_flags)
+
+    ids = np.frombuffer(node_ids, dtype=np.int64)
+    order = np.argsort(ids, kind="stable")
+    ids_sorted = ids[order]
+    u = np.frombuffer(seg_u, dtype=np.int64)
+    v = np.frombuffer(seg_v, dtype=np.int64)
+    flags = np.frombuffer(seg_flags, dtype=np.uint8)
+
+    # 路段兩端都要有座標（匯出範圍邊緣的路會缺節點）
+    iu = np.minimum(np.searchsorted(ids_sorted, u), len(ids_sorted) - 1)
+    iv = np.minimum(np.searchsorted(ids_sorted, v), len(ids_sorted) - 1)
+    ok = (ids_sorted[iu] == u) & (ids_sorted[iv] == v) & (u != v) if len(ids_sorted) else np.zeros(len(u), bool)
+    iu, iv, flags = order[iu[ok]], order[iv[ok]], flags[ok]
+
+    # 只留道路用得到的節點，重新編號
+    used, inverse = np.unique(np.concatenate([iu, iv]), return_inverse=True)
+    lat = np.frombuffer(node_lat, dtype=np.float64)[used]
+    lng = np.frombuffer(node_lng, dtype=np.float64)[used]
+    return {
+        "lat": lat,
+        "lng": lng,
+        "u": inverse[: len(iu)].astype(np.int32),
+        "v": inverse[len(iu) :].astype(np.int32),
+        "flags": flags,
+    }
+
+
+# =========================
+# 2) 道路網：各交通方式一份 CSR 鄰接表 + 找最近節點用的格網
+# =========================
+def _csr(n: int, src: np.ndarray, dst: np.ndarray, w: np.ndarray):
+    order = np.argsort(src, kind="stable")
+    indptr = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(np.bincount(src, minlength=n), out=indptr[1:])
+    return indptr, dst[order].astype(np.int32), w[order]
+
+
+class RoadGraph:
+    def __init__(self, parsed: dict, version: str = "", cell_deg: float = 0.005):
+        self.version = version
+        self.lat = np.ascontiguousarray(parsed["lat"], dtype=np.float64)
+        self.lng = np.ascontiguousarray(parsed["lng"], dtype=np.float64)
+        u, v, flags = parsed["u"], parsed["v"], parsed["flags"]
+        n = len(self.lat)
+        km = haversine_km_np(self.lat[u], self.lng[u], self.lat[v], self.lng[v]).astype(np.float32)
+        self._lat_r, self._lng_r = np.radians(self.lat), np.radians(self.lng)
+        self._cos_lat = np.cos(self._lat_r)
+
+        self._adj = {}
+        self._radj = {}  # 反向鄰接表（多個起點 → 同一個終點時用），第一次用到才建
+        for mode, fwd_bit, back_bit in (("walk", 0, 0), ("scooter", 1, 2), ("car", 3, 4)):
+            fwd = (flags >> fwd_bit) & 1 == 1
+            back = (flags >> back_bit) & 1 == 1
+            src = np.concatenate([u[fwd], v[back]])
+            dst = np.concatenate([v[fwd], u[back]])
+            self._adj[mode] = _csr(n, src, dst, np.concatenate([km[fwd], km[back]]))
+
+        # 最近節點：依交通方式只找有連到路的節點；格網依 (格列, 格欄) 排序後切段
+        self.cell_deg = cell_deg
+        ci = np.floor(self.lat / cell_deg).astype(np.int64)
+        cj = np.floor(self.lng / cell_deg).astype(np.int64)
+        self._cell_key = ci * 1_000_003 + cj
+        self._snap = {}
+        for mode, (indptr, indices, _) in self._adj.items():
+            has_edge = np.zeros(n, dtype=bool)
+            has_edge[np.diff(indptr) > 0] = True
+            has_edge[indices] = True
+            nodes = np.flatnonzero(has_edge)
+            order = np.argsort(self._cell_key[nodes], kind="stable")
+            self._snap[mode] = (nodes[order], self._cell_key[nodes[order]])
+
+    def __len__(self) -> int:
+        return len(self.lat)
+
+    def edges(self, mode: str) -> int:
+        return len(self._adj[mode][1])
+
+    def snap(self, mode: str, lat: float, lng: float, max_km: float = SNAP_MAX_KM):
+        """最近的道路節點 (node, km)；max_km 內沒有 → (None, None)。"""
+        nodes, keys = self._snap[mode]
+        i0 = int(math.floor(lat / self.cell_deg))
+        j0 = int(math.floor(lng / self.cell_deg))
+        cell_km = self.cell_deg * 111.0 * min(1.0, math.cos(math.radians(abs(lat) + self.cell_deg)))
+        reach = int(math.ceil(max_km / cell_km)) + 1
+        parts = []
+        for di in range(-reach, reach + 1):
+            for dj in range(-reach, reach + 1):
+                k = (i0 + di) * 1_000_003 + (j0 + dj)
+                a, b = np.searchsorted(keys, k), np.searchsorted(keys, k, side="right")
+                if b > a:
+                    parts.append(nodes[a:b])
+        if not parts:
+            return None, None
+        cand = np.concatenate(parts)
+        d = haversine_km_np(lat, lng, self.lat[cand], self.lng[cand])
+        i = int(np.argmin(d))
+        if d[i] > max_km:
+            return None, None
+        return int(cand[i]), float(d[i])
+
+    def _h(self, t: int):
+        # A* 的估計值：到終點的直線距離（不會高估，結果仍是最短路）
+        lat_t, lng_t = math.radians(self.lat[t]), math.radians(self.lng[t])
+        cos_t = math.cos(lat_t)
+        lat_r, lng_r, cos_r = self._lat_r, self._lng_r, self._cos_lat
+
+        def h(n: int) -> float:
+            a = math.sin((lat_r[n] - lat_t) / 2) ** 2 + cos_r[n] * cos_t * math.sin((lng_r[n] - lng_t) / 2) ** 2
+            return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(min(a, 1.0)))
+
+        return h
+
+    def shortest_km(self, mode: str, s: int, t: int):
+        """節點 s → t 的最短道路距離（A*）；不連通回傳 None。"""
+        return self._astar(mode, s, t)
+
+    def shortest_path(self, mode: str, s: int, t: int):
+        """節點 s → t 的最短路經過的節點 [s, …, t]（畫地圖用）；不連通回傳 None。"""
+        parent = {s: -1}
+        if self._astar(mode, s, t, parent) is None:
+            return None
+        path = [t]
+        while path[-1] != s:
+            path.append(parent[path[-1]])
+        return path[::-1]
+
+    def _astar(self, mode: str, s: int, t: int, parent: dict = None):
+        if s == t:
+            return 0.0
+        indptr, indices, w = self._adj[mode]
+        h = self._h(t)
+        best = {s: 0.0}
+        heap = [(h(s), 0.0, s)]
+        done = set()
+        while heap:
+            _, g, n = heapq.heappop(heap)
+            if n == t:
+                return g
+            if n in done:
+                continue
+            done.add(n)
+            a, b = indptr[n], indptr[n + 1]
+            for m, wm in zip(indices[a:b].tolist(), w[a:b].tolist()):
+                gm = g + wm
+                if gm < best.get(m, math.inf):
+                    best[m] = gm
+                    if parent is not None:
+                        parent[m] = n
+                    heapq.heappush(heap, (gm + h(m), gm, m))
+        return None
+
+    def distances_to(self, mode: str, t: int) -> np.ndarray:
+        """所有節點 → 節點 t 的最短道路距離（反向圖上一次 Dijkstra）；走不到為 inf。"""
+        radj = self._radj.get(mode)
+        if radj is None:
+            indptr, indices, w = self._adj[mode]
+            src = np.repeat(np.arange(len(self), dtype=np.int32), np.diff(indptr))
+            radj = self._radj[mode] = _csr(len(self), indices, src, w)
+        indptr, indices, w = radj
+        dist = [math.inf] * len(self)
+        dist[t] = 0.0
+        heap = [(0.0, t)]
+        while heap:
+            g, n = heapq.heappop(heap)
+            if g > dist[n]:
+                continue
+            a, b = indptr[n], indptr[n + 1]
+            for m, wm in zip(indices[a:b].tolist(), w[a:b].tolist()):
+                gm = g + wm
+                if gm < dist[m]:
+                    dist[m] = gm
+                    heapq.heappush(heap, (gm, m))
+        return np.asarray(dist, dtype=np.float64)
+
+    def shortest_many_km(self, mode: str, s: int, targets, max_km: float = math.inf) -> dict:
+        """節點 s → 多個節點（Dijkstra，全部找到或超過 max_km 就停）；{node: km}，找不到的不列。"""
+        indptr, indices, w = self._adj[mode]
+        left = set(targets)
+        out = {}
+        best = {s: 0.0}
+        heap = [(0.0, s)]
+        while heap and left:
+            g, n = heapq.heappop(heap)
+            if g > max_km:
+                break
+            if g > best.get(n, math.inf):
+                continue
+            if n in left:
+                out[n] = g
+                left.discard(n)
+            a, b = indptr[n], indptr[n + 1]
+            for m, wm in zip(indices[a:b].tolist(), w[a:b].tolist()):
+                gm = g + wm
+                if gm < best.get(m, math.inf):
+                    best[m] = gm
+                    heapq.heappush(heap, (gm, m))
+        return out
+
+
+def load_road_graph(path: str, cache_dir: str = ROAD_GRAPH_CACHE_DIR) -> RoadGraph:
+    """讀道路檔（有 .npz 快取就直接用；檔案大小 / 修改時間變了才重新解析）。"""
+    st_ = os.stat(path)
+    version = f"{_GRAPH_FORMAT}-{st_.st_size}-{st_.st_mtime_ns}"
+    art = os.path.join(cache_dir, f"{os.path.basename(path)}.{version}.npz")
+    try:
+        with np.load(art) as z:
+            parsed = {k: z[k] for k in ("lat", "lng", "u", "v", "flags")}
+    except (OSError, KeyError, ValueError):
+        parsed = parse_osm_roads(path)
+        os.makedirs(cache_dir, exist_ok=True)
+        tmp = f"{art}.{os.getpid()}.tmp.npz"
+        np.savez(tmp, **parsed)
+        os.replace(tmp, art)
+    return RoadGraph(parsed, version=version)
+
+
+# =========================
+# 3) 起點格子 → 分店 的道路距離快取（磁碟 SQLite，跨 session / 跨 process 共用）
+#    key = 道路網版本 + 交通方式 + 起點 geohash 格子 + 分店座標；走不到的存 -1
+# =========================
+class RouteCache:
+    def __init__(self, path: str = ROUTE_CACHE_PATH):
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self._local = threading.local()
+
+        db = self._db()
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute(
+            """
+            CREATE TABLE IF NOT EXISTS route_cache (
+                graph TEXT NOT NULL,
+                mode TEXT NOT NULL,
+                cell TEXT NOT NULL,
+                dest TEXT NOT NULL,
+                km REAL NOT NULL,
+                PRIMARY KEY (graph, mode, cell, dest)
+            )
+            """
+        )
+        db.commit()
+
+    def _db(self):
+        # sqlite 連線不能跨執行緒共用：每個執行緒各開一條
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=30)
+            db.execute("PRAGMA synchronous=NORMAL")
+            self._local.db = db
+        return db
+
+    def get_many(self, graph: str, mode: str, cell: str, dests: list) -> dict:
+        db = self._db()
+        marks = ",".join("?" * len(dests))
+        rows = db.execute(
+            f"SELECT dest, km FROM route_cache WHERE graph = ? AND mode = ? AND cell = ? AND dest IN ({marks})",
+            (graph, mode, cell, *dests),
+        ).fetchall()
+        out = dict(rows)
+        self.hits += len(out)
+        self.misses += len(dests) - len(out)
+        return out
+
+    def put_many(self, graph: str, mode: str, cell: str, items: dict) -> None:
+        db = self._db()
+        db.executemany(
+            "INSERT OR REPLACE INTO route_cache (graph, mode, cell, dest, km) VALUES (?, ?, ?, ?, ?)",
+            [(graph, mode, cell, dest, km) for dest, km in items.items()],
+        )
+        db.commit()
+
+    def stats(self) -> dict:
+        n = self._db().execute("SELECT COUNT(*) FROM route_cache").fetchone()[0]
+        return {"hits": self.hits, "misses": self.misses, "entries": n}
+
+
+def _dest_key(lat: float, lng: float) -> str:
+    return f"{lat:.5f},{lng:.5f}"
+
+
+class Router:
+    def __init__(self, graph: RoadGraph, cache: RouteCache = None):
+        self.graph = graph
+        self.cache = cache
+
+    def distances_km(self, mode: str, lat: float, lng: float, dests) -> list:
+        """起點 → 多個目的地 [(lat, lng), ...] 的道路距離（km）；算不出來的位置為 None。"""
+        dests = [(float(a), float(b)) for a, b in dests]
+        keys = [_dest_key(a, b) for a, b in dests]
+        cell = geohash_encode(lat, lng, ROUTE_CELL_PRECISION)
+        known = self.cache.get_many(self.graph.version, mode, cell, keys) if self.cache is not None else {}
+
+        missing = [i for i, k in enumerate(keys) if k not in known]
+        if missing:
+            found = self._route(mode, lat, lng, [dests[i] for i in missing])
+            new = {keys[i]: (-1.0 if km is None else km) for i, km in zip(missing, found)}
+            if self.cache is not None:
+                self.cache.put_many(self.graph.version, mode, cell, new)
+            known.update(new)
+        return [None if known[k] < 0 else known[k] for k in keys]
+
+    def distance_km(self, mode: str, lat1: float, lng1: float, lat2: float, lng2: float):
+        return self.distances_km(mode, lat1, lng1, [(lat2, lng2)])[0]
+
+    def path(self, mode: str, lat1: float, lng1: float, lat2: float, lng2: float):
+        """起點 → 終點的道路路線 [(lat, lng), ...]（含兩端點，不經過快取）；算不出來回傳 None。"""
+        g = self.graph
+        s, _ = g.snap(mode, lat1, lng1)
+        t, _ = g.snap(mode, lat2, lng2)
+        if s is None or t is None:
+            return None
+        nodes = g.shortest_path(mode, s, t)
+        if nodes is None:
+            return None
+        return [(lat1, lng1)] + [(float(g.lat[n]), float(g.lng[n])) for n in nodes] + [(lat2, lng2)]
+
+    def _route(self, mode: str, lat: float, lng: float, dests: list) -> list:
+        g = self.graph
+        s, s_km = g.snap(mode, lat, lng)
+        if s is None:
+            return [None] * len(dests)
+        snapped = [g.snap(mode, a, b) for a, b in dests]
+        targets = [t for t, _ in snapped if t is not None]
+        if len(targets) == 1:
+            km = g.shortest_km(mode, s, targets[0])
+            net = {} if km is None else {targets[0]: km}
+        else:
+            # 道路距離很少超過直線的 3 倍：搜到那裡還沒找到就當作不連通
+            far = max(float(haversine_km_np(lat, lng, a, b)) for a, b in dests)
+            net = g.shortest_many_km(mode, s, targets, max_km=3.0 * far + 2.0)
+        out = []
+        for t, t_km in snapped:
+            km = net.get(t) if t is not None else None
+            out.append(None if km is None else round(s_km + km + t_km, 4))
+        return out
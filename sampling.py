@@ -0,0 +1,54 @@
+# sampling.py：以「目錄列位置」抽主餐 / 油水 / 飲料 / 甜點（可重現）
+#
+# 不呼叫 streamlit。每一次抽樣都是 (seed, 用途, 編號) 的純函數：
+# 同一份目錄（catalog_version）+ 同一個 seed，就能重建任何一位學生抽到的內容，
+# 不必記錄抽樣的先後順序。每次抽樣只是在 CatalogIndex 的列位置陣列上取幾個整數。
+
+import numpy as np
+
+from catalog import CatalogIndex
+
+# 每種用途各自一條亂數串流，彼此不影響
+_FOOD, _COOK, _DRINK, _DESSERT = 1, 2, 3, 4
+_METHOD_ID = {"水煮": 0, "煎炸": 1}
+COOK_CODES = {"水煮": "1-2", "煎炸": "1-1"}
+
+
+class MealSampler:
+    """某個 session 的抽樣器：只存 seed 和（共用、唯讀的）CatalogIndex。"""
+
+    __slots__ = ("catalog", "seed")
+
+    def __init__(self, catalog: CatalogIndex, seed: int):
+        self.catalog = catalog
+        self.seed = int(seed)
+
+    def _rng(self, *ids: int) -> np.random.Generator:
+        return np.random.default_rng([self.seed, *ids])
+
+    def _sample(self, code: str, k: int, *ids: int) -> np.ndarray:
+        rows = self.catalog.rows(code)
+        k = min(k, len(rows))
+        return rows[self._rng(*ids).choice(len(rows), size=k, replace=False)]
+
+    def _pick(self, code: str, *ids: int) -> int:
+        rows = self.catalog.rows(code)
+        if len(rows) == 0:
+            raise ValueError(f"在 Excel 中找不到 code = {code} 的資料。")
+        return int(rows[self._rng(*ids).integers(len(rows))])
+
+    def meal(self, m: int, k: int = 3) -> np.ndarray:
+        """第 m 次「抽主餐」：code 1 中 k 個不重複的列。"""
+        return self._sample("1", k, _FOOD, m)
+
+    def cooking(self, m: int, dish: int, method: str) -> int:
+        """第 m 份主餐第 dish 道菜的水/油（同一種做法切回來會是同一個）。"""
+        return self._pick(COOK_CODES[method], _COOK, m, dish, _METHOD_ID[method])
+
+    def drink(self, d: int) -> int:
+        """第 d 次抽飲料（code 2）。"""
+        return self._pick("2", _DRINK, d)
+
+    def dessert_pool(self, p: int = 0, k: int = 5) -> np.ndarray:
+        """第 p 次抽甜點池：code 3 中 k 個不重複的列。"""
+        return self._sample("3", k, _DESSERT, p)
@@ -0,0 +1,386 @@
+# sheets.py：全班結果寫入 Google Sheet
+#
+# 同一個 process 共用一個已授權的 client，並記住 worksheet 與標題列，
+# 穩定狀態下每次送出只打一次 API（values.append）。
+# gc 只要有 open / open_by_key 兩個方法即可，測試時可換成本機假的後端。
+
+import re
+import json
+import time
+import hashlib
+import random
+import sqlite3
+import threading
+
+SCOPES = [
+    "https://www.googleapis.com/auth/spreadsheets",
+    "https://www.googleapis.com/auth/drive",
+]
+RESULTS_WORKSHEET = "results"
+
+_RE_SHEET_URL = re.compile(r"/spreadsheets/d/([a-zA-Z0-9_-]+)")
+_RE_SHEET_KEY = re.compile(r"[a-zA-Z0-9_-]{30,}")
+
+
+def sheet_key_from_ref(ref: str):
+    """試著從「網址或 ID」取出 spreadsheet key；若只是檔名就回傳 None。"""
+    ref = (ref or "").strip()
+    m = _RE_SHEET_URL.search(ref)
+    if m:
+        return m.group(1)
+    if _RE_SHEET_KEY.fullmatch(ref):
+        return ref
+    return None
+
+
+def _is_stale_handle_error(e: Exception) -> bool:
+    if type(e).__name__ in ("WorksheetNotFound", "SpreadsheetNotFound"):
+        return True
+    status = getattr(getattr(e, "response", None), "status_code", None)
+    return status in (400, 404)
+
+
+class SheetsClient:
+    def __init__(self, gc, worksheet_title: str = RESULTS_WORKSHEET):
+        self.gc = gc
+        self.worksheet_title = worksheet_title
+        self._lock = threading.Lock()
+        self._keys = {}     # 檔名 → spreadsheet key（只用檔名搜尋 Drive 一次）
+        self._ws = {}       # key → worksheet
+        self._header = {}   # key → 標題列（list）
+        self.api_calls = 0  # 粗略統計（方便看 quota 用量）
+
+    @classmethod
+    def from_service_account_info(cls, info: dict, **kwargs) -> "SheetsClient":
+        # 延遲 import（避免沒裝套件或沒 secrets 就爆）
+        import gspread
+        from google.oauth2.service_account import Credentials
+
+        creds = Credentials.from_service_account_info(dict(info), scopes=SCOPES)
+        return cls(gspread.authorize(creds), **kwargs)
+
+    def invalidate(self, sheet_ref: str = None, forget_key: bool = False) -> None:
+        with self._lock:
+            if sheet_ref is None:
+                self._keys.clear()
+                self._ws.clear()
+                self._header.clear()
+                return
+            key = sheet_key_from_ref(sheet_ref) or self._keys.get(sheet_ref)
+            if forget_key:
+                self._keys.pop(sheet_ref, None)
+            self._ws.pop(key, None)
+            self._header.pop(key, None)
+
+    def _worksheet(self, sheet_ref: str):
+        key = sheet_key_from_ref(sheet_ref) or self._keys.get(sheet_ref)
+        if key is not None and key in self._ws:
+            return key, self._ws[key], self._header[key]
+
+        if key is not None:
+            sh = self.gc.open_by_key(key)
+        else:
+            sh = self.gc.open(sheet_ref)  # 檔名搜尋（Drive API），只在第一次
+            key = sh.id
+        self.api_calls += 1
+        try:
+            ws = sh.worksheet(self.worksheet_title)
+        except Exception:
+            ws = sh.add_worksheet(title=self.worksheet_title, rows=1000, cols=50)
+        self.api_calls += 1
+        header = list(ws.row_values(1))
+        self.api_calls += 1
+
+        with self._lock:
+            if key != sheet_ref:
+                self._keys[sheet_ref] = key
+            self._ws[key] = ws
+            self._header[key] = header
+        return key, ws, header
+
+    def append_row(self, sheet_ref: str, row: dict) -> None:
+        self.append_rows(sheet_ref, [row])
+
+    def append_rows(self, sheet_ref: str, rows: list) -> None:
+        if not rows:
+            return
+        try:
+            self._append(sheet_ref, rows)
+        except Exception as e:
+            if not _is_stale_handle_error(e):
+                raise
+            # worksheet 被刪/改名：丟掉快取重抓一次（429 等 quota 錯誤直接往外丟，不要再多打 API）
+            # 整份 spreadsheet 找不到時，連「檔名 → key」也重新搜尋
+            self.invalidate(sheet_ref, forget_key=type(e).__name__ == "SpreadsheetNotFound")
+            self._append(sheet_ref, rows)
+
+    def _append(self, sheet_ref: str, rows: list) -> None:
+        key, ws, header = self._worksheet(sheet_ref)
+        values = []
+        if not header:
+            # 空白工作表：標題列和資料一次寫入
+            header = list(dict.fromkeys(k for row in rows for k in row))
+            values.append(header)
+        else:
+            # 舊的 Sheet 沒有新欄位（例如後來加的 catalog_version / sample_key）：
+            # 標題列補到最後面再寫，不然這些欄位會被默默丟掉；只有出現新欄位時才多打一次 API
+            new = [k for k in dict.fromkeys(k for row in rows for k in row) if k not in header]
+            if new:
+                header = header + new
+                ws.update(range_name="A1", values=[header])
+                self.api_calls += 1
+        # 以 header 順序寫；缺的留空
+        values.extend([row.get(k, "") for k in header] for row in rows)
+        if len(values) == 1:
+            ws.append_row(values[0])
+        else:
+            ws.append_rows(values)
+        with self._lock:
+            self._header[key] = header
+        self.api_calls += 1
+
+
+# =========================
+# 送出暫存區（outbox）：先寫本機 SQLite（WAL），背景執行緒再批次寫入 Sheet
+#   - 送出 = 一次本機磁碟寫入，Sheet 掛掉/超過 quota 也不會遺失
+#   - 以 (sheet, device_id, sample_key, 內容) 去重；同一筆按兩次（或 rerun 後再按）只會排一次
+#   - 失敗時指數退避；連續失敗 max_attempts 次（Sheet ID 錯、沒有權限…）就標記為失敗、不再重試
+#   - 多個 process 共用同一個檔案時以租約（lease）避免重複送
+#   - 寫入 Sheet 成功但尚未標記前 process 掛掉，重啟後會再送一次（at-least-once）
+#   - 已送出的列保留 keep_sent 秒（這段期間內仍會去重）之後刪掉，檔案不會一直長大
+# =========================
+OUTBOX_PATH = "results_outbox.sqlite3"
+# 每次 rerun 都會重算、不代表「另一筆結果」的欄位，不列入去重
+DEDUP_IGNORE = ("timestamp",)
+
+
+def dedup_key_of(sheet_ref: str, row: dict) -> str:
+    stable = {k: v for k, v in row.items() if k not in DEDUP_IGNORE}
+    digest = hashlib.sha1(json.dumps(stable, sort_keys=True, ensure_ascii=False, default=str).encode("utf-8")).hexdigest()
+    return f"{sheet_ref}|{row.get('device_id', '')}|{row.get('sample_key', '')}|{digest[:16]}"
+
+
+class ResultOutbox:
+    def __init__(
+        self,
+        path: str = OUTBOX_PATH,
+        client_factory=None,
+        batch_size: int = 100,
+        batch_window: float = 2.0,
+        backoff_base: float = 2.0,
+        backoff_max: float = 300.0,
+        lease_seconds: float = 60.0,
+        max_attempts: int = 10,
+        keep_sent: float = 7 * 86400.0,
+    ):
+        self.path = path
+        self.client_factory = client_factory
+        self.batch_size = batch_size
+        self.batch_window = batch_window
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.keep_sent = keep_sent
+        self._client = None
+        self._local = threading.local()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._last_prune = 0.0
+
+        db = self._db()
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute(
+            """
+            CREATE TABLE IF NOT EXISTS outbox (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                sheet_ref TEXT NOT NULL,
+                dedup_key TEXT NOT NULL UNIQUE,
+                row_json TEXT NOT NULL,
+                created REAL NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                next_try REAL NOT NULL DEFAULT 0,
+                lease_until REAL NOT NULL DEFAULT 0,
+                sent REAL,
+                last_error TEXT,
+                device_id TEXT NOT NULL DEFAULT '',
+                failed REAL
+            )
+            """
+        )
+        # 舊版建立的檔案沒有 device_id / failed 欄：補上（device_id 從 row_json 取出）
+        cols = {r[1] for r in db.execute("PRAGMA table_info(outbox)")}
+        if "device_id" not in cols:
+            db.execute("ALTER TABLE outbox ADD COLUMN device_id TEXT NOT NULL DEFAULT ''")
+            db.execute("UPDATE outbox SET device_id = COALESCE(json_extract(row_json, '$.device_id'), '')")
+        if "failed" not in cols:
+            db.execute("ALTER TABLE outbox ADD COLUMN failed REAL")
+        db.execute("CREATE INDEX IF NOT EXISTS outbox_pending ON outbox (sent, next_try)")
+        db.execute("CREATE INDEX IF NOT EXISTS outbox_device ON outbox (device_id)")
+        db.commit()
+
+    def _db(self):
+        # sqlite 連線不能跨執行緒共用：每個執行緒各開一條
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=30)
+            db.execute("PRAGMA synchronous=NORMAL")
+            self._local.db = db
+        return db
+
+    def enqueue(self, sheet_ref: str, row: dict) -> bool:
+        """寫入本機暫存；回傳 False 代表同一筆（同裝置、同 sample_key、同內容）已經排過。"""
+        db = self._db()
+        cur = db.execute(
+            "INSERT OR IGNORE INTO outbox (sheet_ref, dedup_key, row_json, created, device_id) VALUES (?, ?, ?, ?, ?)",
+            (sheet_ref, dedup_key_of(sheet_ref, row), json.dumps(row, ensure_ascii=False), time.time(), str(row.get("device_id", ""))),
+        )
+        db.commit()
+        self._wake.set()
+        return cur.rowcount == 1
+
+    def status(self, device_id: str = None) -> dict:
+        """{"pending", "sent", "failed", "last_error"}；sent 只算還保留著的（keep_sent 內）。"""
+        sql = """
+            SELECT CASE WHEN sent IS NOT NULL THEN 'sent' WHEN failed IS NOT NULL THEN 'failed' ELSE 'pending' END AS state,
+                COUNT(*), MAX(last_error)
+            FROM outbox
+        """
+        args = ()
+        if device_id is not None:
+            sql += " WHERE device_id = ?"
+            args = (device_id,)
+        out = {"pending": 0, "sent": 0, "failed": 0, "last_error": None}
+        errors = {}
+        for state, n, err in self._db().execute(sql + " GROUP BY state", args):
+            out[state] = n
+            errors[state] = err
+        out["last_error"] = errors.get("pending") or errors.get("failed")
+        return out
+
+    def retry_failed(self, device_id: str = None) -> int:
+        """把標記為失敗的列放回佇列（例如修好 Sheet 權限之後）；回傳幾筆。"""
+        sql = "UPDATE outbox SET failed = NULL, attempts = 0, next_try = 0 WHERE sent IS NULL AND failed IS NOT NULL"
+        args = ()
+        if device_id is not None:
+            sql += " AND device_id = ?"
+            args = (device_id,)
+        db = self._db()
+        n = db.execute(sql, args).rowcount
+        db.commit()
+        if n:
+            self._wake.set()
+        return n
+
+    def prune(self, now: float = None) -> int:
+        """刪掉送出超過 keep_sent 秒的列；回傳幾筆。"""
+        now = time.time() if now is None else now
+        db = self._db()
+        n = db.execute("DELETE FROM outbox WHERE sent IS NOT NULL AND sent < ?", (now - self.keep_sent,)).rowcount
+        db.commit()
+        return n
+
+    def _lease_batch(self, now: float):
+        # BEGIN IMMEDIATE：同一時間只有一個 process 能拿到同一批
+        db = self._db()
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            rows = db.execute(
+                """
+                SELECT id, sheet_ref, row_json FROM outbox
+                WHERE sent IS NULL AND failed IS NULL AND next_try <= ? AND lease_until <= ?
+                ORDER BY id LIMIT ?
+                """,
+                (now, now, self.batch_size),
+            ).fetchall()
+            if rows:
+                db.executemany(
+                    "UPDATE outbox SET lease_until = ? WHERE id = ?",
+                    [(now + self.lease_seconds, r[0]) for r in rows],
+                )
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        return rows
+
+    def drain_once(self) -> int:
+        """把到期的暫存資料依 sheet 分組，各用一次 append_rows 送出；回傳成功筆數。"""
+        now = time.time()
+        rows = self._lease_batch(now)
+        if not rows:
+            return 0
+
+        groups = {}
+        for rid, sheet_ref, row_json in rows:
+            groups.setdefault(sheet_ref, []).append((rid, json.loads(row_json)))
+
+        db = self._db()
+        done = 0
+        for sheet_ref, items in groups.items():
+            ids = [(rid,) for rid, _ in items]
+            try:
+                if self._client is None:
+                    self._client = self.client_factory()
+                self._client.append_rows(sheet_ref, [row for _, row in items])
+            except Exception as e:
+                # 指數退避：2, 4, 8 ... 秒（上限 backoff_max），整批共用一個亂數，之後仍一起重送
+                # 第 max_attempts 次還失敗：標記 failed，不再重試（status() 會顯示）
+                jitter = 0.75 + 0.5 * random.random()
+                db.executemany(
+                    """
+                    UPDATE outbox SET attempts = attempts + 1, lease_until = 0, last_error = ?,
+                        next_try = ? + MIN(?, ? * (1 << MIN(attempts, 16))) * ?,
+                        failed = CASE WHEN attempts + 1 >= ? THEN ? ELSE NULL END
+                    WHERE id = ?
+                    """,
+                    [
+                        (repr(e)[:500], now, self.backoff_max, self.backoff_base, jitter, self.max_attempts, now, rid)
+                        for (rid,) in ids
+                    ],
+                )
+                db.commit()
+                continue
+            db.executemany("UPDATE outbox SET sent = ?, lease_until = 0, last_error = NULL WHERE id = ?", [(time.time(), rid) for (rid,) in ids])
+            db.commit()
+            done += len(ids)
+        return done
+
+    def start(self) -> "ResultOutbox":
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name="result-outbox", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._wake.set()
+
+    def _seconds_until_due(self) -> float:
+        row = self._db().execute(
+            "SELECT MIN(MAX(next_try, lease_until)) FROM outbox WHERE sent IS NULL AND failed IS NULL"
+        ).fetchone()
+        if row[0] is None:
+            return 5.0
+        return min(5.0, max(0.0, row[0] - time.time()))
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            # 平常最多 5 秒看一次（補送退避中的/其他 process 留下的）；有新資料就等 batch_window 收集同一波送出
+            try:
+                timeout = self._seconds_until_due()
+            except Exception:
+                timeout = 5.0
+            woke = self._wake.wait(timeout=timeout)
+            if woke:
+                self._wake.clear()
+                self._stop.wait(self.batch_window)
+            try:
+                while self.drain_once() >= self.batch_size:
+                    pass
+                if time.time() - self._last_prune > 3600:
+                    self._last_prune = time.time()
+                    self.prune()
+            except Exception:
+                time.sleep(1.0)  # DB 忙碌等暫時性錯誤：下一輪再試
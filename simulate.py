@@ -0,0 +1,162 @@
+# simulate.py：蒙地卡羅模擬「所有可能的一餐」碳足跡分布（教師課堂討論用）
+#
+# 不呼叫 streamlit。抽法與 app 相同：
+#   主餐 3 項（code 1，不重複）、每道菜水煮/煎炸再隨機挑水/油、飲料可喝可不喝、
+#   甜點 2 種（code 3，不重複）、餐具包材每項各自可選可不選。
+# 交通 / 帶回交通跟每位學生的位置有關，不在模擬範圍（比較時學生的數字也要扣掉）。
+# 同一組 (catalog_version, n, seed, 參數) 一定得到同一份結果，與行程數無關。
+
+import os
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from catalog import CatalogIndex
+from footprint import CATEGORIES, NO_ROW, MealFootprint
+
+SIM_CHUNK = 250_000  # 每塊最多幾餐（控制暫存記憶體；也是分給子行程的單位）
+# 子行程：streamlit server 裡同時只開一組、最多 SIM_WORKERS 個（環境變數可改）；
+# 開 spawn 子行程本身要 1 秒多，少於 SIM_POOL_MIN_N 餐直接在本行程算比較快
+# （app 的滑桿最大是 3,000,000 餐：選最大那一檔才會分給子行程）
+SIM_WORKERS = max(1, int(os.environ.get("SIM_WORKERS", "2")))
+SIM_POOL_MIN_N = 3_000_000
+_POOL_SLOT = threading.BoundedSemaphore(1)
+_QGRID = np.linspace(0.0, 100.0, 1001)
+
+
+class SimSpec:
+    """模擬要用的查表資料：全是小陣列，可以 pickle 給子行程。"""
+
+    __slots__ = ("version", "footprint", "food", "oil", "water", "drink", "dessert", "packaging", "p_fry", "p_drink", "p_packaging")
+
+    def __init__(self, footprint, food, oil, water, drink, dessert, packaging, p_fry=0.5, p_drink=0.5, p_packaging=0.2):
+        self.version = footprint.version
+        self.footprint = footprint
+        self.food = np.asarray(food, dtype=np.intp)
+        self.oil = np.asarray(oil, dtype=np.intp)
+        self.water = np.asarray(water, dtype=np.intp)
+        self.drink = np.asarray(drink, dtype=np.intp)
+        self.dessert = np.asarray(dessert, dtype=np.intp)
+        self.packaging = np.asarray(packaging, dtype=np.intp)
+        self.p_fry = p_fry              # 每道菜選煎炸的機率
+        self.p_drink = p_drink          # 有喝飲料的機率
+        self.p_packaging = p_packaging  # 每項餐具/包材被選的機率
+
+    @classmethod
+    def from_catalog(cls, cat: CatalogIndex, packaging_codes=("4-1", "4-2", "4-3", "4-4", "4-5", "4-6"), **params) -> "SimSpec":
+        return cls(
+            MealFootprint(cat),
+            food=cat.rows("1"),
+            oil=cat.rows("1-1"),
+            water=cat.rows("1-2"),
+            drink=cat.rows("2"),
+            dessert=cat.rows("3"),
+            packaging=cat.rows(*packaging_codes),
+            **params,
+        )
+
+    def params(self) -> tuple:
+        return (self.p_fry, self.p_drink, self.p_packaging)
+
+
+class SimResult:
+    """模擬結果摘要（分位數 + 直方圖），小到可以放進 st.cache_data。"""
+
+    __slots__ = ("version", "n", "seed", "mean", "category_means", "quantiles", "edges", "counts")
+
+    def __init__(self, version, n, seed, mean, category_means, quantiles, edges, counts):
+        self.version = version
+        self.n = n
+        self.seed = seed
+        self.mean = mean
+        self.category_means = category_means  # dict：CATEGORIES → 平均 kgCO2e
+        self.quantiles = quantiles            # 0.0, 0.1, ..., 100.0 百分位的值
+        self.edges = edges                    # 直方圖邊界（最後一格含更高的值）
+        self.counts = counts
+
+    def percentile(self, q: float) -> float:
+        return float(np.interp(q, _QGRID, self.quantiles))
+
+    def percentile_of(self, total: float) -> float:
+        """total 在分布中的百分位（0~100）。"""
+        return float(np.interp(total, self.quantiles, _QGRID))
+
+
+def _pick(rng, pool: np.ndarray, shape) -> np.ndarray:
+    if len(pool) == 0:
+        return np.full(shape, NO_ROW, dtype=np.intp)
+    return pool[rng.integers(0, len(pool), size=shape)]
+
+
+def _draw_distinct(rng, pool: np.ndarray, n: int, k: int) -> np.ndarray:
+    """每列從 pool 抽 k 個不重複：先可重複地抽，再只把有重複的列重抽。"""
+    k = min(k, len(pool))
+    idx = rng.integers(0, max(len(pool), 1), size=(n, k))
+    while k > 1:
+        s = np.sort(idx, axis=1)
+        dup = (s[:, 1:] == s[:, :-1]).any(axis=1)
+        if not dup.any():
+            break
+        idx[dup] = rng.integers(0, len(pool), size=(int(dup.sum()), k))
+    return pool[idx]
+
+
+def _simulate_chunk(spec: SimSpec, n: int, seed) -> tuple:
+    rng = np.random.default_rng(seed)
+    food = _draw_distinct(rng, spec.food, n, 3)
+    fry = rng.random(food.shape) < spec.p_fry
+    cooking = np.where(fry, _pick(rng, spec.oil, food.shape), _pick(rng, spec.water, food.shape))
+    drink = np.where(rng.random(n) < spec.p_drink, _pick(rng, spec.drink, n), NO_ROW)
+    dessert = _draw_distinct(rng, spec.dessert, n, 2)
+    chosen = rng.random((n, len(spec.packaging))) < spec.p_packaging
+    packaging = np.where(chosen, spec.packaging, NO_ROW)
+
+    out = spec.footprint.batch(food, cooking, drink, dessert, packaging)
+    return out.sum(axis=1).astype(np.float32), out.sum(axis=0)
+
+
+def simulate_meals(spec: SimSpec, n: int, seed: int = 0, processes: int = None, bins: int = 60) -> SimResult:
+    """模擬 n 餐；n 大於 SIM_CHUNK 時分塊。
+
+    processes：子行程數（None = n 夠大才用 min(SIM_WORKERS, CPU 數) 個，否則本行程算）；
+    別的模擬正在用子行程時，這一次改在本行程算，不會疊加開更多行程。
+    """
+    sizes = [SIM_CHUNK] * (n // SIM_CHUNK) + ([n % SIM_CHUNK] if n % SIM_CHUNK else [])
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    if processes is None:
+        processes = min(SIM_WORKERS, os.cpu_count() or 1) if n >= SIM_POOL_MIN_N else 1
+    workers = min(processes, len(sizes))
+
+    parts = None
+    if workers > 1 and _POOL_SLOT.acquire(blocking=False):
+        try:
+            # spawn：streamlit server 本身有很多執行緒，fork 容易卡死
+            ctx = multiprocessing.get_context("spawn")
+            with ProcessPoolExecutor(max_workers=workers, mp_context=ctx) as ex:
+                parts = list(ex.map(_simulate_chunk, [spec] * len(sizes), sizes, seeds))
+        finally:
+            _POOL_SLOT.release()
+    if parts is None:
+        parts = [_simulate_chunk(spec, k, s) for k, s in zip(sizes, seeds)]
+
+    totals = np.concatenate([p[0] for p in parts])
+    cat_sums = np.sum([p[1] for p in parts], axis=0)
+
+    quantiles = np.quantile(totals, _QGRID / 100.0)
+    # 直方圖畫到 99.5 百分位，更高的長尾併進最後一格（不然圖會被少數極端值壓扁）
+    hi = float(np.quantile(totals, 0.995))
+    lo = float(quantiles[0])
+    counts, edges = np.histogram(np.minimum(totals, hi), bins=bins, range=(lo, max(hi, lo + 1e-9)))
+
+    return SimResult(
+        version=spec.version,
+        n=n,
+        seed=seed,
+        mean=float(totals.mean(dtype=np.float64)),
+        category_means=dict(zip(CATEGORIES, (cat_sums / n).tolist())),
+        quantiles=quantiles.astype(np.float64),
+        edges=edges,
+        counts=counts,
+    )
@@ -0,0 +1,173 @@
+# takeout.py：分店 → 校區 的帶回距離表（事先算好、存檔；第二階段只查陣列）
+#
+# 不呼叫 streamlit。帶回的終點是固定的幾個校區、分店是離線分店檔裡的那幾家，
+# 所以「每家分店 → 每個校區 × 每種交通方式」的距離可以一次算完：
+#   - 有道路網（routing.RoadGraph）：每個 (校區, 交通方式) 在反向圖上跑一次 Dijkstra，所有分店一起得到
+#   - 沒有道路網、或某家分店接不上路：用直線距離（on_road = False）
+# 結果是 (分店, 校區, 交通方式) 的 float32 陣列，以分店編號（PoiIndex 的列位置 poi_id）查；
+# 存成 .npz（key = 分店座標 + 校區 + 道路網版本），重開 server 直接讀檔。
+# 整張圖的 Dijkstra 是純 Python（1 萬多個節點約 0.5 秒 × 交通方式 × 校區），不放在請求裡算：
+#   - 部署前先算好：python takeout.py build（與 app 用同樣的分店檔 / 道路檔，算出同一個 .npz）
+#   - 沒有事先算好：app 用 TakeoutTableBuilder 在背景執行緒算，算好之前帶回距離先用 Router / 直線距離
+
+from __future__ import annotations
+
+import os
+import json
+import hashlib
+import argparse
+import threading
+
+import numpy as np
+
+from geo import distance_matrix_km
+from routing import MODES
+
+TAKEOUT_CACHE_DIR = ".takeout_cache"
+_TABLE_FORMAT = 1
+
+# 帶回的終點（名稱 -> 座標）；app 與 python takeout.py build 共用
+CAMPUSES = {"台中教育大學": (24.1477, 120.6736)}
+
+
+# =========================
+# 1) 距離表
+# =========================
+class TakeoutTable:
+    __slots__ = ("version", "campuses", "lat", "lng", "km", "on_road")
+
+    def __init__(self, version: str, campuses: dict, lat, lng, km, on_road):
+        self.version = version
+        self.campuses = dict(campuses)  # 校區名稱 -> (lat, lng)
+        self.lat = lat                  # (n,) 分店座標，用來確認 poi_id 還對得上
+        self.lng = lng
+        self.km = km                    # (n, 校區數, 交通方式數) float32
+        self.on_road = on_road          # 同 shape；False = 直線距離
+
+    def __len__(self) -> int:
+        return len(self.lat)
+
+    def lookup(self, branch_id, lat: float, lng: float, campus: str, mode: str):
+        """(km, 是否為道路距離)；分店不在表裡（線上搜尋到的、或分店檔已更新）回傳 None。"""
+        if branch_id is None or not 0 <= branch_id < len(self) or campus not in self.campuses:
+            return None
+        if abs(self.lat[branch_id] - lat) > 1e-6 or abs(self.lng[branch_id] - lng) > 1e-6:
+            return None
+        c = list(self.campuses).index(campus)
+        m = MODES.index(mode)
+        return float(self.km[branch_id, c, m]), bool(self.on_road[branch_id, c, m])
+
+    def column(self, campus: str, mode: str) -> tuple:
+        """所有分店到 campus 的 (km, on_road) 陣列（教師比較用）。"""
+        c = list(self.campuses).index(campus)
+        m = MODES.index(mode)
+        return self.km[:, c, m], self.on_road[:, c, m]
+
+
+# =========================
+# 2) 計算 / 存檔
+# =========================
+def build_takeout_table(lat, lng, campuses: dict, graph=None, version: str = "") -> TakeoutTable:
+    lat = np.ascontiguousarray(lat, dtype=np.float64)
+    lng = np.ascontiguousarray(lng, dtype=np.float64)
+    dests = np.array(list(campuses.values()), dtype=np.float64).reshape(-1, 2)
+    straight = distance_matrix_km(np.column_stack([lat, lng]), dests)  # (n, 校區數)
+    km = np.repeat(straight[:, :, None], len(MODES), axis=2).astype(np.float32)
+    on_road = np.zeros(km.shape, dtype=bool)
+
+    if graph is not None and len(lat):
+        for m, mode in enumerate(MODES):
+            snapped = [graph.snap(mode, a, b) for a, b in zip(lat.tolist(), lng.tolist())]
+            ok = np.array([n is not None for n, _ in snapped])
+            nodes = np.array([n if n is not None else 0 for n, _ in snapped], dtype=np.int64)
+            access = np.array([d if d is not None else 0.0 for _, d in snapped])
+            for c, (c_lat, c_lng) in enumerate(dests.tolist()):
+                t, t_km = graph.snap(mode, c_lat, c_lng)
+                if t is None:
+                    continue
+                road = access + graph.distances_to(mode, t)[nodes] + t_km
+                good = ok & np.isfinite(road)
+                km[good, c, m] = road[good]
+                on_road[good, c, m] = True
+
+    return TakeoutTable(version, campuses, lat, lng, km, on_road)
+
+
+def takeout_table_version(lat, lng, campuses: dict, graph_version: str = "") -> str:
+    h = hashlib.sha1()
+    h.update(np.ascontiguousarray(lat, dtype=np.float64).tobytes())
+    h.update(np.ascontiguousarray(lng, dtype=np.float64).tobytes())
+    h.update(json.dumps([_TABLE_FORMAT, list(campuses.items()), graph_version], ensure_ascii=False).encode("utf-8"))
+    return h.hexdigest()[:16]
+
+
+def load_takeout_table(lat, lng, campuses: dict, graph=None, cache_dir: str = TAKEOUT_CACHE_DIR) -> TakeoutTable:
+    """有存檔就讀檔；分店、校區或道路網變了才重新計算。"""
+    version = takeout_table_version(lat, lng, campuses, getattr(graph, "version", ""))
+    path = os.path.join(cache_dir, f"takeout-{version}.npz")
+    try:
+        with np.load(path) as z:
+            return TakeoutTable(version, campuses, z["lat"], z["lng"], z["km"], z["on_road"])
+    except (OSError, KeyError, ValueError):
+        pass
+    table = build_takeout_table(lat, lng, campuses, graph, version)
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp.npz"
+    np.savez(tmp, lat=table.lat, lng=table.lng, km=table.km, on_road=table.on_road)
+    os.replace(tmp, path)
+    return table
+
+
+# =========================
+# 3) 背景計算（app 用；第一次用到時開始，不擋住請求）
+# =========================
+class TakeoutTableBuilder:
+    """背景執行緒呼叫 build() 一次；算好之前 table 為 None，失敗時 error 為錯誤訊息。"""
+
+    def __init__(self, build):
+        self.table = None
+        self.error = None
+        self._build = build
+        self._thread = None
+
+    def start(self) -> "TakeoutTableBuilder":
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="takeout-table", daemon=True)
+            self._thread.start()
+        return self
+
+    def _run(self) -> None:
+        try:
+            self.table = self._build()
+        except Exception as e:
+            self.error = str(e)  # 例如分店檔格式不對：一直用 Router / 直線距離
+
+    def wait(self, timeout: float = None):
+        if self._thread is not None:
+            self._thread.join(timeout)
+        return self.table
+
+
+# =========================
+# 4) 指令列：部署前先算好距離表
+# =========================
+def main(argv=None):
+    from geo import POI_PATH_DEFAULT, PoiIndex, load_poi_file
+    from routing import ROAD_GRAPH_PATH_DEFAULT, load_road_graph
+
+    ap = argparse.ArgumentParser(description="分店 → 校區 帶回距離表")
+    ap.add_argument("--cache", default=TAKEOUT_CACHE_DIR)
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    bp = sub.add_parser("build")
+    bp.add_argument("--poi", default=POI_PATH_DEFAULT)
+    bp.add_argument("--roads", default=os.environ.get("ROAD_GRAPH_FILE", ROAD_GRAPH_PATH_DEFAULT))
+    args = ap.parse_args(argv)
+
+    poi = PoiIndex(load_poi_file(args.poi))
+    graph = load_road_graph(args.roads) if os.path.exists(args.roads) else None
+    table = load_takeout_table(poi.lat, poi.lng, CAMPUSES, graph, cache_dir=args.cache)
+    print(f"{len(table)} 家分店 × {len(CAMPUSES)} 個校區；道路距離 {int(table.on_road.sum())} / {table.on_road.size}；版本 {table.version}")
+
+
+if __name__ == "__main__":
+    main()
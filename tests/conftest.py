@@ -0,0 +1,59 @@
+# 測試共用設定：repo 根目錄的模組（catalog.py、geo.py …）直接 import
+import os
+import sys
+
+import pytest
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
+
+
+@pytest.fixture(autouse=True)
+def _keep_main_module(monkeypatch):
+    # AppTest 跑腳本時會把 sys.modules["__main__"] 換成該腳本且不換回；
+    # 之後 simulate.py 的 spawn 子程序會重跑那份腳本。每個測試結束都還原
+    monkeypatch.setitem(sys.modules, "__main__", sys.modules["__main__"])
+
+
+def make_columns(rows):
+    """[(code, 品名, cf_kg, 宣告單位), ...] → catalog.CatalogColumns（測試用的小目錄）。"""
+    import numpy as np
+    from catalog import CatalogColumns
+
+    code, name, kg, unit = zip(*rows)
+    g = np.array(kg, dtype="float64") * 1000.0
+    return CatalogColumns(
+        code=np.array(code, dtype=str),
+        product_name=np.array(name, dtype=str),
+        product_carbon_footprint_data=np.array([f"{v:.2f}kg" for v in kg], dtype=str),
+        declared_unit=np.array(unit, dtype=str),
+        cf_gco2e=g,
+        cf_kgco2e=g / 1000.0,
+    )
+
+
+SMALL_CATALOG = [
+    ("1", "白飯", 0.5, "每碗"),
+    ("1-1", "沙拉油", 0.05, "每匙"),
+    ("2", "紅茶", 0.2, "每杯"),
+    ("1", "雞腿", 1.8, "每隻"),
+    ("1-2", "自來水", 0.001, "每杯"),
+    ("3", "布丁", 0.3, "每個"),
+    ("1", "高麗菜", 0.1, "每份"),
+    ("4-1", "紙盒", 0.04, "每個"),
+    ("3", "蛋糕", 0.9, "每片"),
+]
+
+
+def write_workbook(path, rows, header=("code", "product_name", "product_carbon_footprint_data", "declared_unit")):
+    """把 [(code, 品名, 碳足跡, 宣告單位), ...] 寫成 .xlsx（第一列為 header）。"""
+    from openpyxl import Workbook
+
+    wb = Workbook()
+    ws = wb.active
+    ws.append(list(header))
+    for r in rows:
+        ws.append(list(r)[: len(header)])
+    wb.save(path)
+    return str(path)
@@ -0,0 +1,95 @@
+# 本機假的 gspread 後端（記憶體裡的 spreadsheet / worksheet），給 sheets.py 的測試用
+#
+# 只實作 SheetsClient 用到的方法：client.open / open_by_key、spreadsheet.worksheet / add_worksheet、
+# worksheet.row_values / append_row / append_rows / update；每個呼叫都記在 client.calls 方便數 API 次數。
+# 例外名稱與 gspread 相同（SheetsClient 用類別名稱判斷要不要丟掉快取重抓）。
+
+from collections import Counter
+
+
+class WorksheetNotFound(Exception):
+    pass
+
+
+class SpreadsheetNotFound(Exception):
+    pass
+
+
+class FakeWorksheet:
+    def __init__(self, client, title: str):
+        self.client = client
+        self.title = title
+        self.rows = []
+        self.deleted = False
+
+    def _call(self, name):
+        self.client.calls[name] += 1
+        if self.deleted:
+            raise WorksheetNotFound(self.title)
+
+    def row_values(self, i: int) -> list:
+        self._call("row_values")
+        return list(self.rows[i - 1]) if len(self.rows) >= i else []
+
+    def append_row(self, values) -> None:
+        self._call("append_row")
+        self.rows.append(list(values))
+
+    def append_rows(self, values) -> None:
+        self._call("append_rows")
+        self.rows.extend(list(v) for v in values)
+
+    def update(self, values=None, range_name=None) -> None:
+        # 只支援 SheetsClient 改標題列用的 "A1"（gspread 6 的參數順序；呼叫端用關鍵字）
+        self._call("update")
+        assert range_name == "A1"
+        if not self.rows:
+            self.rows.append([])
+        self.rows[0] = list(values[0])
+
+
+class FakeSpreadsheet:
+    def __init__(self, client, key: str, title: str):
+        self.client = client
+        self.id = key
+        self.title = title
+        self.sheets = {}
+
+    def worksheet(self, title: str) -> FakeWorksheet:
+        self.client.calls["worksheet"] += 1
+        ws = self.sheets.get(title)
+        if ws is None:
+            raise WorksheetNotFound(title)
+        return ws
+
+    def add_worksheet(self, title: str, rows: int, cols: int) -> FakeWorksheet:
+        self.client.calls["add_worksheet"] += 1
+        ws = self.sheets[title] = FakeWorksheet(self.client, title)
+        return ws
+
+    def delete(self, title: str) -> None:
+        self.sheets.pop(title).deleted = True
+
+
+class FakeClient:
+    def __init__(self):
+        self.calls = Counter()
+        self.files = {}  # key -> FakeSpreadsheet
+
+    def create(self, title: str, key: str) -> FakeSpreadsheet:
+        sh = self.files[key] = FakeSpreadsheet(self, key, title)
+        return sh
+
+    def open(self, title: str) -> FakeSpreadsheet:
+        self.calls["open"] += 1
+        for sh in self.files.values():
+            if sh.title == title:
+                return sh
+        raise SpreadsheetNotFound(title)
+
+    def open_by_key(self, key: str) -> FakeSpreadsheet:
+        self.calls["open_by_key"] += 1
+        sh = self.files.get(key)
+        if sh is None:
+            raise SpreadsheetNotFound(key)
+        return sh
@@ -0,0 +1,276 @@
+# tomato_egg_app.py 的整頁煙霧測試（streamlit.testing.v1.AppTest）
+#
+# app 的各種快取檔（.geo_cache.sqlite3、results_outbox.sqlite3 …）都用相對路徑：
+# 整個模組在暫存資料夾裡跑，裡面放一份目錄 Excel、幾家離線分店，和台中教育大學附近的棋盤道路網。
+import os
+import re
+import json
+import pickle
+import shutil
+import importlib.util
+
+import pytest
+
+from conftest import REPO_ROOT
+from simulate import SIM_POOL_MIN_N
+
+streamlit = pytest.importorskip("streamlit")
+from streamlit.testing.v1 import AppTest  # noqa: E402
+
+APP = os.path.join(REPO_ROOT, "tomato_egg_app.py")
+WORKBOOK = "產品碳足跡3.xlsx"
+
+
+@pytest.fixture(scope="module")
+def app_dir(tmp_path_factory):
+    d = tmp_path_factory.mktemp("app")
+    shutil.copy(os.path.join(REPO_ROOT, WORKBOOK), d / WORKBOOK)
+    (d / "stores_taichung.csv").write_text(
+        "name,brand,lat,lng\n全聯一店,全聯,24.1420,120.6690\n全聯二店,全聯,24.1530,120.6650\n", encoding="utf-8"
+    )
+    spec = importlib.util.spec_from_file_location("bench_routing", os.path.join(REPO_ROOT, "benchmarks", "bench_routing.py"))
+    bench_routing = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(bench_routing)
+    bench_routing.write_grid_osm(str(d / "roads_taichung.osm"), 60)  # 24.10~24.16, 120.62~120.68
+    old = os.getcwd()
+    os.chdir(d)
+    mp = pytest.MonkeyPatch()
+    mp.setenv("CATALOG_FILE", WORKBOOK)
+    # cache_resource 在同一個 process 跨 AppTest 共用：換資料夾前先清掉
+    streamlit.cache_resource.clear()
+    yield d
+    streamlit.cache_resource.clear()
+    mp.undo()
+    os.chdir(old)
+
+
+def _button(at, prefix):
+    for b in at.button:
+        if b.label.startswith(prefix):
+            return b
+    raise KeyError(prefix)
+
+
+def _start(query=None, secrets=None):
+    at = AppTest.from_file(APP, default_timeout=60)
+    for k, v in (query or {}).items():
+        at.query_params[k] = v
+    for k, v in (secrets or {}).items():
+        at.secrets[k] = v
+    at.run()
+    assert not at.exception, at.exception
+    _button(at, "直接開始").click().run()
+    assert not at.exception, at.exception
+    return at
+
+
+def test_session_state_holds_row_references(app_dir):
+    at = _start({"seed": "123"})
+    ss = at.session_state
+    assert isinstance(ss["meal_rows"], tuple) and len(ss["meal_rows"]) == 3
+    assert all(type(r) is int for r in ss["meal_rows"])
+    assert all(type(r) is int for r in ss["cook_rows"].values())
+    assert type(ss["drink_row"]) is int
+    # 目錄本身不在 session_state 裡：整份 state 序列化後很小
+    keys = ("meal_rows", "cook_rows", "drink_row", "dessert_pool_rows", "dessert_pick_rows", "packaging_pick_rows")
+    assert len(pickle.dumps({k: ss[k] for k in keys})) < 1024
+
+    # 同一個 seed → 同一組列位置
+    assert _start({"seed": "123"}).session_state["meal_rows"] == ss["meal_rows"]
+
+
+def _debug_run(token=None, entered=None):
+    at = _start({"debug": "1"}, {"teacher_token": token} if token is not None else None)
+    if entered is not None:
+        at.text_input(key="teacher_token_in").input(entered).run()
+    assert not at.exception, at.exception
+    return at
+
+
+def test_debug_catalog_switch_needs_teacher_token(app_dir):
+    label = "改用這份 Excel（全部使用者）"
+    at = _debug_run()
+    assert not [s for s in at.selectbox if s.label == label]
+    assert not [t for t in at.text_input if t.key == "teacher_token_in"]  # 沒設定密碼：完全不顯示
+
+    assert not [s for s in _debug_run("s3cret", "wrong").selectbox if s.label == label]
+    assert [s for s in _debug_run("s3cret", "s3cret").selectbox if s.label == label]
+
+
+def _polyline_points(comp) -> int:
+    fg = json.loads(comp.proto.json_args)["feature_group"] or ""
+    m = re.search(r"L\.polyline\(\s*(\[\[.*?\]\])", fg, re.S)
+    return len(json.loads(m.group(1))) if m else 0
+
+
+def _to_stage2(at):
+    # 起點用預設座標 → 搜尋離線分店 → 確認第一家 → 進第二階段
+    _button(at, "✅ 使用此座標").click().run()
+    _button(at, "🔍").click().run()
+    _button(at, "✅ 確認此分店").click().run()
+    at.run()
+    _button(at, "➡️").click().run()
+    assert not at.exception, at.exception
+    return at
+
+
+def test_takeout_map_follows_roads(app_dir):
+    at = _to_stage2(_start())
+    at.radio(key="dine_mode_radio").set_value("帶回台中教育大學").run()
+    assert not at.exception, at.exception
+
+    msg = [s.value for s in at.success if s.value.startswith("帶回交通")]
+    assert msg and "道路距離" in msg[0]
+    maps = [e for e in at.main.children.values() if getattr(e, "proto", None) is not None and hasattr(e.proto, "json_args")]
+    lines = [_polyline_points(c) for c in maps]
+    assert max(lines) > 2  # 沿著道路的折線，不是分店到校區的一條直線
+
+
+def test_debug_profiler_clear_needs_teacher_token(app_dir):
+    def has_clear(at):
+        return any(b.label.startswith("🧹 清除計時紀錄") for b in at.button)
+
+    assert not has_clear(_debug_run())
+    assert not has_clear(_debug_run("s3cret", "wrong"))
+    at = _debug_run("s3cret", "s3cret")
+    assert any(m.value.startswith("#### ⏱️") for m in at.markdown)  # 計時表本身大家都看得到
+    assert has_clear(at)
+
+
+def test_simulation_needs_teacher_token(app_dir):
+    def has_run(at):
+        return any(b.label.startswith("▶️ 執行模擬") for b in at.button)
+
+    assert not has_run(_to_stage2(_start()))
+    at = _to_stage2(_start(secrets={"teacher_token": "s3cret"}))
+    at.text_input(key="teacher_token_sim").input("wrong").run()
+    assert not has_run(at)
+    at.text_input(key="teacher_token_sim").input("s3cret").run()
+    assert has_run(at)
+
+    # 滑桿最大那一檔會分給子行程（不是只有測試才走得到 ProcessPoolExecutor）
+    assert max(at.select_slider[0].options, key=lambda o: int(o.replace(",", ""))) == f"{SIM_POOL_MIN_N:,}"
+
+
+# =========================
+# 每個操作只執行一次：run_stats（整頁次數 + 各 fragment 次數）
+# =========================
+def _runs(at):
+    rs = at.session_state["run_stats"]
+    return rs["script_runs"], dict(rs["fragment_runs"])
+
+
+def _stage1_total(at) -> float:
+    text = next(m.value for m in at.markdown if "第一階段總計" in m.value)
+    return float(re.search(r"第一階段總計.*?`([\d.]+)`", text).group(1))
+
+
+ALL_FRAGMENTS = {"s1_cooking": 1, "s1_drink": 1, "s1_transport": 1, "s1_summary": 1}
+
+
+def test_each_click_runs_the_script_once(app_dir):
+    # 局部重跑之後 AppTest 的元件樹只剩那幾塊：每個操作之前先整頁跑一次，再找下一個元件
+    at = _start()
+    assert _runs(at) == (1, ALL_FRAGMENTS)  # 直接開始：整頁 1 次
+
+    cook = at.radio(key="cook_choice_0")
+    cook.set_value(cook.options[1]).run()
+    assert _runs(at) == (0, {"s1_cooking": 1, "s1_summary": 1})
+
+    at.run()
+    at.radio(key="drink_mode_radio").set_value("我不喝飲料").run()
+    assert _runs(at) == (0, {"s1_drink": 1, "s1_summary": 1})
+    at.run()
+    at.radio(key="drink_mode_radio").set_value("隨機生成飲料").run()
+    at.run()
+    _button(at, "🔄 換一杯飲料").click().run()
+    assert _runs(at) == (0, {"s1_drink": 1, "s1_summary": 1})
+
+    at.run()
+    _button(at, "✅ 使用此座標").click().run()
+    assert _runs(at) == (0, {"s1_transport": 1, "s1_summary": 1})
+
+    at.run()
+    _button(at, "🔍").click().run()
+    at.run()
+    _button(at, "✅ 確認此分店").click().run()
+    assert _runs(at) == (0, {"s1_transport": 1, "s1_summary": 1})
+
+    # 抽新的一餐 / 換階段：整頁重跑，也只跑 1 次
+    at.run()
+    _button(at, "🎲 抽 3 項食材").click().run()
+    assert _runs(at) == (1, ALL_FRAGMENTS)
+    _button(at, "➡️").click().run()
+    assert _runs(at)[0] == 1
+    assert not at.exception, at.exception
+
+
+# =========================
+# fragment 局部重跑：只動被操作的區塊和結果
+# =========================
+def test_cooking_change_reruns_only_cooking_and_summary(app_dir):
+    at = _start({"seed": "7"})
+    before = _stage1_total(at)
+    ss = at.session_state
+    drink_row, drink_draw, origin = ss["drink_row"], ss["drink_draw"], dict(ss["origin"])
+    cook_rows = dict(ss["cook_rows"])
+
+    cook = at.radio(key="cook_choice_0")
+    cook.set_value(cook.options[1]).run()  # 水煮 → 煎炸
+    assert not at.exception, at.exception
+
+    ss = at.session_state
+    assert _runs(at) == (0, {"s1_cooking": 1, "s1_summary": 1})  # 飲料、交通沒有重跑
+    assert ss["cook_method"][0] == "煎炸" and ss["cook_rows"][0] != cook_rows[0]
+    assert {i: r for i, r in ss["cook_rows"].items() if i} == {i: r for i, r in cook_rows.items() if i}
+    assert (ss["drink_row"], ss["drink_draw"], dict(ss["origin"])) == (drink_row, drink_draw, origin)
+    assert _stage1_total(at) != before  # 結果區塊跟著更新
+
+    # 整頁再跑一次，總計和局部重跑時算的一樣
+    after = _stage1_total(at)
+    at.run()
+    assert _stage1_total(at) == after
+
+
+def test_drink_change_leaves_cooking_alone(app_dir):
+    at = _start({"seed": "7"})
+    cook_rows = dict(at.session_state["cook_rows"])
+    before = _stage1_total(at)
+
+    at.radio(key="drink_mode_radio").set_value("我不喝飲料").run()
+    assert _runs(at) == (0, {"s1_drink": 1, "s1_summary": 1})
+    assert at.session_state["drink_row"] is None
+    assert dict(at.session_state["cook_rows"]) == cook_rows
+    assert _stage1_total(at) < before
+
+
+# =========================
+# 計時區段：只記主體真的有執行的區段
+# =========================
+def _section_counts(at) -> dict:
+    for df in at.dataframe:
+        v = df.value
+        if "section" in v.columns:
+            return dict(zip(v["section"], v["count"]))
+    return {}
+
+
+def test_skipped_sections_are_not_recorded(app_dir):
+    streamlit.cache_resource.clear()  # 全班共用的 profiler 從空的開始
+    at = _start({"debug": "1"})
+    counts = _section_counts(at)
+    assert counts["8 報到"] == 1 and counts["11 第一階段"] == 1
+    assert "12 第二階段" not in counts
+
+    at.run()  # 已報到：8 不再記；第二階段的 12 也不記
+    counts = _section_counts(at)
+    assert counts["8 報到"] == 1 and counts["10 讀目錄 / 分類"] == 2 and counts["11 第一階段"] == 2
+    assert "12 第二階段" not in counts
+
+    _to_stage2(at)
+    at.run()
+    before = _section_counts(at)
+    at.run()
+    after = _section_counts(at)
+    assert after["12 第二階段"] == before["12 第二階段"] + 1
+    assert after["11 第一階段"] == before["11 第一階段"]  # 第二階段的整頁執行不記第一階段
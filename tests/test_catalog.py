@@ -0,0 +1,215 @@
+# catalog.py：碳足跡解析（逐格版 vs. 向量化版）、CatalogIndex、CatalogRegistry、讀 Excel
+import io
+import os
+import glob
+import time
+import threading
+import datetime
+
+import numpy as np
+import pytest
+
+from conftest import REPO_ROOT, SMALL_CATALOG, make_columns, write_workbook
+from catalog import (
+    CATALOGS,
+    CatalogIndex,
+    CatalogRegistry,
+    catalog_from_file,
+    check_cf_parser_compat,
+    parse_cf_series_to_g,
+    parse_cf_to_g,
+    read_catalog_columns,
+)
+
+WORKBOOKS = sorted(glob.glob(os.path.join(REPO_ROOT, "產品碳足跡*.xlsx")))
+
+EDGE_CASES = [
+    "800.00g", "0.8kg", "1.00k", "155.00gCO2e", "1.00kgCO2e", "1.00 kg CO2e", "0.8kgCO₂e",
+    "800.00g(每瓶)", "每份 1.2 kg", "約 12", "12", "50", "50.01", "-5g", "+.5kg", "1,200g",
+    "１２３g", "１．５ｋｇ", "　500g", "1.5ＫＧ",
+    "", "   ", "abc", "g", "nan", None, float("nan"),
+    0, 12, 50, 51, 3.5, 800.0, datetime.datetime(2025, 1, 2),
+]
+
+
+def _cf_column(path):
+    from openpyxl import load_workbook
+
+    wb = load_workbook(path, read_only=True, data_only=True)
+    try:
+        rows = wb.worksheets[0].iter_rows(values_only=True)
+        header = [str(h or "") for h in next(rows)]
+        col = next(i for i, h in enumerate(header) if h == "product_carbon_footprint_data" or "碳足跡" in h)
+        return [r[col] if len(r) > col else None for r in rows]
+    finally:
+        wb.close()
+
+
+def test_cf_parser_compat_edge_cases():
+    bad = check_cf_parser_compat(EDGE_CASES)
+    assert bad.empty, bad.to_string()
+
+
+def test_cf_parser_compat_numeric_column():
+    bad = check_cf_parser_compat([0.5, 12.0, 50.0, 50.5, 800.0, np.nan])
+    assert bad.empty, bad.to_string()
+
+
+def test_full_width_digits():
+    assert parse_cf_to_g("１２３g") == 123.0
+    g, unparsed = parse_cf_series_to_g(["１２３g", "１．５ｋｇ"])
+    assert g.tolist() == [123.0, 1500.0]
+    assert len(unparsed) == 0
+
+
+def test_unparsed_rows():
+    g, unparsed = parse_cf_series_to_g(["1kg", "abc", None, "2g"])
+    assert np.isnan(g[[1, 2]]).all()
+    assert unparsed.tolist() == [1]  # 空白格不算「解析不出來」
+
+
+def test_bundled_workbooks_present():
+    assert len(WORKBOOKS) == 3
+
+
+@pytest.mark.parametrize("path", WORKBOOKS, ids=os.path.basename)
+def test_cf_parser_compat_workbooks(path):
+    values = _cf_column(path)
+    assert values
+    bad = check_cf_parser_compat(values)
+    assert bad.empty, bad.to_string()
+
+
+# =========================
+# CatalogIndex
+# =========================
+def test_catalog_index_rows_by_code():
+    cat = CatalogIndex(make_columns(SMALL_CATALOG), version="v1")
+    assert len(cat) == len(SMALL_CATALOG)
+    assert cat.rows("1").tolist() == [0, 3, 6]          # 維持 Excel 順序
+    assert cat.rows("3", "1-1").tolist() == [1, 5, 8]   # 多個 code：合併後排序
+    assert cat.rows("9").tolist() == []
+    assert cat.count("1", "2", "9") == 4
+    assert [cat.code_of(i) for i in range(3)] == ["1", "1-1", "2"]
+    assert cat.row_dict(3) == {
+        "row": 3, "code": "1", "product_name": "雞腿", "cf_gco2e": 1800.0, "cf_kgco2e": 1.8, "declared_unit": "每隻",
+    }
+
+
+def test_catalog_index_is_read_only():
+    cat = CatalogIndex(make_columns(SMALL_CATALOG))
+    with pytest.raises(ValueError):
+        cat.cf_kg[0] = 0.0
+    with pytest.raises(ValueError):
+        cat.rows("1")[0] = 5
+
+
+def test_catalog_index_frame_is_cached():
+    cat = CatalogIndex(make_columns(SMALL_CATALOG))
+    sub = cat.frame("3")
+    assert sub["product_name"].tolist() == ["布丁", "蛋糕"]
+    assert cat.frame("3") is sub
+
+
+# =========================
+# CatalogRegistry
+# =========================
+def test_registry_builds_each_version_once():
+    reg = CatalogRegistry()
+    calls = []
+    gate = threading.Event()
+
+    def build():
+        calls.append(1)
+        gate.wait(1.0)  # 讓其他執行緒都排進來
+        return CatalogIndex(make_columns(SMALL_CATALOG), version="v1")
+
+    got = []
+    threads = [threading.Thread(target=lambda: got.append(reg.get_or_build("v1", build))) for _ in range(8)]
+    for t in threads:
+        t.start()
+    time.sleep(0.05)
+    gate.set()
+    for t in threads:
+        t.join()
+    assert len(calls) == 1
+    assert len(got) == 8 and all(c is got[0] for c in got)
+    assert reg.get("v1") is got[0]
+
+
+def test_registry_evicts_least_recently_used():
+    reg = CatalogRegistry(max_versions=2)
+    for v in ("a", "b"):
+        reg.put(CatalogIndex(make_columns(SMALL_CATALOG), version=v))
+    reg.get("a")  # a 變成最近用過
+    reg.put(CatalogIndex(make_columns(SMALL_CATALOG), version="c"))
+    assert reg.versions() == ["a", "c"]
+    assert reg.get("b") is None
+    reg.drop("a")
+    assert reg.versions() == ["c"]
+
+
+def test_catalog_from_file_shares_one_index():
+    with open(os.path.join(REPO_ROOT, "產品碳足跡3.xlsx"), "rb") as f:
+        data = f.read()
+    a = catalog_from_file(io.BytesIO(data))
+    b = catalog_from_file(io.BytesIO(data))
+    assert a is b
+    assert CATALOGS.get(a.version) is a
+
+
+# =========================
+# read_catalog_columns（openpyxl 串流讀前 4 欄）
+# =========================
+@pytest.mark.parametrize("path", [p for p in WORKBOOKS if not p.endswith("產品碳足跡2.xlsx")], ids=os.path.basename)
+def test_read_columns_chunked_matches_single_chunk(path):
+    whole = read_catalog_columns(path, chunk_rows=1 << 30)
+    chunked = read_catalog_columns(path, chunk_rows=7)
+    assert set(whole) == set(chunked)
+    for c in whole:
+        np.testing.assert_array_equal(chunked[c], whole[c])
+    assert chunked.attrs["cf_unparsed"] == whole.attrs["cf_unparsed"]
+
+
+def test_read_columns_numeric_only_chunk(tmp_path):
+    # 某一段（chunk）剛好全部是數值格式的儲存格
+    path = write_workbook(tmp_path / "n.xlsx", [("1", "白飯", 0.5, "每碗"), ("1", "雞腿", 1.8, "每隻"), ("1", "豆腐", "300g", "每塊")])
+    cols = read_catalog_columns(path, chunk_rows=2)
+    np.testing.assert_allclose(cols["cf_gco2e"], [500.0, 1800.0, 300.0])
+
+
+def test_read_columns_formats(tmp_path):
+    path = write_workbook(
+        tmp_path / "a.xlsx",
+        [
+            ("1", "白飯", "500g", "每碗", "多的欄位不讀"),
+            (None, None, None, None),                      # 空白列：略過
+            (2.0, "紅茶", 0.2, "每杯"),                     # 數字編號 2.0 → "2"；<=50 的純數字當 kg
+            ("3", "布丁", "???", "每個"),                   # 解析不出來
+        ],
+        header=("code", "product_name", "product_carbon_footprint_data", "declared_unit", "note"),
+    )
+    cols = read_catalog_columns(path)
+    assert cols["code"].tolist() == ["1", "2"]
+    assert cols["product_name"].tolist() == ["白飯", "紅茶"]
+    np.testing.assert_allclose(cols["cf_gco2e"], [500.0, 200.0])
+    np.testing.assert_allclose(cols["cf_kgco2e"], [0.5, 0.2])
+    assert cols.attrs["cf_unparsed"] == [{"excel_row": 5, "value": "???"}]
+
+
+def test_read_columns_three_column_kg_header(tmp_path):
+    # 精簡格式：沒有宣告單位；標題寫明 kg → 純數字一律當 kg（不套 <=50 規則）
+    path = write_workbook(
+        tmp_path / "b.xlsx", [("1", "牛肉", 120), ("1", "豆腐", "0.3"), ("1", "雞蛋", "60g")],
+        header=("編號", "品名", "碳足跡(kg)"),
+    )
+    cols = read_catalog_columns(path)
+    np.testing.assert_allclose(cols["cf_gco2e"], [120_000.0, 300.0, 60.0])
+    assert cols["declared_unit"].tolist() == ["", "", ""]
+
+
+def test_read_columns_rejects_bad_layouts(tmp_path):
+    with pytest.raises(ValueError, match="編號"):
+        read_catalog_columns(write_workbook(tmp_path / "c.xlsx", [("白飯", "0.5kg", "每碗")], header=("product_name", "cf", "unit")))
+    with pytest.raises(ValueError, match="欄位太少"):
+        read_catalog_columns(write_workbook(tmp_path / "d.xlsx", [("1", "白飯")], header=("code", "product_name")))
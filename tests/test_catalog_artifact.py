@@ -0,0 +1,71 @@
+# catalog.py：目錄二進位快取（.npy 欄位檔）的寫入 / 讀回
+import os
+import json
+import shutil
+
+import numpy as np
+
+import catalog
+from conftest import REPO_ROOT, SMALL_CATALOG, make_columns
+from catalog import CATALOGS, load_catalog, load_catalog_index, read_catalog_artifact, read_catalog_columns, write_catalog_artifact
+
+
+def _fresh_process_cache(path):
+    # 模擬新的 server process：process 內的快取清掉，只剩磁碟上的快取
+    catalog._LOADED.pop(os.path.abspath(path), None)
+    for v in CATALOGS.versions():
+        CATALOGS.drop(v)
+
+
+def test_artifact_round_trip(tmp_path):
+    cols = make_columns(SMALL_CATALOG)
+    cols.attrs["catalog_version"] = "abc"
+    cols.attrs["cf_unparsed"] = [{"excel_row": 7, "value": "?"}]
+    art = str(tmp_path / "art")
+    write_catalog_artifact(cols, art)
+
+    df = read_catalog_artifact(art)
+    for c in ("code", "product_name", "declared_unit"):
+        assert df[c].tolist() == cols[c].tolist()
+    np.testing.assert_array_equal(df["cf_gco2e"].to_numpy(), cols["cf_gco2e"])
+    assert df.attrs == {"cf_unparsed": [{"excel_row": 7, "value": "?"}], "catalog_version": "abc"}
+
+
+def test_artifact_wrong_format_is_ignored(tmp_path):
+    art = str(tmp_path / "art")
+    write_catalog_artifact(make_columns(SMALL_CATALOG), art)
+    meta_path = os.path.join(art, "meta.json")
+    with open(meta_path, encoding="utf-8") as f:
+        meta = json.load(f)
+    meta["format"] = -1
+    with open(meta_path, "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+    assert read_catalog_artifact(art) is None
+
+
+def test_load_catalog_uses_artifact(tmp_path):
+    xlsx = str(tmp_path / "catalog.xlsx")
+    shutil.copy(os.path.join(REPO_ROOT, "產品碳足跡3.xlsx"), xlsx)
+    cache_dir = str(tmp_path / "cache")
+    _fresh_process_cache(xlsx)
+
+    first = load_catalog_index(xlsx, cache_dir=cache_dir)
+    assert load_catalog_index(xlsx, cache_dir=cache_dir) is first  # process 內快取
+    arts = [d for d in os.listdir(cache_dir) if d != "manifest.json"]
+    assert len(arts) == 1
+
+    _fresh_process_cache(xlsx)
+    again = load_catalog_index(xlsx, cache_dir=cache_dir)
+    assert again is not first
+    assert again.version == first.version
+    assert isinstance(again.cf_g.base, np.memmap) or isinstance(again.cf_g, np.memmap)
+    np.testing.assert_array_equal(again.cf_g, first.cf_g)
+    np.testing.assert_array_equal(again.names, first.names)
+    assert again.rows("1").tolist() == first.rows("1").tolist()
+
+    # 與直接解析 Excel 的結果相同
+    cols = read_catalog_columns(xlsx)
+    df = load_catalog(xlsx, cache_dir=cache_dir)
+    assert df["product_name"].tolist() == cols["product_name"].tolist()
+    np.testing.assert_array_equal(df["cf_kgco2e"].to_numpy(), cols["cf_kgco2e"])
+    _fresh_process_cache(xlsx)
@@ -0,0 +1,101 @@
+# catalog_manager.py：目錄版本間的逐列差異、列位置對照、背景切換
+import numpy as np
+
+from conftest import SMALL_CATALOG, make_columns, write_workbook
+from catalog import CatalogIndex
+from catalog_manager import CatalogManager, diff_catalogs, remap_rows
+from footprint import NO_ROW
+
+
+def _index(rows, version):
+    return CatalogIndex(make_columns(rows), version=version)
+
+
+def _brute_row_map(old, new):
+    # 對照組：逐列找新版裡第一個還沒被用掉的同 (code, 品名)
+    used, out = set(), []
+    for i in range(len(old)):
+        hit = NO_ROW
+        for j in range(len(new)):
+            if j not in used and new.code_of(j) == old.code_of(i) and new.names[j] == old.names[i]:
+                hit = j
+                used.add(j)
+                break
+        out.append(hit)
+    return out
+
+
+def test_diff_catalogs():
+    old = _index(SMALL_CATALOG, "v1")
+    rows = list(SMALL_CATALOG)
+    del rows[1]                               # 刪掉 沙拉油
+    rows[2] = ("1", "雞腿", 2.0, "每隻")       # 雞腿改了碳足跡
+    rows.insert(0, ("2", "綠茶", 0.2, "每杯"))  # 新增一列（後面的列位置全部 +1）
+    new = _index(rows, "v2")
+
+    d = diff_catalogs(old, new)
+    assert (d.old_version, d.new_version) == ("v1", "v2")
+    assert d.row_map.tolist() == _brute_row_map(old, new)
+    assert d.row_map.tolist() == [1, NO_ROW, 2, 3, 4, 5, 6, 7, 8]
+    assert d.removed == [1]
+    assert d.added == [0]
+    assert d.changed == [(3, 3)]
+    assert d.summary() == {"added": 1, "removed": 1, "changed": 1}
+    assert not d.row_map.flags.writeable
+
+
+def test_diff_catalogs_duplicate_names_pair_in_order():
+    old = _index([("1", "白飯", 0.5, "每碗"), ("1", "白飯", 0.6, "每碗")], "v1")
+    new = _index([("1", "白飯", 0.6, "每碗"), ("2", "紅茶", 0.2, "每杯"), ("1", "白飯", 0.5, "每碗")], "v2")
+    d = diff_catalogs(old, new)
+    assert d.row_map.tolist() == _brute_row_map(old, new) == [0, 2]
+    assert d.changed == [(0, 0), (1, 2)]
+
+
+def test_remap_rows():
+    m = np.array([3, NO_ROW, 0])
+    assert remap_rows(m, (0, 1, 2)) == [3, 0]
+    assert remap_rows(m, []) == []
+    assert remap_rows(None, (0, 1)) == []
+
+
+def test_manager_switches_and_chains_row_maps(tmp_path):
+    rows = [(c, n, f"{kg}kg", u) for c, n, kg, u in SMALL_CATALOG]
+    write_workbook(tmp_path / "產品碳足跡1.xlsx", rows)
+    write_workbook(tmp_path / "產品碳足跡2.xlsx", rows[1:])             # 少了第一列
+    write_workbook(tmp_path / "產品碳足跡3.xlsx", rows[1:] + [("2", "綠茶", "0.2kg", "每杯")])
+    (tmp_path / "~$產品碳足跡9.xlsx").write_bytes(b"lock file")        # Excel 開著時的暫存檔：不理
+
+    mgr = CatalogManager(str(tmp_path), active="產品碳足跡1.xlsx", cache_dir=str(tmp_path / "cache"))
+    mgr.refresh()
+    v1 = mgr.current.version
+    assert [b["name"] for b in mgr.workbooks()] == ["產品碳足跡1.xlsx", "產品碳足跡2.xlsx", "產品碳足跡3.xlsx"]
+    assert mgr.row_map(v1) is None  # 目前版本：不用對照
+
+    mgr.use("產品碳足跡2.xlsx")
+    v2 = mgr.current.version
+    assert v2 != v1
+    assert mgr.row_map(v1).tolist() == [NO_ROW] + list(range(len(rows) - 1))
+    assert mgr.last_diff.summary() == {"added": 0, "removed": 1, "changed": 0}
+
+    mgr.use("產品碳足跡3.xlsx")
+    # v1 → v3 = v1 → v2 再接 v2 → v3
+    assert mgr.row_map(v1).tolist() == [NO_ROW] + list(range(len(rows) - 1))
+    assert mgr.row_map(v2).tolist() == list(range(len(rows) - 1))
+    assert mgr.row_map("unknown") is None
+
+    mgr.active = None  # 沒指定：用編號最大的那一份
+    mgr.refresh()
+    assert mgr.workbooks()[-1]["active"]
+
+
+def test_manager_keeps_old_catalog_when_file_breaks(tmp_path):
+    path = write_workbook(tmp_path / "產品碳足跡1.xlsx", [("1", "白飯", "0.5kg", "每碗")])
+    mgr = CatalogManager(str(tmp_path), cache_dir=str(tmp_path / "cache"))
+    mgr.refresh()
+    cur = mgr.current
+    with open(path, "wb") as f:
+        f.write(b"not a workbook")
+    mgr.refresh()
+    assert mgr.current is cur
+    assert mgr.workbooks()[0]["error"]
@@ -0,0 +1,39 @@
+# charts.py：圖表快取 key 與 Vega-Lite spec
+import numpy as np
+import pytest
+
+from charts import CHART_DECIMALS, bar_spec, chart_key, pie_spec
+
+
+def test_chart_key_rounds_and_drops_zero():
+    key = chart_key([("Food", 1.23449), ("Drink", np.float64(0.0004)), ("Transport", 0.0), ("Dessert", 0.5)])
+    assert key == (("Food", 1.234), ("Dessert", 0.5))
+    assert all(type(v) is float for _, v in key)  # NumPy 純量也轉成 float（key 可雜湊、可比較）
+
+
+def test_chart_key_same_display_same_key():
+    # 畫面上顯示一樣（小數 3 位）→ 同一個 key，不重建圖表
+    a = chart_key([("Food", 1.2341), ("Drink", 0.2)])
+    b = chart_key([("Food", 1.2344), ("Drink", 0.2)])
+    assert a == b and hash(a) == hash(b)
+    assert chart_key([("Food", 1.2346), ("Drink", 0.2)]) != a
+    assert round(1.2346, CHART_DECIMALS) == 1.235
+
+
+def test_chart_key_keeps_order_and_empty_fallback():
+    assert [c for c, _ in chart_key([("B", 1), ("A", 2)])] == ["B", "A"]
+    assert chart_key([]) == (("Food", 0.0),)
+    assert chart_key([("Food", 0.0001), ("Drink", -1.0)]) == (("Food", 0.0),)
+
+
+def test_specs_cached_per_key():
+    key = chart_key([("Food", 3.0), ("Drink", 1.0)])
+    assert bar_spec(key, 260) is bar_spec(chart_key([("Food", 3.0001), ("Drink", 1.0)]), 260)
+    assert bar_spec(key, 260) is not bar_spec(key, 300)
+
+    pie = pie_spec(key, 300, 120)
+    values = pie["layer"][0]["data"]["values"]
+    assert [v["cat"] for v in values] == ["Food", "Drink"]
+    assert [v["pct"] for v in values] == pytest.approx([0.75, 0.25])
+    assert [v["pct_label"] for v in values] == ["75%", "25%"]
+    assert pie["layer"][1]["mark"]["radius"] == 120
@@ -0,0 +1,79 @@
+# footprint.py：批次計算與單筆（breakdown）、手算結果一致
+import numpy as np
+import pytest
+
+from catalog import CatalogIndex
+from conftest import make_columns
+from footprint import CATEGORIES, NO_ROW, Meal, MealFootprint
+
+
+@pytest.fixture(scope="module")
+def cat():
+    rng = np.random.default_rng(3)
+    rows = [(str(1 + i % 4), f"品項{i}", float(np.round(rng.random() * 3, 4)), "每份") for i in range(60)]
+    return CatalogIndex(make_columns(rows), version="t")
+
+
+def _random_meal(rng, n_rows):
+    pick = lambda k: tuple(int(x) for x in rng.integers(0, n_rows, k))  # noqa: E731
+    return Meal(
+        food=pick(3),
+        cooking=pick(3),
+        drink=int(rng.integers(0, n_rows)) if rng.random() < 0.7 else NO_ROW,
+        dessert=pick(int(rng.integers(0, 3))),
+        packaging=pick(int(rng.integers(0, 4))),
+        transport_km=float(rng.random() * 10),
+        takeout_km=float(rng.random() * 3),
+        ef=float(rng.choice([0.0, 0.035, 0.115])),
+    )
+
+
+def _by_hand(cat, m):
+    cf = lambda rows: sum(float(cat.cf_kg[r]) for r in rows)  # noqa: E731
+    return [
+        cf(m.food), cf(m.cooking), cf([m.drink]) if m.drink != NO_ROW else 0.0,
+        m.transport_km * m.ef, cf(m.dessert), cf(m.packaging), m.takeout_km * m.ef,
+    ]
+
+
+def _pad(seqs):
+    k = max(len(s) for s in seqs)
+    return [list(s) + [NO_ROW] * (k - len(s)) for s in seqs]
+
+
+def test_breakdown_matches_hand_sum(cat):
+    mf = MealFootprint(cat)
+    rng = np.random.default_rng(0)
+    for _ in range(50):
+        m = _random_meal(rng, len(cat))
+        bd = mf.breakdown(m)
+        want = _by_hand(cat, m)
+        np.testing.assert_allclose(list(bd.as_dict().values()), want, rtol=1e-12, atol=1e-15)
+        assert list(bd.as_dict()) == list(CATEGORIES)
+        assert bd.total == pytest.approx(sum(want))
+        assert bd.stage1_total == pytest.approx(sum(want[:4]))
+
+
+def test_batch_matches_breakdown(cat):
+    mf = MealFootprint(cat)
+    rng = np.random.default_rng(1)
+    meals = [_random_meal(rng, len(cat)) for _ in range(200)]
+    out = mf.batch(
+        [m.food for m in meals],
+        cooking=[m.cooking for m in meals],
+        drink=[m.drink for m in meals],
+        dessert=_pad([m.dessert for m in meals]),
+        packaging=_pad([m.packaging for m in meals]),
+        transport_km=[m.transport_km for m in meals],
+        takeout_km=[m.takeout_km for m in meals],
+        ef=[m.ef for m in meals],
+    )
+    assert out.shape == (200, len(CATEGORIES))
+    want = np.array([list(mf.breakdown(m).as_dict().values()) for m in meals])
+    np.testing.assert_allclose(out, want, rtol=1e-12, atol=1e-15)
+    np.testing.assert_allclose(mf.totals([m.food for m in meals]), want[:, 0], rtol=1e-12)
+
+
+def test_empty_meal(cat):
+    bd = MealFootprint(cat).breakdown(Meal())
+    assert bd.total == 0.0
@@ -0,0 +1,67 @@
+# geo.py：搜尋結果磁碟快取（關鍵字 + geohash 格子）
+import time
+
+from geo import GeoSearchCache, cached_search_nearby, geohash_cell, geohash_encode, normalize_query, search_cache_key
+
+NTSU = (24.1477, 120.6736)
+
+
+class FakeFetch:
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, query, lat, lng, radius_km=5, limit=60):
+        self.calls.append((query, lat, lng, radius_km, limit))
+        return [{"name": f"{query}-{len(self.calls)}", "display_name": query, "lat": lat, "lng": lng}]
+
+
+def test_geohash_round_trip():
+    code = geohash_encode(*NTSU)
+    assert len(code) == 6
+    c_lat, c_lng, h_lat, h_lng = geohash_cell(code)
+    assert abs(c_lat - NTSU[0]) <= h_lat and abs(c_lng - NTSU[1]) <= h_lng
+    assert geohash_encode(c_lat, c_lng) == code
+
+
+def test_normalize_query():
+    assert normalize_query("  ＰＸ　Mart ") == normalize_query("px mart") == "px mart"
+    assert search_cache_key("全聯", *NTSU, 5, 60) == search_cache_key(" 全聯 ", NTSU[0] + 1e-5, NTSU[1], 5, 60)
+
+
+def test_same_cell_shares_one_query(tmp_path):
+    cache = GeoSearchCache(str(tmp_path / "geo.sqlite3"))
+    fetch = FakeFetch()
+    first = cached_search_nearby("全聯", *NTSU, cache=cache, fetch=fetch)
+    again = cached_search_nearby("全聯 ", NTSU[0] + 1e-4, NTSU[1] - 1e-4, cache=cache, fetch=fetch)
+    assert first == again
+    assert len(fetch.calls) == 1
+    # 以格子中心查，半徑加上半個格子對角線
+    query, c_lat, c_lng, radius_km, _ = fetch.calls[0]
+    assert (c_lat, c_lng) == geohash_cell(geohash_encode(*NTSU))[:2]
+    assert 5 < radius_km < 6
+    assert cache.stats() == {"hits": 1, "misses": 1, "entries": 1}
+
+    cached_search_nearby("全聯", NTSU[0] + 0.05, NTSU[1], cache=cache, fetch=fetch)  # 另一格
+    assert len(fetch.calls) == 2
+
+
+def test_ttl_expiry(tmp_path):
+    cache = GeoSearchCache(str(tmp_path / "geo.sqlite3"), ttl_seconds=0.05)
+    cache.put("k", [1])
+    assert cache.get("k") == [1]
+    time.sleep(0.1)
+    assert cache.get("k") is None
+    assert cache.stats()["entries"] == 0
+
+
+def test_lru_eviction(tmp_path):
+    cache = GeoSearchCache(str(tmp_path / "geo.sqlite3"), max_entries=2)
+    cache.put("a", [1])
+    time.sleep(0.01)
+    cache.put("b", [2])
+    time.sleep(0.01)
+    assert cache.get("a") == [1]  # a 變成最近用過
+    time.sleep(0.01)
+    cache.put("c", [3])
+    assert cache.get("b") is None
+    assert cache.get("a") == [1] and cache.get("c") == [3]
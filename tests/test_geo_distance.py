@@ -0,0 +1,56 @@
+# geo.py：NumPy haversine（純量 / 距離矩陣 / top-k）
+import math
+
+import numpy as np
+
+from geo import EARTH_RADIUS_KM, distance_matrix_km, haversine_km, haversine_km_np, nearest_index, rank_by_distance, topk_nearest
+
+
+def _scalar(lat1, lng1, lat2, lng2):
+    p1, p2 = math.radians(lat1), math.radians(lat2)
+    dp, dl = p2 - p1, math.radians(lng2 - lng1)
+    a = math.sin(dp / 2) ** 2 + math.cos(p1) * math.cos(p2) * math.sin(dl / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(min(a, 1.0)))
+
+
+def _points(n, seed):
+    rng = np.random.default_rng(seed)
+    return np.column_stack([24.0 + rng.random(n) * 0.5, 120.4 + rng.random(n) * 0.5])
+
+
+def test_haversine_matches_scalar_formula():
+    assert haversine_km(24.1477, 120.6736, 24.1477, 120.6736) == 0.0
+    assert abs(haversine_km(0, 0, 0, 180) - math.pi * EARTH_RADIUS_KM) < 1e-9  # 對蹠點
+    a, b = _points(50, 1), _points(50, 2)
+    got = haversine_km_np(a[:, 0], a[:, 1], b[:, 0], b[:, 1])
+    want = [_scalar(*p, *q) for p, q in zip(a, b)]
+    np.testing.assert_allclose(got, want, rtol=1e-12)
+
+
+def test_distance_matrix_chunks_and_dtype():
+    o, d = _points(37, 3), _points(11, 4)
+    full = distance_matrix_km(o, d)
+    assert full.shape == (37, 11)
+    np.testing.assert_allclose(full[5, 7], _scalar(*o[5], *d[7]), rtol=1e-12)
+    np.testing.assert_array_equal(distance_matrix_km(o, d, chunk_rows=4), full)
+    np.testing.assert_allclose(distance_matrix_km(o, d, dtype="float32"), full, rtol=1e-6)
+
+
+def test_topk_nearest_matches_argsort():
+    o, d = _points(20, 5), _points(300, 6)
+    idx, dist = topk_nearest(o, d, k=4, chunk_rows=7)
+    m = distance_matrix_km(o, d)
+    np.testing.assert_array_equal(idx, np.argsort(m, axis=1, kind="stable")[:, :4])
+    np.testing.assert_array_equal(dist, np.take_along_axis(m, idx, axis=1))
+    idx, dist = topk_nearest(o, d[:2], k=5)  # k 比目的地多
+    assert idx.shape == (20, 2)
+
+
+def test_nearest_and_rank():
+    pts = [{"name": "a", "lat": 24.2, "lng": 120.7}, {"name": "b", "lat": 24.15, "lng": 120.67}]
+    i, d = nearest_index(24.15, 120.67, pts)
+    assert (i, d) == (1, 0.0)
+    assert nearest_index(24.15, 120.67, []) == (None, float("inf"))
+    ranked = rank_by_distance(24.15, 120.67, pts, k=1)
+    assert [r["name"] for r in ranked] == ["b"]
+    assert "dist_km" not in pts[1]
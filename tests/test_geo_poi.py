@@ -0,0 +1,89 @@
+# geo.py：離線分店索引（格網 k-nearest）對照暴力法
+import json
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from geo import PoiIndex, haversine_km_np, load_poi_file
+
+BRANDS = ["全聯", "家樂福", "7-ELEVEN", "全家"]
+
+
+@pytest.fixture(scope="module")
+def pois():
+    rng = np.random.default_rng(7)
+    n = 3000
+    return pd.DataFrame(
+        {
+            "name": [f"{BRANDS[i % 4]}{i}店" for i in range(n)],
+            "brand": [BRANDS[i % 4] for i in range(n)],
+            "address": [f"台中市{i}號" for i in range(n)],
+            "lat": 24.0 + rng.random(n) * 0.3,
+            "lng": 120.5 + rng.random(n) * 0.3,
+        }
+    )
+
+
+def _brute(df, query, lat, lng, k, max_km=None):
+    hit = (df["brand"] + " " + df["name"]).str.lower().str.contains(query.lower(), regex=False).to_numpy()
+    rows = np.flatnonzero(hit)
+    d = haversine_km_np(lat, lng, df["lat"].to_numpy()[rows], df["lng"].to_numpy()[rows])
+    if max_km is not None:
+        rows, d = rows[d <= max_km], d[d <= max_km]
+    order = np.argsort(d, kind="stable")[:k]
+    return rows[order].tolist(), d[order]
+
+
+@pytest.mark.parametrize("query", ["全聯", "家樂福", "7-eleven", ""])
+def test_nearest_matches_brute_force(pois, query):
+    idx = PoiIndex(pois)
+    rng = np.random.default_rng(1)
+    # 資料範圍內、邊緣、範圍外的起點
+    origins = [(24.0 + rng.random() * 0.3, 120.5 + rng.random() * 0.3) for _ in range(30)]
+    origins += [(24.0, 120.5), (24.3, 120.8), (23.8, 120.4), (24.6, 121.0)]
+    for lat, lng in origins:
+        got = idx.nearest(query, lat, lng, k=5)
+        want_ids, want_d = _brute(pois, query, lat, lng, 5)
+        assert [r["poi_id"] for r in got] == want_ids
+        np.testing.assert_allclose([r["dist_km"] for r in got], want_d, rtol=1e-12)
+
+
+def test_nearest_max_km(pois):
+    idx = PoiIndex(pois)
+    got = idx.nearest("全家", 24.15, 120.65, k=50, max_km=1.5)
+    want_ids, _ = _brute(pois, "全家", 24.15, 120.65, 50, max_km=1.5)
+    assert [r["poi_id"] for r in got] == want_ids
+    assert all(r["dist_km"] <= 1.5 for r in got)
+    assert idx.nearest("全家", 30.0, 130.0, k=5, max_km=1.0) == []
+
+
+def test_nearest_result_format(pois):
+    r = PoiIndex(pois).nearest("全聯", 24.15, 120.65, k=1)[0]
+    assert set(r) == {"display_name", "name", "lat", "lng", "dist_km", "poi_id"}
+    assert r["display_name"] == f"{r['name']}, {pois['address'][r['poi_id']]}"
+    assert PoiIndex(pois).nearest("不存在的店", 24.15, 120.65) == []
+    assert PoiIndex(pois.iloc[:0]).nearest("全聯", 24.15, 120.65) == []
+
+
+def test_load_poi_csv_and_geojson(tmp_path):
+    csv = tmp_path / "stores.csv"
+    csv.write_text("name,brand,lat,lon\n 全聯北屯店 ,全聯,24.18,120.69\n壞資料,全聯,,120.7\n", encoding="utf-8")
+    df = load_poi_file(str(csv))
+    assert df[["name", "brand", "address"]].values.tolist() == [["全聯北屯店", "全聯", ""]]
+    assert df["lng"].tolist() == [120.69]
+
+    gj = tmp_path / "stores.geojson"
+    gj.write_text(
+        json.dumps(
+            {
+                "features": [
+                    {"geometry": {"type": "Point", "coordinates": [120.7, 24.1]}, "properties": {"name:zh": "家樂福", "addr:full": "台中市"}},
+                    {"geometry": {"type": "Polygon", "coordinates": []}, "properties": {"name": "x"}},
+                ]
+            }
+        ),
+        encoding="utf-8",
+    )
+    df = load_poi_file(str(gj))
+    assert df[["name", "address", "lat", "lng"]].values.tolist() == [["家樂福", "台中市", 24.1, 120.7]]
@@ -0,0 +1,138 @@
+# geo.py：RequestScheduler（single-flight、token bucket、429 退避）對本機假的 Nominatim
+import json
+import time
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+
+from geo import RequestScheduler, nominatim_search_nearby
+
+
+class StubNominatim:
+    """/search 回一筆結果；可設定每次回應前延遲、前幾次回 429。"""
+
+    def __init__(self, delay: float = 0.0, throttle: int = 0, retry_after: str = None):
+        self.delay = delay
+        self.throttle = throttle
+        self.retry_after = retry_after
+        self.requests = []  # (monotonic 時間, q)
+        self._lock = threading.Lock()
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                q = parse_qs(urlparse(self.path).query).get("q", [""])[0]
+                with stub._lock:
+                    stub.requests.append((time.monotonic(), q))
+                    throttled = stub.throttle > 0
+                    stub.throttle -= throttled
+                time.sleep(stub.delay)
+                if throttled:
+                    self.send_response(429)
+                    if stub.retry_after is not None:
+                        self.send_header("Retry-After", stub.retry_after)
+                    self.end_headers()
+                    return
+                body = json.dumps([{"display_name": f"{q}, 台中", "lat": "24.15", "lon": "120.67"}]).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        threading.Thread(target=self.server.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def stub():
+    servers = []
+
+    def make(**kw):
+        s = StubNominatim(**kw)
+        servers.append(s)
+        return s
+
+    yield make
+    for s in servers:
+        s.close()
+
+
+def _search(sched, stub, q):
+    return sched.run(q, nominatim_search_nearby, q, 24.15, 120.67, base_url=stub.url, timeout=10)
+
+
+def test_single_flight(stub):
+    server = stub(delay=0.3)
+    sched = RequestScheduler(rate_per_sec=100, burst=10)
+    results = [None] * 6
+
+    def worker(i):
+        results[i] = _search(sched, server, "全聯")
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(6)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert len(server.requests) == 1
+    assert all(r == results[0] for r in results)
+    assert results[0][0]["name"] == "全聯"
+    assert sched.stats["upstream"] == 1
+    assert sched.stats["coalesced"] == 5
+
+
+def test_token_bucket_spaces_requests(stub):
+    server = stub()
+    sched = RequestScheduler(rate_per_sec=10, burst=1)
+    futs = [sched.submit(q, nominatim_search_nearby, q, 24.15, 120.67, base_url=server.url) for q in "abcde"]
+    for f in futs:
+        f.result(timeout=10)
+
+    times = [t for t, _ in server.requests]
+    assert [q for _, q in server.requests] == list("abcde")  # FIFO
+    gaps = [b - a for a, b in zip(times, times[1:])]
+    assert min(gaps) >= 0.08  # 每秒 10 次 → 間隔約 0.1 s
+    assert times[-1] - times[0] >= 0.35
+
+
+def test_throttled_request_is_retried_after_retry_after(stub):
+    server = stub(throttle=1, retry_after="0.3")
+    sched = RequestScheduler(rate_per_sec=100, burst=10)
+    out = _search(sched, server, "全聯")
+    assert out[0]["name"] == "全聯"
+    assert len(server.requests) == 2
+    assert server.requests[1][0] - server.requests[0][0] >= 0.28
+    assert sched.stats["throttled"] == 1
+
+
+def test_throttled_without_retry_after_backs_off(stub):
+    server = stub(throttle=2)
+    sched = RequestScheduler(rate_per_sec=100, burst=10, backoff_base=0.1)
+    _search(sched, server, "全聯")
+    t = [t for t, _ in server.requests]
+    assert len(t) == 3
+    assert t[1] - t[0] >= 0.09 and t[2] - t[1] >= 0.19  # 0.1 s、0.2 s
+
+
+def test_gives_up_after_max_retries(stub):
+    server = stub(throttle=10, retry_after="0")
+    sched = RequestScheduler(rate_per_sec=100, burst=10, max_retries=2)
+    with pytest.raises(Exception) as e:
+        _search(sched, server, "全聯")
+    assert e.value.response.status_code == 429
+    assert len(server.requests) == 3
+    # 失敗的查詢不會卡在 single-flight 表裡：下一次會重新查
+    server.throttle = 0
+    assert _search(sched, server, "全聯")[0]["name"] == "全聯"
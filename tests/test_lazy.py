@@ -0,0 +1,63 @@
+# lazy.py：第一次取用屬性才 import；之後的取用 / 設定都轉給真正的模組
+import sys
+import threading
+
+import pytest
+
+from lazy import lazy_module
+
+
+@pytest.fixture
+def fake_mod(tmp_path, monkeypatch):
+    name = "lazy_probe_mod"
+    (tmp_path / f"{name}.py").write_text("LOADS = [1]\nVALUE = 42\n\n\ndef double(x):\n    return 2 * x\n", encoding="utf-8")
+    monkeypatch.syspath_prepend(str(tmp_path))
+    monkeypatch.delitem(sys.modules, name, raising=False)
+    yield name
+    sys.modules.pop(name, None)
+
+
+def test_import_deferred_until_first_attribute(fake_mod):
+    mod = lazy_module(fake_mod)
+    assert fake_mod not in sys.modules
+    assert "not loaded" in repr(mod)
+
+    assert mod.VALUE == 42
+    assert fake_mod in sys.modules
+    assert mod.double(4) == 8
+    assert mod._load() is sys.modules[fake_mod]
+    assert "(loaded)" in repr(mod)
+
+
+def test_setattr_and_delattr_reach_the_real_module(fake_mod):
+    mod = lazy_module(fake_mod)
+    mod.VALUE = 7
+    assert sys.modules[fake_mod].VALUE == 7
+    del mod.VALUE
+    assert not hasattr(sys.modules[fake_mod], "VALUE")
+    with pytest.raises(AttributeError):
+        mod.VALUE
+
+
+def test_concurrent_first_access_imports_once(fake_mod):
+    mod = lazy_module(fake_mod)
+    barrier = threading.Barrier(8)
+    seen = []
+
+    def worker():
+        barrier.wait()
+        seen.append(mod.LOADS)
+
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    # 模組只執行一次：每個執行緒拿到的是同一個 list
+    assert len({id(x) for x in seen}) == 1 and seen[0] is sys.modules[fake_mod].LOADS
+
+
+def test_missing_module_raises_on_first_use():
+    mod = lazy_module("no_such_module_for_lazy_test")
+    with pytest.raises(ModuleNotFoundError):
+        mod.anything
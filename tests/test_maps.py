@@ -0,0 +1,65 @@
+# maps.py：render_map 的煙霧測試（用 streamlit_folium 內部函式的快速路徑 vs. 公開的 st_folium）
+import json
+
+import pytest
+
+pytest.importorskip("streamlit_folium")
+from streamlit.testing.v1 import AppTest  # noqa: E402
+
+import maps  # noqa: E402
+from maps import fit_view  # noqa: E402
+
+
+def _script():
+    import streamlit as st
+    from maps import MapLine, MapMarker, fit_view, render_map
+
+    school, shop = (24.1434, 120.6751), (24.1500, 120.6800)
+    out = render_map(
+        "test_map",
+        school,
+        14,
+        base=(MapMarker(*school, tooltip="學校"),),
+        layer=(MapMarker(*shop, tooltip="分店", color="red"), MapLine((school, shop))),
+        view=fit_view([school, shop], 300),
+        height=300,
+        returned_objects=["last_object_clicked_tooltip"],
+    )
+    st.write(out)
+
+
+def _render():
+    at = AppTest.from_function(_script, default_timeout=30).run()
+    assert not at.exception, at.exception
+    comp, value = at.main.children[0], at.main.children[1]
+    assert comp.proto.component_name == "streamlit_folium.st_folium"
+    return json.loads(comp.proto.json_args), json.loads(value.value)
+
+
+def test_render_map_private_fast_path():
+    maps.clear_map_cache()
+    assert maps._has_private_api()
+    args, value = _render()
+    assert value == {"last_object_clicked_tooltip": None}
+    assert "map_div" in args["script"] and "學校" in args["script"]
+    assert "L.polyline" in args["feature_group"] and "分店" in args["feature_group"]
+    assert args["height"] == 300 and args["width"] is None
+
+
+def test_render_map_public_fallback_matches(monkeypatch):
+    maps.clear_map_cache()
+    fast, _ = _render()
+    monkeypatch.setattr(maps, "_has_private_api", lambda: False)
+    slow, value = _render()
+    assert value == {"last_object_clicked_tooltip": None}
+    assert set(slow) == set(fast)
+    for k in ("zoom", "center", "height", "width", "default", "returned_objects", "css_links", "js_links"):
+        assert slow[k] == fast[k], k
+    assert "L.polyline" in slow["feature_group"]
+
+
+def test_fit_view_contains_points():
+    (lat, lng), zoom = fit_view([(24.0, 120.0), (24.2, 120.4)], 300)
+    assert (lat, lng) == pytest.approx((24.1, 120.2), abs=1e-3)
+    assert 1 <= zoom <= maps.MAX_ZOOM
+    assert fit_view([(24.0, 120.0)], 300) == ((24.0, 120.0), maps.MAX_ZOOM)
@@ -0,0 +1,96 @@
+# profiler.py：nearest-rank 百分位、ring buffer、區段計時、JSONL 匯出
+import json
+import math
+import threading
+
+import numpy as np
+import pytest
+
+from profiler import Profiler, percentile
+
+
+def _nearest_rank(values, p):
+    # 對照組：定義直接寫（排序後第 ceil(p/100 × n) 個，至少第 1 個）
+    v = sorted(values)
+    return v[max(1, math.ceil(p / 100 * len(v))) - 1]
+
+
+@pytest.mark.parametrize("n", [1, 2, 3, 10, 19, 20, 21, 100, 513])
+def test_percentile_nearest_rank(n):
+    values = sorted(np.random.default_rng(n).exponential(10.0, n).tolist())
+    for p in (0, 1, 50, 90, 95, 99, 100):
+        assert percentile(values, p) == _nearest_rank(values, p)
+    assert percentile(values, 100) == values[-1]
+    assert percentile(values, 0) == values[0]
+
+
+def test_summary_percentiles():
+    prof = Profiler()
+    for ms in range(1, 101):  # 1..100 ms，打亂順序記錄
+        prof.record("8 報到", float((ms * 37) % 100 + 1), ts=ms)
+    prof.record("地圖", 5.0)
+    rows = prof.summary()
+    assert [r["section"] for r in rows] == ["8 報到", "地圖"]  # 依第一次記錄的順序
+    r = rows[0]
+    assert (r["count"], r["p50_ms"], r["p95_ms"], r["max_ms"]) == (100, 50.0, 95.0, 100.0)
+    assert r["last_ms"] == float((100 * 37) % 100 + 1)
+    assert rows[1] == {"section": "地圖", "count": 1, "p50_ms": 5.0, "p95_ms": 5.0, "max_ms": 5.0, "last_ms": 5.0}
+
+
+def test_ring_buffer_keeps_recent_window():
+    prof = Profiler(window=10)
+    for i in range(25):
+        prof.record("s", float(i), ts=i)
+    r = prof.summary()[0]
+    assert r["count"] == 10 and r["max_ms"] == 24.0 and r["p50_ms"] == 19.0
+    assert prof.total == 25
+    prof.clear()
+    assert prof.summary() == [] and prof.total == 0
+
+
+def test_span_timed_and_sections():
+    prof = Profiler()
+
+    @prof.timed("f")
+    def f(x):
+        return x * 2
+
+    assert f(3) == 6
+    with pytest.raises(ValueError):
+        with prof.span("boom"):
+            raise ValueError()  # 例外也記
+    sec = prof.sections()
+    sec.enter("8 報到")
+    sec.enter("9 第一階段")  # 結束上一段
+    sec.close()
+    sec.close()  # 沒有進行中的區段：不記
+    sec.enter("10 中途 st.stop()")  # 沒 close：不記
+    assert {r["section"]: r["count"] for r in prof.summary()} == {"f": 1, "boom": 1, "8 報到": 1, "9 第一階段": 1}
+
+
+def test_concurrent_records():
+    prof = Profiler(window=100_000)
+
+    def work():
+        for _ in range(1000):
+            prof.record("x", 1.0)
+
+    threads = [threading.Thread(target=work) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert prof.total == 8000 and prof.summary()[0]["count"] == 8000
+
+
+def test_jsonl_export(tmp_path):
+    prof = Profiler()
+    prof.record("b", 2.0, ts=2.0)
+    prof.record("a", 1.0, ts=1.0)
+    lines = prof.to_jsonl().splitlines()
+    assert [json.loads(x) for x in lines] == [{"ts": 1.0, "section": "a", "ms": 1.0}, {"ts": 2.0, "section": "b", "ms": 2.0}]
+    path = str(tmp_path / "p.jsonl")
+    assert prof.write_jsonl(path) == 2
+    assert prof.write_jsonl(path) == 2  # 附加
+    with open(path, encoding="utf-8") as f:
+        assert len(f.read().splitlines()) == 4
@@ -0,0 +1,126 @@
+# routing.py：A* / 多目標 Dijkstra / 反向 Dijkstra 互相對照，加上單行道、快取
+import os
+import importlib.util
+
+import numpy as np
+import pytest
+
+import routing
+from conftest import REPO_ROOT
+from routing import RouteCache, Router, load_road_graph
+
+_spec = importlib.util.spec_from_file_location("bench_routing", os.path.join(REPO_ROOT, "benchmarks", "bench_routing.py"))
+bench_routing = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(bench_routing)
+
+GRID_N = 12
+
+
+@pytest.fixture(scope="module")
+def grid(tmp_path_factory):
+    d = tmp_path_factory.mktemp("grid")
+    osm = str(d / "grid.osm")
+    bench_routing.write_grid_osm(osm, GRID_N)
+    return load_road_graph(osm, cache_dir=str(d))
+
+
+def _floyd(graph, mode):
+    # 對照組：整張圖的全點對最短路（節點少，NumPy 直接做 Floyd–Warshall）
+    indptr, indices, w = graph._adj[mode]
+    n = len(graph)
+    d = np.full((n, n), np.inf)
+    np.fill_diagonal(d, 0.0)
+    src = np.repeat(np.arange(n), np.diff(indptr))
+    np.minimum.at(d, (src, indices), w.astype(np.float64))
+    for k in range(n):
+        d = np.minimum(d, d[:, k : k + 1] + d[k : k + 1, :])
+    return d
+
+
+def test_grid_shortest_paths_agree(grid):
+    ref = _floyd(grid, "car")
+    rng = np.random.default_rng(0)
+    for _ in range(20):
+        s = int(rng.integers(len(grid)))
+        targets = [int(t) for t in rng.choice(len(grid), 6, replace=False)]
+        many = grid.shortest_many_km("car", s, targets)
+        assert sorted(many) == sorted(set(targets))
+        for t in targets:
+            one = grid.shortest_km("car", s, t)
+            assert one == pytest.approx(ref[s, t], rel=1e-5)
+            assert many[t] == pytest.approx(ref[s, t], rel=1e-5)
+        to_t = grid.distances_to("car", targets[0])
+        np.testing.assert_allclose(to_t, ref[:, targets[0]], rtol=1e-5)
+
+
+def test_grid_is_manhattan(grid):
+    # 棋盤路網：最短路 = 東西向 + 南北向的距離；越北東西向越短，所以先往北再往東
+    s, t = 0, len(grid) - 1
+    south_east, north_west = GRID_N - 1, (GRID_N - 1) * GRID_N
+    via = {c: grid.shortest_km("walk", s, c) + grid.shortest_km("walk", c, t) for c in (south_east, north_west)}
+    assert via[north_west] < via[south_east]
+    expect = via[north_west]
+    assert grid.shortest_km("walk", s, t) == pytest.approx(expect, rel=1e-5)
+    assert grid.shortest_km("walk", s, s) == 0.0
+
+
+def test_shortest_many_stops_at_max_km(grid):
+    s, far = 0, len(grid) - 1
+    full = grid.shortest_km("car", s, far)
+    assert grid.shortest_many_km("car", s, [1, far], max_km=full / 2) == {1: pytest.approx(grid.shortest_km("car", s, 1))}
+
+
+def _write_osm(path, body):
+    with open(path, "w", encoding="utf-8") as f:
+        f.write('<?xml version="1.0" encoding="UTF-8"?>\n<osm version="0.6">\n' + body + "</osm>\n")
+    return str(path)
+
+
+def test_oneway_and_footway(tmp_path):
+    #  1 ──單行道(往東)── 2 ── 3        4 ── 5 只有人行道
+    osm = _write_osm(
+        tmp_path / "small.osm",
+        '<node id="1" lat="24.100" lon="120.600"/><node id="2" lat="24.100" lon="120.601"/>'
+        '<node id="3" lat="24.100" lon="120.602"/><node id="4" lat="24.101" lon="120.600"/>'
+        '<node id="5" lat="24.101" lon="120.601"/>'
+        '<way id="1"><nd ref="1"/><nd ref="2"/><tag k="highway" v="residential"/><tag k="oneway" v="yes"/></way>'
+        '<way id="2"><nd ref="2"/><nd ref="3"/><tag k="highway" v="residential"/></way>'
+        '<way id="3"><nd ref="4"/><nd ref="5"/><tag k="highway" v="footway"/></way>'
+        '<way id="4"><nd ref="1"/><nd ref="9"/><tag k="highway" v="residential"/></way>',  # 9 不在檔案裡：略過
+    )
+    g = load_road_graph(osm, cache_dir=str(tmp_path))
+    assert g.shortest_km("car", 0, 2) is not None
+    assert g.shortest_km("car", 2, 0) is None
+    assert g.shortest_km("walk", 2, 0) == pytest.approx(g.shortest_km("walk", 0, 2))
+    assert g.shortest_many_km("car", 2, [0, 1]) == {1: pytest.approx(g.shortest_km("car", 2, 1))}
+    assert np.isinf(g.distances_to("car", 0)[2])
+    assert g.snap("car", 24.101, 120.601)[0] in (0, 1, 2)  # 人行道的節點不給汽車用
+    assert g.snap("walk", 24.101, 120.601)[0] == 4
+    assert g.snap("car", 25.0, 121.0) == (None, None)
+
+
+def test_load_road_graph_reuses_npz(tmp_path, monkeypatch):
+    osm = str(tmp_path / "grid.osm")
+    bench_routing.write_grid_osm(osm, 4)
+    a = load_road_graph(osm, cache_dir=str(tmp_path))
+    monkeypatch.setattr(routing, "parse_osm_roads", lambda path: pytest.fail("應該讀 .npz"))
+    b = load_road_graph(osm, cache_dir=str(tmp_path))
+    assert a.version == b.version
+    np.testing.assert_array_equal(a.lat, b.lat)
+    assert a.edges("car") == b.edges("car")
+
+
+def test_router_caches_by_origin_cell(grid, tmp_path):
+    router = Router(grid, RouteCache(str(tmp_path / "routes.sqlite3")))
+    lat0, lng0, step = bench_routing.LAT0, bench_routing.LNG0, bench_routing.STEP
+    dests = [(lat0 + 5 * step, lng0 + 3 * step), (lat0 + 11 * step, lng0 + 11 * step), (30.0, 130.0)]
+    first = router.distances_km("car", lat0, lng0, dests)
+    assert first[2] is None  # 離道路太遠
+    s = grid.snap("car", lat0, lng0)[0]
+    t = grid.snap("car", *dests[0])[0]
+    assert first[0] == pytest.approx(grid.shortest_km("car", s, t), abs=1e-3)
+    assert router.cache.misses == 3
+
+    assert router.distances_km("car", lat0 + 0.0001, lng0, dests) == first  # 同一個 geohash 格子
+    assert router.cache.hits == 3
+    assert router.distance_km("car", lat0, lng0, *dests[1]) == first[1]
@@ -0,0 +1,71 @@
+# sampling.py：(seed, 用途, 編號) → 同一份抽樣結果；各用途互不影響
+import numpy as np
+import pytest
+
+from catalog import CatalogIndex
+from conftest import make_columns
+from sampling import COOK_CODES, MealSampler
+
+
+@pytest.fixture(scope="module")
+def cat():
+    rows = [("1", f"主菜{i}", 0.1 * i, "每份") for i in range(12)]
+    rows += [("1-1", f"油{i}", 0.01 * i, "每匙") for i in range(3)]
+    rows += [("1-2", f"水{i}", 0.001 * i, "每杯") for i in range(2)]
+    rows += [("2", f"飲料{i}", 0.2, "每杯") for i in range(6)]
+    rows += [("3", f"甜點{i}", 0.3, "每個") for i in range(4)]
+    rng = np.random.default_rng(7)
+    return CatalogIndex(make_columns([rows[i] for i in rng.permutation(len(rows))]), version="t")
+
+
+def _draws(s: MealSampler):
+    return (
+        [s.meal(m).tolist() for m in range(5)],
+        [s.cooking(m, d, method) for m in range(3) for d in range(3) for method in COOK_CODES],
+        [s.drink(d) for d in range(5)],
+        [s.dessert_pool(p).tolist() for p in range(3)],
+    )
+
+
+def test_same_seed_same_draws(cat):
+    assert _draws(MealSampler(cat, 42)) == _draws(MealSampler(cat, 42))
+    assert _draws(MealSampler(cat, 42)) != _draws(MealSampler(cat, 43))
+
+
+def test_draws_do_not_depend_on_order(cat):
+    a, b = MealSampler(cat, 9), MealSampler(cat, 9)
+    meal = a.meal(0).tolist()
+    for d in range(10):  # 一直換飲料、翻甜點池
+        b.drink(d)
+        b.dessert_pool(d)
+    assert b.meal(0).tolist() == meal
+    assert b.cooking(0, 1, "煎炸") == a.cooking(0, 1, "煎炸")
+    # 切到水煮再切回煎炸：還是同一個
+    b.cooking(0, 1, "水煮")
+    assert b.cooking(0, 1, "煎炸") == a.cooking(0, 1, "煎炸")
+
+
+def test_rows_match_their_code(cat):
+    s = MealSampler(cat, 1)
+    assert set(s.meal(0)) <= set(cat.rows("1"))
+    assert s.cooking(0, 0, "煎炸") in set(cat.rows("1-1"))
+    assert s.cooking(0, 0, "水煮") in set(cat.rows("1-2"))
+    assert s.drink(0) in set(cat.rows("2"))
+    assert set(s.dessert_pool(0)) <= set(cat.rows("3"))
+
+
+def test_sample_is_distinct_and_capped(cat):
+    s = MealSampler(cat, 5)
+    for m in range(20):
+        rows = s.meal(m, k=6)
+        assert len(set(rows.tolist())) == 6
+    # 甜點只有 4 種：要 5 個就給 4 個（全部、不重複）
+    pool = s.dessert_pool(0, k=5)
+    assert sorted(pool.tolist()) == sorted(cat.rows("3").tolist())
+
+
+def test_pick_empty_code_raises(cat):
+    s = MealSampler(cat, 0)
+    with pytest.raises(ValueError, match="code = 4-1"):
+        s._pick("4-1", 0)
+    assert len(s._sample("4-1", 3, 0)) == 0
@@ -0,0 +1,213 @@
+# sheets.py：SheetsClient / ResultOutbox 對本機假的 gspread 後端（tests/fake_gspread.py）
+import json
+import time
+import sqlite3
+
+import pytest
+
+from fake_gspread import FakeClient
+from sheets import RESULTS_WORKSHEET, ResultOutbox, SheetsClient
+
+KEY = "1AbCdEfGhIjKlMnOpQrStUvWxYz0123456789_-"
+
+
+@pytest.fixture
+def gc():
+    client = FakeClient()
+    client.create("全班結果", KEY)
+    return client
+
+
+def test_empty_sheet_writes_header_with_first_row(gc):
+    sc = SheetsClient(gc)
+    sc.append_row("全班結果", {"name": "A", "total": 1.5})
+    ws = gc.files[KEY].sheets[RESULTS_WORKSHEET]
+    assert gc.calls["add_worksheet"] == 1
+    assert ws.rows == [["name", "total"], ["A", 1.5]]
+    assert gc.calls["append_rows"] == 1  # 標題列與資料同一次寫入
+    assert gc.calls["append_row"] == 0
+
+
+def test_key_and_header_are_cached(gc):
+    sc = SheetsClient(gc)
+    for i in range(3):
+        sc.append_row("全班結果", {"name": str(i), "total": i})
+    assert gc.calls["open"] == 1          # 檔名只搜尋一次
+    assert gc.calls["open_by_key"] == 0
+    assert gc.calls["worksheet"] == 1
+    assert gc.calls["row_values"] == 1    # 標題列只讀一次
+    assert gc.calls["append_row"] == 2
+    ws = gc.files[KEY].sheets[RESULTS_WORKSHEET]
+    assert ws.rows[1:] == [["0", 0], ["1", 1], ["2", 2]]
+
+
+def test_open_by_url_skips_drive_search(gc):
+    sc = SheetsClient(gc)
+    sc.append_row(f"https://docs.google.com/spreadsheets/d/{KEY}/edit#gid=0", {"name": "A"})
+    assert gc.calls["open"] == 0
+    assert gc.calls["open_by_key"] == 1
+
+
+def test_existing_header_order_is_used(gc):
+    ws = gc.files[KEY].add_worksheet(RESULTS_WORKSHEET, rows=10, cols=5)
+    ws.rows.append(["total", "name"])
+    SheetsClient(gc).append_rows("全班結果", [{"name": "A", "total": 1}, {"name": "B", "total": 2}])
+    assert ws.rows == [["total", "name"], [1, "A"], [2, "B"]]
+
+
+def test_invalidate(gc):
+    sc = SheetsClient(gc)
+    sc.append_row("全班結果", {"name": "A"})
+
+    sc.invalidate("全班結果")  # 只丟 worksheet / 標題列；檔名 → key 還記得
+    sc.append_row("全班結果", {"name": "B"})
+    assert gc.calls["open"] == 1
+    assert gc.calls["open_by_key"] == 1
+    assert gc.calls["row_values"] == 2
+
+    sc.invalidate("全班結果", forget_key=True)
+    sc.append_row("全班結果", {"name": "C"})
+    assert gc.calls["open"] == 2
+
+    sc.invalidate()
+    sc.append_row("全班結果", {"name": "D"})
+    assert gc.calls["open"] == 3
+    assert [r[0] for r in gc.files[KEY].sheets[RESULTS_WORKSHEET].rows] == ["name", "A", "B", "C", "D"]
+
+
+def test_deleted_worksheet_is_recreated(gc):
+    sc = SheetsClient(gc)
+    sc.append_row("全班結果", {"name": "A"})
+    gc.files[KEY].delete(RESULTS_WORKSHEET)
+
+    sc.append_row("全班結果", {"name": "B"})  # 快取的 worksheet 失效 → 丟掉快取重抓一次
+    assert gc.calls["add_worksheet"] == 2
+    assert gc.files[KEY].sheets[RESULTS_WORKSHEET].rows == [["name"], ["B"]]
+
+
+def test_other_errors_are_not_retried(gc):
+    sc = SheetsClient(gc)
+    sc.append_row("全班結果", {"name": "A"})
+    ws = gc.files[KEY].sheets[RESULTS_WORKSHEET]
+
+    def quota(values):
+        gc.calls["append_row"] += 1
+        raise RuntimeError("429 quota exceeded")
+
+    ws.append_row = quota
+    with pytest.raises(RuntimeError):
+        sc.append_row("全班結果", {"name": "B"})
+    assert gc.calls["append_row"] == 1
+    assert gc.calls["worksheet"] == 1
+
+
+# =========================
+# ResultOutbox
+# =========================
+def _row(device="dev1", **kw):
+    row = {"timestamp": "2026-01-01 10:00:00", "device_id": device, "sample_key": "seed=1 meal=0", "total": 1.0}
+    row.update(kw)
+    return row
+
+
+class FailingClient:
+    def __init__(self):
+        self.calls = 0
+
+    def append_rows(self, sheet_ref, rows):
+        self.calls += 1
+        raise PermissionError("403 caller does not have permission")
+
+
+def _outbox(tmp_path, client, **kw):
+    kw.setdefault("backoff_base", 0.0)  # 測試不等退避
+    return ResultOutbox(str(tmp_path / "outbox.sqlite3"), client_factory=lambda: client, **kw)
+
+
+def test_outbox_dedup_ignores_timestamp(tmp_path, gc):
+    ob = _outbox(tmp_path, SheetsClient(gc))
+    assert ob.enqueue("全班結果", _row())
+    assert not ob.enqueue("全班結果", _row(timestamp="2026-01-01 10:00:05"))  # rerun 後再按一次
+    assert ob.enqueue("全班結果", _row(total=2.0))                           # 換了甜點 → 另一筆結果
+    assert ob.enqueue("全班結果", _row(sample_key="seed=1 meal=1"))
+    assert ob.status("dev1") == {"pending": 3, "sent": 0, "failed": 0, "last_error": None}
+
+    assert ob.drain_once() == 3
+    assert gc.calls["append_rows"] == 1  # 同一批一次寫入
+    assert ob.status("dev1")["sent"] == 3
+    assert ob.status("dev2")["sent"] == 0
+
+
+def test_outbox_gives_up_after_max_attempts(tmp_path):
+    client = FailingClient()
+    ob = _outbox(tmp_path, client, max_attempts=3)
+    ob.enqueue("全班結果", _row())
+    for _ in range(5):
+        ob.drain_once()
+    assert client.calls == 3
+    st = ob.status("dev1")
+    assert (st["pending"], st["failed"]) == (0, 1)
+    assert "permission" in st["last_error"]
+    assert ob._seconds_until_due() == 5.0  # 失敗的列不會再叫醒 worker
+
+    assert ob.retry_failed("dev1") == 1
+    ob.drain_once()
+    assert client.calls == 4
+    assert ob.status()["failed"] == 0 and ob.status()["pending"] == 1
+
+
+def test_outbox_prunes_old_sent_rows(tmp_path, gc):
+    ob = _outbox(tmp_path, SheetsClient(gc), keep_sent=60.0)
+    ob.enqueue("全班結果", _row())
+    ob.drain_once()
+    assert ob.prune() == 0
+    assert ob.prune(now=time.time() + 120) == 1
+    assert ob.status("dev1") == {"pending": 0, "sent": 0, "failed": 0, "last_error": None}
+
+
+def test_outbox_status_uses_device_index(tmp_path):
+    ob = _outbox(tmp_path, FailingClient())
+    plan = " ".join(r[-1] for r in ob._db().execute("EXPLAIN QUERY PLAN SELECT COUNT(*) FROM outbox WHERE device_id = ?", ("x",)))
+    assert "outbox_device" in plan
+
+
+def test_outbox_migrates_old_schema(tmp_path):
+    path = str(tmp_path / "outbox.sqlite3")
+    db = sqlite3.connect(path)
+    db.execute(
+        """
+        CREATE TABLE outbox (
+            id INTEGER PRIMARY KEY AUTOINCREMENT, sheet_ref TEXT NOT NULL, dedup_key TEXT NOT NULL UNIQUE,
+            row_json TEXT NOT NULL, created REAL NOT NULL, attempts INTEGER NOT NULL DEFAULT 0,
+            next_try REAL NOT NULL DEFAULT 0, lease_until REAL NOT NULL DEFAULT 0, sent REAL, last_error TEXT
+        )
+        """
+    )
+    db.execute(
+        "INSERT INTO outbox (sheet_ref, dedup_key, row_json, created) VALUES (?, ?, ?, ?)",
+        ("全班結果", "old", json.dumps(_row(device="dev9")), time.time()),
+    )
+    db.commit()
+    db.close()
+
+    ob = ResultOutbox(path, client_factory=FailingClient)
+    assert ob.status("dev9")["pending"] == 1
+
+
+def test_new_keys_extend_existing_header(gc):
+    ws = gc.files[KEY].add_worksheet(RESULTS_WORKSHEET, rows=10, cols=5)
+    ws.rows.append(["name", "total"])
+    sc = SheetsClient(gc)
+    sc.append_row("全班結果", {"name": "A", "total": 1, "catalog_version": "abc", "sample_key": "seed=1"})
+    assert ws.rows == [["name", "total", "catalog_version", "sample_key"], ["A", 1, "abc", "seed=1"]]
+    assert gc.calls["update"] == 1
+
+    sc.append_row("全班結果", {"name": "B", "total": 2, "catalog_version": "abc", "sample_key": "seed=2"})
+    assert gc.calls["update"] == 1  # 標題列已經有了：不再改
+    assert gc.calls["row_values"] == 1
+    assert ws.rows[-1] == ["B", 2, "abc", "seed=2"]
+
+
+def test_empty_sheet_header_covers_all_rows(gc):
+    SheetsClient(gc).append_rows("全班結果", [{"name": "A"}, {"name": "B", "note": "x"}])
+    assert gc.files[KEY].sheets[RESULTS_WORKSHEET].rows == [["name", "note"], ["A", ""], ["B", "x"]]
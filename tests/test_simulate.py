@@ -0,0 +1,73 @@
+# simulate.py：結果與行程數無關；子行程數受限
+import threading
+
+import numpy as np
+import pytest
+
+import simulate
+from catalog import CatalogIndex
+from conftest import SMALL_CATALOG, make_columns
+from simulate import SimSpec, simulate_meals
+
+
+@pytest.fixture(scope="module")
+def spec():
+    return SimSpec.from_catalog(CatalogIndex(make_columns(SMALL_CATALOG), version="t"))
+
+
+class NoPool:
+    def __init__(self, *args, **kwargs):
+        raise AssertionError("不應該開子行程")
+
+
+def test_small_n_runs_in_process(spec, monkeypatch):
+    monkeypatch.setattr(simulate, "ProcessPoolExecutor", NoPool)
+    monkeypatch.setattr(simulate, "SIM_CHUNK", 1000)
+    res = simulate_meals(spec, 5000, seed=1)
+    assert res.n == 5000 and sum(res.counts) == 5000
+
+
+def test_busy_pool_falls_back_to_in_process(spec, monkeypatch):
+    monkeypatch.setattr(simulate, "ProcessPoolExecutor", NoPool)
+    monkeypatch.setattr(simulate, "SIM_CHUNK", 1000)
+    monkeypatch.setattr(simulate, "_POOL_SLOT", threading.BoundedSemaphore(1))
+    simulate._POOL_SLOT.acquire()  # 另一位老師的模擬正在用子行程
+    try:
+        res = simulate_meals(spec, 5000, seed=1, processes=4)
+    finally:
+        simulate._POOL_SLOT.release()
+    assert res.n == 5000
+
+
+def test_worker_count_is_capped(spec, monkeypatch):
+    seen = {}
+
+    class FakePool:
+        def __init__(self, max_workers, mp_context):
+            seen["workers"] = max_workers
+
+        def __enter__(self):
+            return self
+
+        def __exit__(self, *exc):
+            return False
+
+        def map(self, fn, *iterables):
+            return map(fn, *iterables)
+
+    monkeypatch.setattr(simulate, "ProcessPoolExecutor", FakePool)
+    monkeypatch.setattr(simulate, "SIM_CHUNK", 1000)
+    monkeypatch.setattr(simulate, "SIM_POOL_MIN_N", 2000)
+    monkeypatch.setattr(simulate, "SIM_WORKERS", 2)
+    monkeypatch.setattr(simulate.os, "cpu_count", lambda: 64)
+    simulate_meals(spec, 10_000, seed=1)
+    assert seen["workers"] == 2
+
+
+def test_result_does_not_depend_on_processes(spec, monkeypatch):
+    monkeypatch.setattr(simulate, "SIM_CHUNK", 2000)
+    one = simulate_meals(spec, 6000, seed=5, processes=1)
+    two = simulate_meals(spec, 6000, seed=5, processes=2)  # 真的開 spawn 子行程
+    np.testing.assert_array_equal(one.quantiles, two.quantiles)
+    np.testing.assert_array_equal(one.counts, two.counts)
+    assert one.mean == two.mean
@@ -0,0 +1,103 @@
+# takeout.py：帶回距離表（與 RoadGraph 對照）、背景計算、python takeout.py build
+import os
+import threading
+import importlib.util
+
+import numpy as np
+import pytest
+
+import takeout
+from conftest import REPO_ROOT
+from routing import Router, load_road_graph
+from takeout import TakeoutTableBuilder, load_takeout_table
+
+_spec = importlib.util.spec_from_file_location("bench_routing", os.path.join(REPO_ROOT, "benchmarks", "bench_routing.py"))
+bench_routing = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(bench_routing)
+LAT0, LNG0, STEP = bench_routing.LAT0, bench_routing.LNG0, bench_routing.STEP
+
+GRID_N = 20
+CAMPUSES = {"A": (LAT0 + 10 * STEP, LNG0 + 10 * STEP), "B": (LAT0 + 2 * STEP, LNG0 + 17 * STEP)}
+
+
+@pytest.fixture(scope="module")
+def graph(tmp_path_factory):
+    d = tmp_path_factory.mktemp("grid")
+    osm = str(d / "grid.osm")
+    bench_routing.write_grid_osm(osm, GRID_N)
+    return load_road_graph(osm, cache_dir=str(d))
+
+
+def _branches(n=30):
+    rng = np.random.default_rng(1)
+    span = (GRID_N - 1) * STEP
+    lat = LAT0 + rng.random(n) * span
+    lng = LNG0 + rng.random(n) * span
+    # 最後一家在道路網外面：用直線距離
+    return np.append(lat, 30.0), np.append(lng, 130.0)
+
+
+def test_table_matches_router(graph, tmp_path):
+    lat, lng = _branches()
+    table = load_takeout_table(lat, lng, CAMPUSES, graph, cache_dir=str(tmp_path))
+    router = Router(graph)
+    for i in range(len(lat)):
+        for campus, (c_lat, c_lng) in CAMPUSES.items():
+            km, on_road = table.lookup(i, lat[i], lng[i], campus, "car")
+            want = router.distance_km("car", lat[i], lng[i], c_lat, c_lng)
+            if want is None:
+                assert not on_road
+            else:
+                assert on_road and km == pytest.approx(want, abs=1e-3)
+    assert table.lookup(0, lat[0] + 0.01, lng[0], "A", "car") is None  # 分店檔換過：座標對不上
+    assert table.lookup(None, lat[0], lng[0], "A", "car") is None
+
+
+def test_router_path_matches_distance(graph):
+    router = Router(graph)
+    lat1, lng1 = LAT0 + 3.2 * STEP, LNG0 + 1.1 * STEP
+    lat2, lng2 = CAMPUSES["B"]
+    path = router.path("car", lat1, lng1, lat2, lng2)
+    assert path[0] == (lat1, lng1) and path[-1] == (lat2, lng2)
+    assert len(path) > 3
+    s, s_km = graph.snap("car", lat1, lng1)
+    t, t_km = graph.snap("car", lat2, lng2)
+    nodes = graph.shortest_path("car", s, t)
+    assert nodes[0] == s and nodes[-1] == t
+    legs = sum(graph.shortest_km("car", a, b) for a, b in zip(nodes, nodes[1:]))
+    assert legs == pytest.approx(graph.shortest_km("car", s, t), rel=1e-5)
+    assert s_km + legs + t_km == pytest.approx(router.distance_km("car", lat1, lng1, lat2, lng2), abs=1e-3)
+    assert router.path("car", 30.0, 130.0, lat2, lng2) is None
+
+
+def test_builder_runs_in_background():
+    gate = threading.Event()
+
+    def build():
+        gate.wait(5.0)
+        return "table"
+
+    b = TakeoutTableBuilder(build).start()
+    assert b.table is None  # 還沒算好：呼叫端先用 trip_km
+    gate.set()
+    assert b.wait(5.0) == "table" and b.table == "table"
+    assert b.start() is b  # 不會再算一次
+
+    def broken():
+        raise ValueError("壞掉的分店檔")
+
+    bad = TakeoutTableBuilder(broken).start()
+    assert bad.wait(5.0) is None and "壞掉" in bad.error
+
+
+def test_cli_build_then_app_reads_file(tmp_path, monkeypatch):
+    stores = tmp_path / "stores.csv"
+    stores.write_text("name,lat,lng\n全聯一店,24.1480,120.6740\n全聯二店,24.1500,120.6700\n", encoding="utf-8")
+    cache = str(tmp_path / "cache")
+    takeout.main(["--cache", cache, "build", "--poi", str(stores), "--roads", str(tmp_path / "none.osm")])
+    assert len(os.listdir(cache)) == 1
+
+    # 同樣的分店 / 校區 / 道路網 → 直接讀檔，不重算
+    monkeypatch.setattr(takeout, "build_takeout_table", lambda *a, **k: pytest.fail("應該讀 build 存好的檔"))
+    table = load_takeout_table([24.1480, 24.1500], [120.6740, 120.6700], takeout.CAMPUSES, None, cache_dir=cache)
+    assert len(table) == 2 and not table.on_road.any()
@@ -0,0 +1,157 @@
+# tiles.py：圖磚快取（總大小上限 + LRU）、代理的 single-flight、本機 HTTP server
+import time
+import sqlite3
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+
+from geo import RequestScheduler
+from tiles import TileCache, TileProxy, TileServer, tile_of, tiles_in_bbox
+
+
+class FakeTileUpstream:
+    """/{z}/{x}/{y}.png 回一段固定內容；記錄每張圖磚被抓了幾次。"""
+
+    def __init__(self, delay: float = 0.0, fail: bool = False):
+        self.delay = delay
+        self.fail = fail
+        self.hits = {}
+        self._lock = threading.Lock()
+        upstream = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                with upstream._lock:
+                    upstream.hits[self.path] = upstream.hits.get(self.path, 0) + 1
+                time.sleep(upstream.delay)
+                if upstream.fail:
+                    self.send_error(503)
+                    return
+                body = f"png{self.path}".encode("ascii")
+                self.send_response(200)
+                self.send_header("Content-Type", "image/png")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}/{{z}}/{{x}}/{{y}}.png"
+        threading.Thread(target=self.server.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def upstream():
+    up = FakeTileUpstream(delay=0.2)
+    yield up
+    up.close()
+
+
+def _proxy(tmp_path, upstream, **kw):
+    cache = TileCache(str(tmp_path / "tiles.sqlite3"), **kw)
+    return TileProxy(cache, upstream=upstream.url, scheduler=RequestScheduler(rate_per_sec=100.0, burst=100, max_retries=0, name="t"))
+
+
+def _sum_size(cache):
+    return sqlite3.connect(cache.path).execute("SELECT COALESCE(SUM(size), 0) FROM tiles").fetchone()[0]
+
+
+def test_proxy_single_flight(tmp_path, upstream):
+    proxy = _proxy(tmp_path, upstream)
+    got = []
+    threads = [threading.Thread(target=lambda: got.append(proxy.fetch(15, 27262, 14186))) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert got == [b"png/15/27262/14186.png"] * 8
+    assert upstream.hits == {"/15/27262/14186.png": 1}
+
+    assert proxy.fetch(15, 27262, 14186) == got[0]  # 之後從快取讀
+    assert upstream.hits == {"/15/27262/14186.png": 1}
+    assert proxy.cache.hits >= 1
+
+
+def test_proxy_serves_stale_tile_when_upstream_fails(tmp_path, upstream):
+    proxy = _proxy(tmp_path, upstream)
+    proxy.ttl_seconds = 0.0
+    first = proxy.fetch(1, 0, 0)
+    upstream.fail = True
+    time.sleep(0.01)
+    assert proxy.fetch(1, 0, 0) == first
+    with pytest.raises(Exception):
+        proxy.fetch(1, 1, 1)
+
+
+def test_cache_evicts_least_recently_used(tmp_path):
+    cache = TileCache(str(tmp_path / "tiles.sqlite3"), max_bytes=3000)
+    for i in range(3):
+        cache.put(10, i, 0, b"x" * 1000)
+    db = sqlite3.connect(cache.path)
+    # 由舊到新：(10,0,0) (10,1,0) (10,2,0)；讀一次 (10,0,0) → 變成最近用過
+    for i, age in enumerate((300, 200, 100)):
+        db.execute("UPDATE tiles SET last_used = ? WHERE x = ?", (time.time() - age, i))
+    db.commit()
+    assert cache.get(10, 0, 0) is not None
+
+    cache.put(10, 3, 0, b"y" * 1000)
+    assert cache.get(10, 1, 0) is None
+    assert all(cache.get(10, i, 0) is not None for i in (0, 2, 3))
+    st = cache.stats()
+    assert st["tiles"] == 3 and st["bytes"] == 3000 == _sum_size(cache)
+
+    cache.put(10, 3, 0, b"z" * 2500)  # 覆寫同一張：總大小要扣掉舊的
+    st = cache.stats()
+    assert st["bytes"] == _sum_size(cache) <= 3000
+    assert cache.get(10, 3, 0)[0] == b"z" * 2500
+
+
+def test_cache_total_survives_reopen(tmp_path):
+    path = str(tmp_path / "tiles.sqlite3")
+    a = TileCache(path)
+    a.put(3, 1, 1, b"abc")
+    b = TileCache(path)  # 第二個 process 打開同一個檔
+    b.put(3, 1, 2, b"defg")
+    a.put(3, 1, 1, b"ab")
+    assert a.stats()["bytes"] == b.stats()["bytes"] == 6 == _sum_size(a)
+
+
+def test_old_cache_file_gets_running_total(tmp_path):
+    path = str(tmp_path / "tiles.sqlite3")
+    TileCache(path).put(3, 1, 1, b"abc")
+    db = sqlite3.connect(path)
+    db.executescript("DROP TABLE tiles_total; DROP TRIGGER tiles_total_ins; DROP TRIGGER tiles_total_del; DROP TRIGGER tiles_total_upd;")
+    db.close()
+    assert TileCache(path).stats()["bytes"] == 3
+
+
+def test_server_routes(tmp_path, upstream):
+    server = TileServer(_proxy(tmp_path, upstream), host="127.0.0.1", port=0).start()
+    try:
+        base = f"http://127.0.0.1:{server.port}"
+        assert server.url_template("127.0.0.1") == base + "/tiles/{z}/{x}/{y}.png"
+        r = requests.get(base + "/tiles/2/1/3.png", timeout=5)
+        assert r.status_code == 200 and r.content == b"png/2/1/3.png"
+        assert r.headers["Content-Type"] == "image/png"
+        for path in ("/tiles/2/4/0.png", "/tiles/2/0/4.png", "/tiles/20/0/0.png", "/tiles/a/b/c.png", "/index.html"):
+            assert requests.get(base + path, timeout=5).status_code == 404, path
+        assert sum(upstream.hits.values()) == 1  # 超出範圍的不會打到上游
+
+        upstream.fail = True
+        assert requests.get(base + "/tiles/2/2/2.png", timeout=5).status_code == 502
+    finally:
+        server.stop()
+
+
+def test_tiles_in_bbox():
+    x, y = tile_of(24.1477, 120.6736, 16)
+    assert tiles_in_bbox((24.1477, 120.6736, 24.1477, 120.6736), [16]) == [(16, x, y)]
+    assert len(tiles_in_bbox((24.10, 120.60, 24.20, 120.70), [12, 13])) >= 2
@@ -0,0 +1,335 @@
+# tiles.py：地圖圖磚的本機快取代理（選用；全班共用一份）
+#
+# 不呼叫 streamlit。原本每支手機、每次畫地圖都直接向 tile.openstreetmap.org 抓同一批台中圖磚；
+# 開了這個代理之後，瀏覽器改向 app 旁邊的小 HTTP server 要圖磚：
+#   - 磁碟快取（SQLite，總大小上限 + LRU），跨 session / 跨 process 共用
+#   - 快取沒有的才向上游抓；同一張圖磚同時被很多人要，只抓一次（geo.RequestScheduler）
+#   - 可預先抓好台中教育大學附近的範圍（prewarm），上課時就全部從區網讀
+#
+#   python tiles.py serve --port 8765
+#   python tiles.py prewarm 24.1477 120.6736 --radius-km 3 --zooms 12-16
+
+from __future__ import annotations
+
+import re
+import math
+import time
+import sqlite3
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from lazy import lazy_module
+from geo import EARTH_RADIUS_KM, RequestScheduler
+
+requests = lazy_module("requests")
+
+TILE_UPSTREAM = "https://tile.openstreetmap.org/{z}/{x}/{y}.png"
+TILE_ATTRIBUTION = '&copy; <a href="https://www.openstreetmap.org/copyright">OpenStreetMap</a> contributors'
+TILE_USER_AGENT = "carbon-footprint-edu-app/1.0 (classroom tile cache)"
+TILE_CACHE_PATH = ".tile_cache.sqlite3"
+TILE_CACHE_MAX_BYTES = 512 * 1024 * 1024
+TILE_TTL_SECONDS = 7 * 24 * 3600  # OSM 圖磚使用規範：快取至少 7 天
+TILE_PROXY_PORT = 8765
+MAX_ZOOM = 19
+PREWARM_MAX_TILES = 5000  # 避免一次大量下載（OSM 規範禁止 bulk download）
+
+
+# =========================
+# 1) 圖磚座標（Web Mercator / slippy map）
+# =========================
+def tile_of(lat: float, lng: float, z: int) -> tuple:
+    n = 2**z
+    lat = max(min(lat, 85.0511), -85.0511)
+    x = int((lng + 180.0) / 360.0 * n)
+    y = int((1.0 - math.asinh(math.tan(math.radians(lat))) / math.pi) / 2.0 * n)
+    return min(max(x, 0), n - 1), min(max(y, 0), n - 1)
+
+
+def bbox_around(lat: float, lng: float, radius_km: float) -> tuple:
+    """中心點 ± radius_km 的 (south, west, north, east)。"""
+    d_lat = math.degrees(radius_km / EARTH_RADIUS_KM)
+    d_lng = d_lat / max(0.1, math.cos(math.radians(lat)))
+    return lat - d_lat, lng - d_lng, lat + d_lat, lng + d_lng
+
+
+def tiles_in_bbox(bbox: tuple, zooms) -> list:
+    south, west, north, east = bbox
+    out = []
+    for z in zooms:
+        x0, y0 = tile_of(north, west, z)
+        x1, y1 = tile_of(south, east, z)
+        out.extend((z, x, y) for x in range(x0, x1 + 1) for y in range(y0, y1 + 1))
+    return out
+
+
+# =========================
+# 2) 磁碟快取（SQLite；總大小超過上限就刪最久沒用到的）
+#    總大小記在 tiles_total（一列），由 trigger 隨新增/刪除/覆寫更新：
+#    每次 put 不必 SUM 整張表，app 和 tiles.py prewarm 兩個 process 一起寫也不會算錯
+# =========================
+class TileCache:
+    def __init__(self, path: str = TILE_CACHE_PATH, max_bytes: int = TILE_CACHE_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._local = threading.local()
+
+        db = self._db()
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute(
+            """
+            CREATE TABLE IF NOT EXISTS tiles (
+                z INTEGER NOT NULL,
+                x INTEGER NOT NULL,
+                y INTEGER NOT NULL,
+                data BLOB NOT NULL,
+                size INTEGER NOT NULL,
+                fetched REAL NOT NULL,
+                last_used REAL NOT NULL,
+                PRIMARY KEY (z, x, y)
+            )
+            """
+        )
+        db.execute("CREATE INDEX IF NOT EXISTS tiles_lru ON tiles (last_used)")
+        db.commit()
+        # 舊版快取檔沒有 tiles_total：建表、trigger 和第一次加總要在同一個交易裡（別的 process 可能正在寫）
+        db.execute("BEGIN IMMEDIATE")
+        db.execute("CREATE TABLE IF NOT EXISTS tiles_total (id INTEGER PRIMARY KEY CHECK (id = 0), bytes INTEGER NOT NULL)")
+        db.execute(
+            "CREATE TRIGGER IF NOT EXISTS tiles_total_ins AFTER INSERT ON tiles "
+            "BEGIN UPDATE tiles_total SET bytes = bytes + NEW.size; END"
+        )
+        db.execute(
+            "CREATE TRIGGER IF NOT EXISTS tiles_total_del AFTER DELETE ON tiles "
+            "BEGIN UPDATE tiles_total SET bytes = bytes - OLD.size; END"
+        )
+        db.execute(
+            "CREATE TRIGGER IF NOT EXISTS tiles_total_upd AFTER UPDATE OF size ON tiles "
+            "BEGIN UPDATE tiles_total SET bytes = bytes + NEW.size - OLD.size; END"
+        )
+        db.execute("INSERT OR IGNORE INTO tiles_total (id, bytes) SELECT 0, COALESCE(SUM(size), 0) FROM tiles")
+        db.commit()
+
+    def _db(self):
+        # sqlite 連線不能跨執行緒共用：每個執行緒各開一條
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=30)
+            db.execute("PRAGMA synchronous=NORMAL")
+            self._local.db = db
+        return db
+
+    def get(self, z: int, x: int, y: int):
+        """(data, fetched) 或 None。"""
+        db = self._db()
+        row = db.execute("SELECT data, fetched, last_used FROM tiles WHERE z = ? AND x = ? AND y = ?", (z, x, y)).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        now = time.time()
+        if now - row[2] > 60:  # 同一張圖磚一分鐘內被讀很多次，只記一次使用時間
+            db.execute("UPDATE tiles SET last_used = ? WHERE z = ? AND x = ? AND y = ?", (now, z, x, y))
+            db.commit()
+        return bytes(row[0]), row[1]
+
+    def put(self, z: int, x: int, y: int, data: bytes) -> None:
+        now = time.time()
+        db = self._db()
+        # 用 UPSERT 而不是 INSERT OR REPLACE：REPLACE 刪掉舊列時不會觸發 DELETE trigger
+        db.execute(
+            "INSERT INTO tiles (z, x, y, data, size, fetched, last_used) VALUES (?, ?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT (z, x, y) DO UPDATE SET "
+            "data = excluded.data, size = excluded.size, fetched = excluded.fetched, last_used = excluded.last_used",
+            (z, x, y, sqlite3.Binary(data), len(data), now, now),
+        )
+        total = self._total(db)
+        if total > self.max_bytes:
+            # LRU：由最久沒用到的開始刪，刪到總大小回到上限以內
+            over = total - self.max_bytes
+            doomed, freed = [], 0
+            for key_z, key_x, key_y, size in db.execute("SELECT z, x, y, size FROM tiles ORDER BY last_used"):
+                doomed.append((key_z, key_x, key_y))
+                freed += size
+                if freed >= over:
+                    break
+            db.executemany("DELETE FROM tiles WHERE z = ? AND x = ? AND y = ?", doomed)
+        db.commit()
+
+    @staticmethod
+    def _total(db) -> int:
+        return db.execute("SELECT bytes FROM tiles_total").fetchone()[0]
+
+    def stats(self) -> dict:
+        db = self._db()
+        n, size = db.execute("SELECT COUNT(*) FROM tiles").fetchone()[0], self._total(db)
+        return {"hits": self.hits, "misses": self.misses, "tiles": n, "bytes": size, "max_bytes": self.max_bytes}
+
+
+# =========================
+# 3) 代理：先查快取，沒有（或過期）才向上游抓
+# =========================
+def download_tile(z: int, x: int, y: int, url: str = TILE_UPSTREAM) -> bytes:
+    r = requests.get(url.format(z=z, x=x, y=y), headers={"User-Agent": TILE_USER_AGENT}, timeout=15)
+    r.raise_for_status()
+    return r.content
+
+
+class TileProxy:
+    def __init__(
+        self,
+        cache: TileCache,
+        upstream: str = TILE_UPSTREAM,
+        ttl_seconds: float = TILE_TTL_SECONDS,
+        scheduler: RequestScheduler = None,
+    ):
+        self.cache = cache
+        self.upstream = upstream
+        self.ttl_seconds = ttl_seconds
+        # 向上游一次只抓一張、限速；同一張圖磚同時被很多人要時合併成一次
+        self.scheduler = scheduler or RequestScheduler(rate_per_sec=8.0, burst=16, name="tile-fetch")
+
+    def fetch(self, z: int, x: int, y: int) -> bytes:
+        cached = self.cache.get(z, x, y)
+        if cached is not None and time.time() - cached[1] <= self.ttl_seconds:
+            return cached[0]
+        try:
+            data = self.scheduler.run((z, x, y), self._download, z, x, y, timeout=30.0)
+        except Exception:
+            if cached is not None:
+                return cached[0]  # 上游抓不到：先給舊的
+            raise
+        return data
+
+    def _download(self, z: int, x: int, y: int) -> bytes:
+        data = download_tile(z, x, y, self.upstream)
+        self.cache.put(z, x, y, data)
+        return data
+
+    def prewarm(self, bbox: tuple, zooms, max_tiles: int = PREWARM_MAX_TILES, on_progress=None) -> dict:
+        """先把 bbox 內各縮放層級的圖磚抓進快取；已經有（沒過期）的略過。"""
+        tiles = tiles_in_bbox(bbox, zooms)
+        if len(tiles) > max_tiles:
+            raise ValueError(f"範圍太大：{len(tiles)} 張圖磚（上限 {max_tiles}）；請縮小半徑或縮放層級")
+        out = {"tiles": len(tiles), "cached": 0, "fetched": 0, "failed": 0}
+        now = time.time()
+        for i, (z, x, y) in enumerate(tiles, start=1):
+            cached = self.cache.get(z, x, y)
+            if cached is not None and now - cached[1] <= self.ttl_seconds:
+                out["cached"] += 1
+            else:
+                try:
+                    self.scheduler.run((z, x, y), self._download, z, x, y, timeout=60.0)
+                    out["fetched"] += 1
+                except Exception:
+                    out["failed"] += 1
+            if on_progress is not None:
+                on_progress(i, len(tiles))
+        return out
+
+
+# =========================
+# 4) 圖磚 HTTP server（跟 streamlit 同一個 process，背景執行緒）
+#    GET /tiles/{z}/{x}/{y}.png
+# =========================
+_TILE_PATH = re.compile(r"^/tiles/(\d+)/(\d+)/(\d+)\.png$")
+
+
+def _handler_for(proxy: TileProxy):
+    class TileHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            m = _TILE_PATH.match(self.path.split("?", 1)[0])
+            if m is None:
+                self.send_error(404)
+                return
+            z, x, y = (int(v) for v in m.groups())
+            if z > MAX_ZOOM or x >= 2**z or y >= 2**z:
+                self.send_error(404)
+                return
+            try:
+                data = proxy.fetch(z, x, y)
+            except Exception:
+                self.send_error(502, "upstream tile fetch failed")
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", "image/png")
+            self.send_header("Content-Length", str(len(data)))
+            self.send_header("Cache-Control", "public, max-age=86400")
+            self.send_header("Access-Control-Allow-Origin", "*")
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, format, *args):
+            pass  # 一堂課幾千個請求，不要洗版
+
+    return TileHandler
+
+
+class TileServer:
+    def __init__(self, proxy: TileProxy, host: str = "0.0.0.0", port: int = TILE_PROXY_PORT):
+        self.proxy = proxy
+        self.host = host
+        self.port = port
+        self._httpd = None
+        self._thread = None
+
+    def url_template(self, host: str) -> str:
+        """瀏覽器用的圖磚網址（host：學生手機連得到的 server 位址）。"""
+        return f"http://{host}:{self.port}/tiles/{{z}}/{{x}}/{{y}}.png"
+
+    def start(self) -> "TileServer":
+        if self._httpd is None:
+            self._httpd = ThreadingHTTPServer((self.host, self.port), _handler_for(self.proxy))
+            self._httpd.daemon_threads = True
+            self.port = self._httpd.server_address[1]  # port=0 時拿到實際的 port
+            self._thread = threading.Thread(target=self._httpd.serve_forever, name="tile-server", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        if self._httpd is not None:
+            self._httpd.shutdown()
+            self._httpd.server_close()
+            self._httpd = None
+
+
+# =========================
+# 5) 指令列：單獨跑 server / 課前先抓好圖磚
+# =========================
+def _zoom_range(text: str) -> range:
+    lo, _, hi = text.partition("-")
+    return range(int(lo), int(hi or lo) + 1)
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="地圖圖磚快取代理")
+    ap.add_argument("--cache", default=TILE_CACHE_PATH)
+    ap.add_argument("--max-mb", type=int, default=TILE_CACHE_MAX_BYTES // (1024 * 1024))
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    sp = sub.add_parser("serve")
+    sp.add_argument("--host", default="0.0.0.0")
+    sp.add_argument("--port", type=int, default=TILE_PROXY_PORT)
+    pp = sub.add_parser("prewarm")
+    pp.add_argument("lat", type=float)
+    pp.add_argument("lng", type=float)
+    pp.add_argument("--radius-km", type=float, default=3.0)
+    pp.add_argument("--zooms", type=_zoom_range, default=_zoom_range("12-16"))
+    args = ap.parse_args(argv)
+
+    proxy = TileProxy(TileCache(args.cache, max_bytes=args.max_mb * 1024 * 1024))
+    if args.cmd == "serve":
+        server = TileServer(proxy, args.host, args.port).start()
+        print(f"serving {server.url_template(args.host)}")
+        try:
+            server._thread.join()
+        except KeyboardInterrupt:
+            server.stop()
+    else:
+        out = proxy.prewarm(bbox_around(args.lat, args.lng, args.radius_km), args.zooms)
+        print(out, proxy.cache.stats())
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,7 @@
 # app.py（完整：主餐+料理+飲料+採買交通(地圖選分店)+甜點(隨機5選2)+餐具包材(可複選)+圖表(圓餅含比例/長條)+CSV下載+可選Google Sheet記錄）
 #
 # 需要套件（requirements.txt 需要有）：
-# streamlit
+# streamlit>=1.65（第一階段用 fragment 局部重跑）
 # pandas
 # openpyxl
 # altair
@@ -9,26 +9,52 @@
 # folium
 # streamlit-folium
 # streamlit-geolocation
+# numpy
 # gspread
 # google-auth
 
-import re
-import random
-import math
+import os
+import hmac
 import uuid
-from io import BytesIO
+import secrets
+import threading
 from datetime import datetime
 
-import pandas as pd
 import streamlit as st
-import altair as alt
-import requests
-import folium
-from streamlit_folium import st_folium
 
 # geolocation：注意不要傳 key=...（你之前 TypeError 就是因為這個）
 from streamlit_geolocation import streamlit_geolocation
 
+from lazy import lazy_module
+from catalog import CATALOGS, CatalogIndex, catalog_from_file
+from catalog_manager import CatalogManager, remap_rows
+from charts import bar_spec, chart_key, pie_spec
+from maps import MapBadge, MapLine, MapMarker, fit_view, render_map
+from profiler import PROFILE_WINDOW, Profiler
+from routing import ROAD_GRAPH_PATH_DEFAULT, ROUTE_CACHE_PATH, RouteCache, Router, load_road_graph
+from takeout import CAMPUSES, TakeoutTableBuilder, load_takeout_table
+from tiles import TILE_CACHE_PATH, TileCache, TileProxy, TileServer, bbox_around
+from footprint import NO_ROW, Meal, MealFootprint
+from sampling import MealSampler
+from sheets import OUTBOX_PATH, ResultOutbox, SheetsClient
+from simulate import SimResult, SimSpec, simulate_meals
+from geo import (
+    GEO_CACHE_PATH,
+    POI_PATH_DEFAULT,
+    GeoSearchCache,
+    PoiIndex,
+    RequestScheduler,
+    cached_search_nearby,
+    haversine_km,
+    load_poi_file,
+    nearest_index,
+    rank_by_distance,
+)
+
+# 報到頁用不到的重套件：第一次用到才載入（畫模擬分布圖才載 altair；folium 在 maps.py）
+pd = lazy_module("pandas")
+alt = lazy_module("altair")
+
 
 # =========================
 # 0) 基本設定
@@ -58,8 +84,8 @@ h1, h2, h3 { letter-spacing: 0.2px; }
 
 APP_TITLE = "🍽️ 一餐的碳足跡大冒險：從農場到你的胃"
 
-# 你 repo 內的預設 Excel 檔名（在 repo 根目錄）
-EXCEL_PATH_DEFAULT = "產品碳足跡3.xlsx"
+# 你 repo 內的預設 Excel 檔名（在 repo 根目錄）；環境變數 CATALOG_FILE 可改用別份，不必改程式
+EXCEL_PATH_DEFAULT = os.environ.get("CATALOG_FILE", "產品碳足跡3.xlsx")
 
 # 報到名單（你可自行加）
 VALID_IDS = {
@@ -67,182 +93,234 @@ VALID_IDS = {
     "BEE114108陳依萱": {"name": "依萱"},
 }
 
-# 台中教育大學（預設座標；你也可以改成你要的）
-NTSU_LAT = 24.1477
-NTSU_LNG = 120.6736
+# 台中教育大學（預設座標）與帶回的目的地：改 takeout.py 的 CAMPUSES
+# （可以再加其他校區，第二階段會多出「帶回 XX」的選項；python takeout.py build 也用同一份）
+NTSU_LAT, NTSU_LNG = CAMPUSES["台中教育大學"]
+
+
+# 各區段計時（全部 session 共用；網址加 ?debug=1 看 p50/p95、下載 JSONL）
+# 環境變數 PROFILE_WINDOW 可改每個區段保留的筆數
+@st.cache_resource(show_spinner=False)
+def get_profiler() -> Profiler:
+    return Profiler(int(os.environ.get("PROFILE_WINDOW", PROFILE_WINDOW)))
+
+
+profiler = get_profiler()
 
 
 # =========================
 # 1) CF 解析：統一成 gCO2e
 #    支援：800.00g、0.8kg、1.00k、"155.00gCO2e"、"1.00kgCO2e"...
+#    逐格版 parse_cf_to_g 與整欄向量化版 parse_cf_series_to_g 都在 catalog.py
 # =========================
-def parse_cf_to_g(value) -> float:
-    if value is None or (isinstance(value, float) and pd.isna(value)):
-        return float("nan")
-
-    # 數字：預設當作「g」還是「kg」？
-    # 你的資料混用，單純數字很難判斷
-    # 這裡採最保守：若數字 <= 50 當 kg（多數產品 kgCO2e 不會 >50）、否則當 g
-    if isinstance(value, (int, float)):
-        v = float(value)
-        if v <= 50:
-            return v * 1000.0
-        return v
-
-    s = str(value).strip().lower()
-    s = s.replace(" ", "")
-    s = s.replace("kgco2e", "kg").replace("gco2e", "g")
-
-    # 1.00k 代表 1.00kg
-    if re.fullmatch(r"[-+]?\d*\.?\d+k", s):
-        kg = float(s[:-1])
-        return kg * 1000.0
-
-    # 末尾單位
-    m = re.match(r"([-+]?\d*\.?\d+)(kg|g)?$", s)
-    if m:
-        num = float(m.group(1))
-        unit = m.group(2)
-        if unit == "kg":
-            return num * 1000.0
-        if unit == "g":
-            return num
-        # 沒單位：同上，<=50 當 kg
-        return num * 1000.0 if num <= 50 else num
-
-    # 字串內含單位（例如：'800.00g(每瓶...)'）
-    m2 = re.search(r"([-+]?\d*\.?\d+)\s*(kg|g)", s)
-    if m2:
-        num = float(m2.group(1))
-        unit = m2.group(2)
-        return num * 1000.0 if unit == "kg" else num
-
-    # 兜底：抓第一個數字
-    m3 = re.search(r"([-+]?\d*\.?\d+)", s)
-    if m3:
-        num = float(m3.group(1))
-        return num * 1000.0 if num <= 50 else num
-
-    return float("nan")
-
-
-def g_to_kg(g):
-    return float(g) / 1000.0
 
 
 # =========================
-# 2) 兩點直線距離（km）
+# 2) 兩點直線距離（km）：geo.haversine_km
+#    repo 根目錄有 OSM 道路檔時改用道路距離：routing.Router（起點格子 → 分店的結果存在磁碟快取）
+# 3) 以中心點搜尋附近分店（OSM Nominatim）：geo.nominatim_search_nearby
+#    搜尋結果存在磁碟快取（同一格子、同一關鍵字跨 session 共用）
 # =========================
-def haversine_km(lat1, lon1, lat2, lon2):
-    R = 6371.0
-    phi1, phi2 = math.radians(lat1), math.radians(lat2)
-    dphi = math.radians(lat2 - lat1)
-    dlmb = math.radians(lon2 - lon1)
-    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlmb / 2) ** 2
-    return 2 * R * math.asin(math.sqrt(a))
+@st.cache_resource(show_spinner=False)
+def get_geo_search_cache() -> GeoSearchCache:
+    return GeoSearchCache(GEO_CACHE_PATH)
 
 
-# =========================
-# 3) 以中心點搜尋附近分店（OSM Nominatim）
-# =========================
-def nominatim_search_nearby(query, lat, lng, radius_km=5, limit=60):
-    if not query.strip():
-        return []
-
-    lat_delta = radius_km / 111.0
-    lng_delta = radius_km / (111.0 * max(0.1, math.cos(math.radians(lat))))
-    viewbox = f"{lng-lng_delta},{lat+lat_delta},{lng+lng_delta},{lat-lat_delta}"
-
-    params = {
-        "q": query,
-        "format": "jsonv2",
-        "limit": str(limit),
-        "addressdetails": 1,
-        "viewbox": viewbox,
-        "bounded": 1,
-    }
-    headers = {
-        "User-Agent": "carbon-footprint-edu-app/1.0",
-        "Accept-Language": "zh-TW,zh,en",
-    }
+@st.cache_resource(show_spinner=False)
+def _load_poi_index(path: str, mtime_ns: int) -> PoiIndex:
+    return PoiIndex(load_poi_file(path))
+
+
+def get_poi_index(path: str):
+    # 檔案不存在 → None（只用線上搜尋）；檔案更新（mtime 變了）會自動重建索引
+    try:
+        mtime_ns = os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+    return _load_poi_index(path, mtime_ns)
 
-    r = requests.get("https://nominatim.openstreetmap.org/search", params=params, headers=headers, timeout=10)
-    r.raise_for_status()
-    data = r.json()
-
-    out = []
-    for x in data:
-        display_name = x.get("display_name", "")
-        out.append(
-            {
-                "display_name": display_name,
-                "name": (display_name.split(",")[0] if display_name else "").strip(),
-                "lat": float(x["lat"]),
-                "lng": float(x["lon"]),
-            }
-        )
-    return out
+
+@st.cache_resource(show_spinner="載入道路網…")
+def _load_router(path: str, mtime_ns: int) -> Router:
+    return Router(load_road_graph(path), RouteCache(ROUTE_CACHE_PATH))
+
+
+def get_router():
+    # 道路檔不存在 → None（用直線距離）；環境變數 ROAD_GRAPH_FILE 可指定別份
+    path = os.environ.get("ROAD_GRAPH_FILE", ROAD_GRAPH_PATH_DEFAULT)
+    try:
+        mtime_ns = os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+    return _load_router(path, mtime_ns)
+
+
+@st.cache_resource(show_spinner=False)
+def _takeout_builder(poi_path: str, poi_mtime_ns: int, road_version: str, _graph) -> TakeoutTableBuilder:
+    # 有 python takeout.py build 存好的檔就只是讀檔；沒有的話整張圖的 Dijkstra 在背景執行緒算
+    poi = _load_poi_index(poi_path, poi_mtime_ns)
+    return TakeoutTableBuilder(lambda: load_takeout_table(poi.lat, poi.lng, CAMPUSES, _graph)).start()
+
+
+def get_takeout_table():
+    # 離線分店檔裡每家分店 → 各校區的距離表；沒有分店檔、或還在背景計算 → None。分店檔或道路檔更新會重算
+    try:
+        poi_mtime_ns = os.stat(POI_PATH_DEFAULT).st_mtime_ns
+    except OSError:
+        return None
+    router = get_router()
+    graph = router.graph if router is not None else None
+    return _takeout_builder(POI_PATH_DEFAULT, poi_mtime_ns, getattr(graph, "version", ""), _graph=graph).table
+
+
+@st.cache_data(show_spinner=False, max_entries=256)
+def road_path(mode: str, lat1: float, lng1: float, lat2: float, lng2: float, road_version: str):
+    """兩點間的道路路線（畫地圖用）；road_version 只當快取 key。"""
+    router = get_router()
+    path = router.path(mode, lat1, lng1, lat2, lng2) if router is not None else None
+    return tuple(path) if path else None
+
+
+@st.cache_resource(show_spinner=False)
+def get_nominatim_scheduler() -> RequestScheduler:
+    # 全 process 共用：相同查詢合併成一次、不同查詢每秒最多 1 次（Nominatim 使用規範）
+    return RequestScheduler(rate_per_sec=1.0)
+
+
+# 地圖圖磚快取代理（選用）：設了環境變數 TILE_PROXY_PORT 才啟動，地圖改向它要圖磚
+#   TILE_PREWARM_KM：啟動時在背景先抓好台中教育大學周圍幾公里（縮放 12~16）
+#   TILE_PROXY_URL：瀏覽器用的圖磚網址（app 在 https / 反向代理後面時要設，例如 https://…/tiles/{z}/{x}/{y}.png）
+@st.cache_resource(show_spinner=False)
+def get_tile_server():
+    port = os.environ.get("TILE_PROXY_PORT")
+    if not port:
+        return None
+    proxy = TileProxy(TileCache(TILE_CACHE_PATH))
+    server = TileServer(proxy, port=int(port)).start()
+    prewarm_km = os.environ.get("TILE_PREWARM_KM")
+    if prewarm_km:
+        threading.Thread(
+            target=proxy.prewarm,
+            args=(bbox_around(NTSU_LAT, NTSU_LNG, float(prewarm_km)), range(12, 17)),
+            name="tile-prewarm",
+            daemon=True,
+        ).start()
+    return server
+
+
+def map_tiles():
+    """地圖用的圖磚網址樣板；None = 直接向 OpenStreetMap 要。"""
+    server = get_tile_server()
+    url = os.environ.get("TILE_PROXY_URL")
+    if url or server is None:
+        return url or None
+    # 學生手機是用哪個位址連到 app 的，就用同一個位址連圖磚 server
+    host = (st.context.headers.get("Host") or "localhost").rsplit(":", 1)[0]
+    return server.url_template(host)
 
 
 # =========================
 # 4) 讀 Excel（前 4 欄：編號/品名/碳足跡/宣告單位）
 #    -> 統一生成 cf_gco2e
+#    目錄放在 catalog.CATALOGS（以 catalog_version 為 key 的 process 共用登錄表），
+#    每個 session 每次 rerun 拿到的都是同一個唯讀 CatalogIndex，不像 st.cache_data 每次複製一份
+#    CatalogManager 在背景監看 repo 根目錄的 產品碳足跡*.xlsx：檔案改了就在背景解析、
+#    解析好才整份換掉；rerun 只讀 manager.current，不會卡在 openpyxl
 # =========================
-@st.cache_data(show_spinner=False)
-def load_data_from_excel(file_bytes: bytes) -> pd.DataFrame:
-    df = pd.read_excel(BytesIO(file_bytes), engine="openpyxl")
-    if df.shape[1] < 4:
-        raise ValueError("Excel 欄位太少：至少 4 欄（編號、品名、碳足跡、宣告單位）。")
+@st.cache_resource(show_spinner=False)
+def get_catalog_manager() -> CatalogManager:
+    return CatalogManager(os.path.dirname(os.path.abspath(EXCEL_PATH_DEFAULT)), active=EXCEL_PATH_DEFAULT).start()
+
+
+@st.cache_resource(show_spinner=False, max_entries=4)
+def get_meal_footprint(version: str, _cat: CatalogIndex) -> MealFootprint:
+    return MealFootprint(_cat)
 
-    df = df.iloc[:, :4].copy()
-    df.columns = ["code", "product_name", "product_carbon_footprint_data", "declared_unit"]
 
-    df["code"] = df["code"].astype(str).str.strip().str.replace(r"\.0$", "", regex=True)
-    df["product_name"] = df["product_name"].astype(str).str.strip()
-    df["declared_unit"] = df["declared_unit"].astype(str).str.strip()
+SIM_SEED = 20240101
 
-    df["cf_gco2e"] = df["product_carbon_footprint_data"].apply(parse_cf_to_g)
-    df = df.dropna(subset=["cf_gco2e"]).reset_index(drop=True)
 
-    # cf_kgco2e 方便計算
-    df["cf_kgco2e"] = df["cf_gco2e"].apply(g_to_kg)
-    return df
+@st.cache_data(show_spinner="模擬中（第一次需要幾秒）…", persist="disk", max_entries=8)
+def run_meal_simulation(version: str, n: int, seed: int, params: tuple, _spec: SimSpec) -> SimResult:
+    # 以目錄版本為 key：Excel 內容變了才重算；存在磁碟上，重開 app 也不用重跑
+    return simulate_meals(_spec, n, seed=seed)
 
 
-def read_excel_source() -> pd.DataFrame:
+def read_catalog_source() -> CatalogIndex:
+    # 回傳 catalog.CATALOGS 登錄表裡的共用目錄（同一版本所有 session 同一個物件，不複製）
     st.caption("📄 資料來源：優先讀取 repo 根目錄 Excel；若讀不到可改用上傳。")
-    try:
-        with open(EXCEL_PATH_DEFAULT, "rb") as f:
-            return load_data_from_excel(f.read())
-    except Exception:
-        up = st.file_uploader("或改用上傳 Excel（.xlsx）", type=["xlsx"])
-        if up is None:
-            raise FileNotFoundError(f"讀取失敗：請確認 {EXCEL_PATH_DEFAULT} 放在 repo 根目錄，或改用上傳。")
-        return load_data_from_excel(up.getvalue())
+    cat = get_catalog_manager().current
+    if cat is not None:
+        return cat
+    up = st.file_uploader("或改用上傳 Excel（.xlsx）", type=["xlsx"])
+    if up is None:
+        raise FileNotFoundError(f"讀取失敗：請確認 {EXCEL_PATH_DEFAULT} 放在 repo 根目錄，或改用上傳。")
+    # UploadedFile 本身就是檔案物件：直接串流解析，不再另外複製成 bytes
+    return catalog_from_file(up)
+
+
+def session_catalog(latest: CatalogIndex) -> CatalogIndex:
+    """這個 session 用的目錄：做到一半的學生繼續用原本的版本，下一份主餐才換到最新版。"""
+    pinned = st.session_state.catalog_version
+    if pinned == latest.version:
+        return latest
+    if pinned is not None and st.session_state.meal_rows is not None:
+        cat = CATALOGS.get(pinned)
+        if cat is not None:
+            return cat
+    if pinned is not None:
+        # 舊版本的列位置對到最新版（對不到的清掉，之後重抽）
+        remap_session_rows(get_catalog_manager().row_map(pinned))
+    st.session_state.catalog_version = latest.version
+    return latest
+
+
+def remap_session_rows(row_map):
+    ss = st.session_state
+    if ss.meal_rows is not None:
+        meal = remap_rows(row_map, ss.meal_rows)
+        ss.meal_rows = tuple(meal) if len(meal) == len(ss.meal_rows) else None
+    cook = {}
+    for i, r in ss.cook_rows.items():
+        got = remap_rows(row_map, [r])
+        if got:
+            cook[i] = got[0]
+    ss.cook_rows = cook
+    if ss.drink_row is not None:
+        ss.drink_row = (remap_rows(row_map, [ss.drink_row]) or [None])[0]
+    if ss.dessert_pool_rows is not None:
+        pool = remap_rows(row_map, ss.dessert_pool_rows)
+        ss.dessert_pool_rows = tuple(pool) if len(pool) == len(ss.dessert_pool_rows) else None
+    ss.dessert_pick_rows = remap_rows(row_map, ss.dessert_pick_rows) if ss.dessert_pool_rows is not None else []
+    ss.packaging_pick_rows = remap_rows(row_map, ss.packaging_pick_rows)
 
 
 # =========================
 # 5) 抽樣工具
+#    直接從 CatalogIndex 的列位置抽（MealSampler），每個 session 一個 seed；
+#    seed + 第幾次抽（meal_draw / drink_draw）+ 做法，就能重建任何一位學生的抽樣
 # =========================
-def safe_sample(sub_df: pd.DataFrame, n: int) -> pd.DataFrame:
-    if len(sub_df) == 0:
-        return sub_df.copy()
-    n2 = min(n, len(sub_df))
-    return sub_df.sample(n=n2, replace=False, random_state=random.randint(1, 10_000)).reset_index(drop=True)
-
-
-def pick_one(df: pd.DataFrame, code_value: str) -> dict:
-    sub = df[df["code"] == code_value]
-    if len(sub) == 0:
-        raise ValueError(f"在 Excel 中找不到 code = {code_value} 的資料。")
-    row = sub.sample(n=1, random_state=random.randint(1, 10_000)).iloc[0]
-    return {
-        "code": row["code"],
-        "product_name": row["product_name"],
-        "cf_gco2e": float(row["cf_gco2e"]),
-        "cf_kgco2e": float(row["cf_kgco2e"]),
-        "declared_unit": row["declared_unit"],
-    }
+#    session_state 只存整數列位置（tuple / int），品名、數值到畫面上才向共用的 CatalogIndex 查
+def draw_meal(sampler: MealSampler) -> tuple:
+    return tuple(int(r) for r in sampler.meal(st.session_state.meal_draw))
+
+
+def draw_cooking(sampler: MealSampler, i: int, method: str) -> int:
+    return sampler.cooking(st.session_state.meal_draw, i, method)
+
+
+def draw_drink(sampler: MealSampler):
+    if sampler.catalog.count("2") == 0:
+        return None
+    return sampler.drink(st.session_state.drink_draw)
+
+
+def sample_key() -> str:
+    methods = "/".join(st.session_state.cook_method.get(i, "水煮") for i in range(len(st.session_state.meal_rows)))
+    return (
+        f"seed={st.session_state.sample_seed} meal={st.session_state.meal_draw} "
+        f"drink={st.session_state.drink_draw} cook={methods}"
+    )
 
 
 # =========================
@@ -257,35 +335,35 @@ def sheets_available() -> bool:
         return False
 
 
-def append_result_to_google_sheet(sheet_name: str, row: dict):
-    # 延遲 import（避免沒裝套件或沒 secrets 就爆）
-    import gspread
-    from google.oauth2.service_account import Credentials
+@st.cache_resource(show_spinner=False)
+def get_sheets_client() -> SheetsClient:
+    # 整個 process 共用一個已授權的 client（含 worksheet / 標題列快取）
+    return SheetsClient.from_service_account_info(st.secrets["gcp_service_account"])
 
-    creds_dict = dict(st.secrets["gcp_service_account"])
-    scopes = [
-        "https://www.googleapis.com/auth/spreadsheets",
-        "https://www.googleapis.com/auth/drive",
-    ]
-    creds = Credentials.from_service_account_info(creds_dict, scopes=scopes)
-    gc = gspread.authorize(creds)
 
-    sh = gc.open(sheet_name)
-    try:
-        ws = sh.worksheet("results")
-    except Exception:
-        ws = sh.add_worksheet(title="results", rows=1000, cols=50)
+class TimedSheetsClient:
+    """背景 worker 呼叫 Google Sheets API 的時間也記進 profiler（不在 rerun 裡，但看得出 API 多慢）。"""
 
-    header = ws.row_values(1)
-    if not header:
-        ws.append_row(list(row.keys()))
+    def __init__(self, client: SheetsClient, prof: Profiler):
+        self.client = client
+        self.prof = prof
 
-    # 若 header 與 row keys 不同，保守做法：以 header 順序寫；缺的留空
-    if header:
-        values = [row.get(k, "") for k in header]
-        ws.append_row(values)
-    else:
-        ws.append_row(list(row.values()))
+    def append_rows(self, sheet_ref: str, rows: list) -> None:
+        with self.prof.span("Google Sheet 寫入（背景）"):
+            self.client.append_rows(sheet_ref, rows)
+
+
+@st.cache_resource(show_spinner=False)
+def get_result_outbox() -> ResultOutbox:
+    # 本機 SQLite 暫存區 + 背景批次寫入（整個 process 一個 worker）
+    return ResultOutbox(OUTBOX_PATH, client_factory=lambda: TimedSheetsClient(get_sheets_client(), profiler)).start()
+
+
+def append_result_to_google_sheet(sheet_name: str, row: dict) -> bool:
+    # sheet_name 可填檔名，也可貼 Sheet 網址或 ID（用 ID 開啟不必搜尋 Drive）
+    # 先寫進本機暫存區就回來；回傳 False 代表同一筆已經送過
+    with profiler.span("Google Sheet 送出"):
+        return get_result_outbox().enqueue(sheet_name, row)
 
 
 # =========================
@@ -299,14 +377,23 @@ st.session_state.setdefault("device_id", str(uuid.uuid4())[:8])
 # stage: 1=主餐/交通階段；2=甜點/餐具階段
 st.session_state.setdefault("stage", 1)
 
+# 這個 session 在用的目錄版本（None = 還沒開始，見 session_catalog）
+st.session_state.setdefault("catalog_version", None)
+
+# 抽樣：每個 session 一個 seed（網址加 ?seed=123 可重現某位學生的抽樣）
+_seed_param = st.query_params.get("seed", "")
+st.session_state.setdefault("sample_seed", int(_seed_param) if _seed_param.isdigit() else secrets.randbits(32))
+st.session_state.setdefault("meal_draw", 0)   # 第幾次抽主餐
+st.session_state.setdefault("drink_draw", 0)  # 第幾次抽飲料
+
 # 主餐
-st.session_state.setdefault("meal_items", None)
-st.session_state.setdefault("cook_picks", {})
+st.session_state.setdefault("meal_rows", None)   # 3 個目錄列位置（tuple）
+st.session_state.setdefault("cook_rows", {})     # 第 i 道 → 油/水的列位置
 st.session_state.setdefault("cook_method", {})
 
 # 飲料
 st.session_state.setdefault("drink_mode_state", "隨機生成飲料")
-st.session_state.setdefault("drink_pick", None)
+st.session_state.setdefault("drink_row", None)   # 飲料列位置；None = 還沒抽
 
 # 交通（採買）
 st.session_state.setdefault("stores", [])     # 已確認（只留 1 家）
@@ -321,37 +408,86 @@ st.session_state.setdefault("geo", None)
 st.session_state.setdefault("origin", {"lat": None, "lng": None})
 
 # 第二階段：甜點/餐具
-st.session_state.setdefault("dessert_pool", None)     # 隨機 5 種
-st.session_state.setdefault("dessert_pick_names", []) # 使用者選 2 種
-st.session_state.setdefault("packaging_pick", [])     # 多選
+st.session_state.setdefault("dessert_pool_rows", None) # 隨機 5 種（列位置）
+st.session_state.setdefault("dessert_pick_rows", [])   # 使用者選 2 種
+st.session_state.setdefault("packaging_pick_rows", []) # 多選
 st.session_state.setdefault("dine_mode", "內用")      # 內用 / 帶回台中教育大學
 
 # 儲存本機彙整（同一台裝置可累積）
 st.session_state.setdefault("local_results", [])
 
+# 起點輸入框（有 key，由 set_origin 同步）
+st.session_state.setdefault("origin_lat_in", NTSU_LAT)
+st.session_state.setdefault("origin_lng_in", NTSU_LNG)
 
-# =========================
-# 8) 取得定位（只抓一次）
-# =========================
-if st.session_state.geo is None:
-    st.session_state.geo = streamlit_geolocation()  # 不要傳 key=...
+# 每次按鈕操作後整頁執行了幾次（整頁操作應該是 1；局部 fragment 重跑則是 0），
+# 以及各 fragment 各執行了幾次（局部重跑時：被操作的那一塊和結果各 1 次，其他區塊 0 次）
+st.session_state.setdefault("run_stats", {"action": "（首次載入）", "script_runs": 0, "fragment_runs": {}})
+st.session_state.run_stats["script_runs"] += 1
 
-geo = st.session_state.geo or {}
-geo_lat = geo.get("latitude")
-geo_lng = geo.get("longitude")
-geo_lat = float(geo_lat) if geo_lat is not None else None
-geo_lng = float(geo_lng) if geo_lng is not None else None
 
-if st.session_state.origin["lat"] is None and geo_lat is not None and geo_lng is not None:
-    st.session_state.origin = {"lat": geo_lat, "lng": geo_lng}
+def mark_action(name):
+    """在 callback 開頭呼叫：記錄這次操作，執行次數歸零。"""
+    st.session_state.run_stats = {"action": name, "script_runs": 0, "fragment_runs": {}}
+
+
+def count_fragment_run(key):
+    """在 fragment 開頭呼叫（整頁執行時也算一次）。"""
+    runs = st.session_state.run_stats["fragment_runs"]
+    runs[key] = runs.get(key, 0) + 1
+
+
+def teacher_unlocked(key="teacher_token_in") -> bool:
+    """教師密碼（st.secrets["teacher_token"]）；沒設定就不顯示輸入框、一律 False。
+
+    同一頁可能有好幾處要密碼（模擬、切換目錄…）：每處用不同 key，任一處輸入正確後整個 session 都算解鎖。
+    """
+    try:
+        token = str(st.secrets["teacher_token"])
+    except Exception:
+        return False
+    if not token:
+        return False
+    if st.session_state.get("teacher_ok"):
+        return True
+    entered = st.text_input("🔑 教師密碼（模擬、切換目錄、清除計時紀錄等會影響全班的操作）", type="password", key=key)
+    ok = bool(entered) and hmac.compare_digest(entered.encode("utf-8"), token.encode("utf-8"))
+    if ok:
+        st.session_state.teacher_ok = True
+    return ok
+
+
+def set_origin(lat, lng):
+    st.session_state.origin = {"lat": lat, "lng": lng}
+    if lat is not None and lng is not None:
+        st.session_state.origin_lat_in = float(lat)
+        st.session_state.origin_lng_in = float(lng)
 
 
 # =========================
-# 9) 母頁（報到）
+# 8) 母頁（報到）
+#    8~12 各區段的時間記在 profiler（st.stop() 之前要先 close，否則這一段不記）；
+#    只在區段主體真的執行時才 enter：報到後的 8、已定位的 9、另一個階段的 11/12 不記接近 0 ms 的樣本
 # =========================
+sections = profiler.sections()
 st.title(APP_TITLE)
 
+
+def on_skip_checkin():
+    mark_action("直接開始（跳過）")
+    if not st.session_state.visitor_id:
+        st.session_state.visitor_id = "訪客"
+    st.session_state.student_name = st.session_state.visitor_id
+    st.session_state.page = "main"
+
+
+def on_enter_main():
+    mark_action("開始")
+    st.session_state.page = "main"
+
+
 if st.session_state.page == "home":
+    sections.enter("8 報到")
     st.markdown('<div class="card">', unsafe_allow_html=True)
     st.subheader("🏷️ 報到與入場")
     st.write("請輸入您的預約號碼（學號＋姓名）。")
@@ -368,12 +504,7 @@ if st.session_state.page == "home":
             st.session_state.visitor_id = visitor_id.strip()
 
     with colB:
-        if st.button("直接開始（跳過）", use_container_width=True):
-            if not st.session_state.visitor_id:
-                st.session_state.visitor_id = "訪客"
-            st.session_state.student_name = st.session_state.visitor_id
-            st.session_state.page = "main"
-            st.rerun()
+        st.button("直接開始（跳過）", use_container_width=True, on_click=on_skip_checkin)
 
     st.markdown("</div>", unsafe_allow_html=True)
 
@@ -399,105 +530,250 @@ if st.session_state.page == "home":
 - 餐具/包材：可不選、可複選
 """
             )
-            if st.button("🍴 開始", use_container_width=True):
-                st.session_state.page = "main"
-                st.rerun()
+            st.button("🍴 開始", use_container_width=True, on_click=on_enter_main)
             st.markdown("</div>", unsafe_allow_html=True)
         else:
             st.warning("目前此預約號碼不在名單內（可按「直接開始（跳過）」當訪客進入）。")
+    sections.close()
     st.stop()
 
 
+# =========================
+# 9) 取得定位（只抓一次）
+#    放在報到頁之後：定位元件（streamlit custom component）會帶入 pyarrow / pandas，
+#    報到頁用不到定位，不必先付這些匯入時間
+# =========================
+if st.session_state.geo is None:
+    sections.enter("9 定位")
+    st.session_state.geo = streamlit_geolocation()  # 不要傳 key=...
+
+geo = st.session_state.geo or {}
+geo_lat = geo.get("latitude")
+geo_lng = geo.get("longitude")
+geo_lat = float(geo_lat) if geo_lat is not None else None
+geo_lng = float(geo_lng) if geo_lng is not None else None
+
+if st.session_state.origin["lat"] is None and geo_lat is not None and geo_lng is not None:
+    set_origin(geo_lat, geo_lng)
+
+
 # =========================
 # 10) 主頁：讀 Excel / 分類
 # =========================
-df_all = read_excel_source()
+sections.enter("10 讀目錄 / 分類")
+catalog_index = session_catalog(read_catalog_source())
+if catalog_index.unparsed:
+    bad = catalog_index.unparsed
+    st.caption(
+        f"⚠️ 有 {len(bad)} 列碳足跡格式無法解析，已略過（Excel 列號："
+        + "、".join(str(b["excel_row"]) for b in bad[:10])
+        + ("…" if len(bad) > 10 else "")
+        + "）"
+    )
+
+meal_footprint = get_meal_footprint(catalog_index.version, catalog_index)
+sampler = MealSampler(catalog_index, st.session_state.sample_seed)
 
 # 你目前的分類規則（依你前面 app）
-df_food = df_all[df_all["code"] == "1"].copy()     # 食材
-df_oil = df_all[df_all["code"] == "1-1"].copy()    # 油
-df_water = df_all[df_all["code"] == "1-2"].copy()  # 水
-df_drink = df_all[df_all["code"] == "2"].copy()    # 飲料
+# 各類只記筆數；內容一律用列位置向共用的 CatalogIndex 查（不切 DataFrame）
+PACKAGING_CODES = ("4-1", "4-2", "4-3", "4-4", "4-5", "4-6")
+n_food = catalog_index.count("1")      # 食材
+n_oil = catalog_index.count("1-1")     # 油
+n_water = catalog_index.count("1-2")   # 水
+n_drink = catalog_index.count("2")     # 飲料
 
 # 第二階段
-df_dessert = df_all[df_all["code"] == "3"].copy()  # 甜點（你要「從 3 中」）
-df_packaging = df_all[df_all["code"].isin(["4-1","4-2","4-3","4-4","4-5","4-6"])].copy()
+n_dessert = catalog_index.count("3")   # 甜點（你要「從 3 中」）
+n_packaging = catalog_index.count(*PACKAGING_CODES)
 
-if len(df_food) == 0:
+if n_food == 0:
     st.error("Excel 裡找不到 code=1 的食材。請確認『編號』欄有 1。")
+    sections.close()
     st.stop()
 
 
 # =========================
 # 11) 第一階段：主餐/料理/飲料/交通（可收起）
+#   料理 / 飲料 / 交通 / 結果圖表各是一個 fragment：
+#   點某一區的元件只重跑那一區 + 結果區，不會整頁重跑（不重讀 Excel、不重畫其他地圖）
+#   結果區由 session_state 的選擇組出 Meal，交給 MealFootprint 計算（第二階段共用）
 # =========================
-if st.session_state.stage == 1:
-    st.subheader("🍛 第一階段：主餐與採買")
+sections.close()
+S1_COOKING = "s1_cooking"
+S1_DRINK = "s1_drink"
+S1_TRANSPORT = "s1_transport"
+S1_SUMMARY = "s1_summary"
+EF_MAP = {"走路": 0.0, "機車": 9.51e-2, "汽車（汽油）": 1.15e-1}
+ROUTE_MODE = {"走路": "walk", "機車": "scooter", "汽車（汽油）": "car"}  # 交通方式 → 道路網的通行規則
+
+
+def trip_km(lat1, lng1, lat2, lng2) -> tuple:
+    """單程距離 (km, 是否為道路距離)；沒有道路檔、或道路網算不出來時用直線距離。"""
+    router = get_router()
+    if router is not None:
+        mode = ROUTE_MODE.get(st.session_state.get("transport_mode"), "car")
+        km = router.distance_km(mode, lat1, lng1, lat2, lng2)
+        if km is not None:
+            return km, True
+    return haversine_km(lat1, lng1, lat2, lng2), False
+
+
+def takeout_km(picked: dict, campus: str) -> tuple:
+    """分店 → 校區 單程 (km, 是否為道路距離)：離線分店直接查帶回距離表，其他的（或表還沒算好）同 trip_km。"""
+    table = get_takeout_table()
+    if table is not None:
+        mode = ROUTE_MODE.get(st.session_state.get("transport_mode"), "car")
+        hit = table.lookup(picked.get("poi_id"), picked["lat"], picked["lng"], campus, mode)
+        if hit is not None:
+            return hit
+    c_lat, c_lng = CAMPUSES[campus]
+    return trip_km(picked["lat"], picked["lng"], c_lat, c_lng)
+
+
+def stage1_transport_km() -> float:
+    # 已確認分店才算（來回 ×2）
+    o = st.session_state.origin
+    if not st.session_state.stores or o["lat"] is None or o["lng"] is None:
+        return 0.0
+    picked = st.session_state.stores[0]
+    one_way, _ = trip_km(o["lat"], o["lng"], picked["lat"], picked["lng"])
+    return one_way * (2 if st.session_state.get("round_trip", True) else 1)
+
+
+def current_drink():
+    # 有喝飲料時回傳列位置，否則 None
+    if st.session_state.drink_mode_state == "隨機生成飲料":
+        return st.session_state.drink_row
+    return None
+
+
+def current_meal(**stage2) -> Meal:
+    """目前的選擇 → Meal（第二階段再帶入 dessert / packaging / takeout_km）。"""
+    n = len(st.session_state.meal_rows)
+    picks = [st.session_state.cook_rows.get(i) for i in range(n)]
+    drink = current_drink()
+    return Meal(
+        food=st.session_state.meal_rows,
+        cooking=[r for r in picks if r is not None],
+        drink=NO_ROW if drink is None else drink,
+        transport_km=stage1_transport_km(),
+        ef=float(st.session_state.get("ef_final", 0.0)),
+        **stage2,
+    )
 
-    # 抽食材 / 重置
-    c1, c2 = st.columns([1, 1])
-    with c1:
-        if st.button("🎲 抽 3 項食材（主餐）", use_container_width=True):
-            st.session_state.meal_items = safe_sample(df_food, 3)
-            st.session_state.cook_method = {i: "水煮" for i in range(len(st.session_state.meal_items))}
-            st.session_state.cook_picks = {}
-            st.session_state.drink_pick = None
-            st.session_state.drink_mode_state = "隨機生成飲料"
-            st.rerun()
 
-    with c2:
-        if st.button("♻️ 全部重置（第一階段）", use_container_width=True):
-            st.session_state.meal_items = None
-            st.session_state.cook_method = {}
-            st.session_state.cook_picks = {}
-            st.session_state.drink_mode_state = "隨機生成飲料"
-            st.session_state.drink_pick = None
-            st.session_state.search = []
-            st.session_state.stores = []
-            st.session_state.decision = 0
-            # 不清 geo 元件，只重設起點
-            st.session_state.origin = {"lat": geo_lat, "lng": geo_lng}
-            st.rerun()
+def on_cook_change(i):
+    mark_action(f"第 {i+1} 道料理方式")
+    chosen = st.session_state[f"cook_choice_{i}"]
+    new_method = "水煮" if chosen.startswith("水煮") else "煎炸"
+    if new_method != st.session_state.cook_method.get(i, "水煮"):
+        st.session_state.cook_method[i] = new_method
+        st.session_state.cook_rows[i] = draw_cooking(sampler, i, new_method)
+    st.rerun(scope=[S1_COOKING, S1_SUMMARY])
 
-    if st.session_state.meal_items is None:
-        st.session_state.meal_items = safe_sample(df_food, 3)
-        st.session_state.cook_method = {i: "水煮" for i in range(len(st.session_state.meal_items))}
-        st.session_state.cook_picks = {}
-        st.session_state.drink_pick = None
 
-    meal_df = st.session_state.meal_items.reset_index(drop=True)
+def on_drink_mode_change():
+    mark_action("飲料選項")
+    drink_mode = st.session_state.drink_mode_radio
+    if drink_mode != st.session_state.drink_mode_state:
+        st.session_state.drink_mode_state = drink_mode
+        if drink_mode == "我不喝飲料":
+            st.session_state.drink_row = None
+        else:
+            st.session_state.drink_draw += 1
+            st.session_state.drink_row = draw_drink(sampler)
+    st.rerun(scope=[S1_DRINK, S1_SUMMARY])
 
-    # 主餐表
-    st.markdown("### 主餐（3 項）")
-    food_table = meal_df[["product_name", "cf_gco2e", "declared_unit"]].copy()
-    food_table.columns = ["食材名稱", "食材碳足跡(gCO₂e)", "宣告單位"]
-    food_table["食材碳足跡(gCO₂e)"] = food_table["食材碳足跡(gCO₂e)"].astype(float).round(1)
-    st.dataframe(
-        food_table.style.apply(
-            lambda _: ["background-color: rgba(46, 204, 113, 0.20)"] * food_table.shape[1],
-            axis=1,
-        ),
-        use_container_width=True,
-        height=160,
-    )
 
-    # 料理方式
+def on_drink_refresh():
+    mark_action("換一杯飲料")
+    st.session_state.drink_draw += 1
+    st.session_state.drink_row = draw_drink(sampler)
+    st.rerun(scope=[S1_DRINK, S1_SUMMARY])
+
+
+def on_transport_param_change():
+    mark_action("交通方式/係數")
+    st.rerun(scope=[S1_TRANSPORT, S1_SUMMARY])
+
+
+def on_set_origin(lat, lng, action):
+    mark_action(action)
+    set_origin(float(lat), float(lng))
+    st.rerun(scope=[S1_TRANSPORT, S1_SUMMARY])
+
+
+def on_use_manual_origin():
+    on_set_origin(st.session_state.origin_lat_in, st.session_state.origin_lng_in, "使用此座標當起點")
+
+
+def on_clear_search():
+    mark_action("清空搜尋結果")
+    st.session_state.search = []
+    st.session_state.stores = []
+    st.session_state.decision = 0
+    st.rerun(scope=[S1_TRANSPORT, S1_SUMMARY])
+
+
+def on_confirm_store(picked):
+    mark_action("確認分店")
+    st.session_state.stores = [picked]  # 只保留 1 家
+    st.rerun(scope=[S1_TRANSPORT, S1_SUMMARY])
+
+
+def on_draw_meal():
+    mark_action("抽 3 項食材")
+    st.session_state.meal_draw += 1
+    st.session_state.drink_draw += 1
+    # 交給主程式重抽（同一個 meal_draw 抽出來一樣）：目錄有新版的話，這時才換過去
+    st.session_state.meal_rows = None
+    st.session_state.drink_mode_state = "隨機生成飲料"
+
+
+def on_reset_stage1():
+    mark_action("全部重置")
+    st.session_state.meal_draw += 1
+    st.session_state.drink_draw += 1
+    st.session_state.meal_rows = None
+    st.session_state.cook_method = {}
+    st.session_state.cook_rows = {}
+    st.session_state.drink_mode_state = "隨機生成飲料"
+    st.session_state.drink_row = None
+    st.session_state.search = []
+    st.session_state.stores = []
+    st.session_state.decision = 0
+    # 不清 geo 元件，只重設起點
+    set_origin(geo_lat, geo_lng)
+
+
+def on_switch_stage(stage):
+    mark_action(f"切換到第{'一二'[stage - 1]}階段")
+    st.session_state.stage = stage
+
+
+@st.fragment(key=S1_COOKING)
+@profiler.timed("11 第一階段 › 料理")
+def stage1_cooking():
+    count_fragment_run(S1_COOKING)
+    cat = catalog_index
+
     st.markdown("### 🍳 料理方式（每道餐選一次）")
-    for i in range(len(meal_df)):
-        item_name = meal_df.loc[i, "product_name"]
-        item_cf_kg = float(meal_df.loc[i, "cf_kgco2e"])
+    for i, row in enumerate(st.session_state.meal_rows):
+        item_name = cat.names[row]
+        item_cf_kg = float(cat.cf_kg[row])
 
-        if i not in st.session_state.cook_picks:
+        if i not in st.session_state.cook_rows:
             method = st.session_state.cook_method.get(i, "水煮")
-            st.session_state.cook_picks[i] = pick_one(df_all, "1-1" if method == "煎炸" else "1-2")
+            st.session_state.cook_rows[i] = draw_cooking(sampler, i, method)
 
-        pick = st.session_state.cook_picks[i]
+        pick = st.session_state.cook_rows[i]
+        pick_text = f"（{cat.names[pick]} / {cat.cf_kg[pick]:.3f} kgCO₂e）"
         oil_text = "（找不到油品 code=1-1）"
         water_text = "（找不到水品 code=1-2）"
-        if len(df_oil) > 0:
-            oil_text = f"（{pick['product_name']} / {pick['cf_kgco2e']:.3f} kgCO₂e）" if pick["code"] == "1-1" else "（隨機油品）"
-        if len(df_water) > 0:
-            water_text = f"（{pick['product_name']} / {pick['cf_kgco2e']:.3f} kgCO₂e）" if pick["code"] == "1-2" else "（隨機水品）"
+        if n_oil > 0:
+            oil_text = pick_text if cat.code_of(pick) == "1-1" else "（隨機油品）"
+        if n_water > 0:
+            water_text = pick_text if cat.code_of(pick) == "1-2" else "（隨機水品）"
 
         st.markdown(f"**第 {i+1} 道：{item_name}**（食材 {item_cf_kg:.3f} kgCO₂e）")
 
@@ -505,62 +781,59 @@ if st.session_state.stage == 1:
         current_method = st.session_state.cook_method.get(i, "水煮")
         current_idx = 0 if current_method == "水煮" else 1
 
-        chosen = st.radio(
+        st.radio(
             " ",
             options,
             index=current_idx,
             horizontal=True,
             key=f"cook_choice_{i}",
             label_visibility="collapsed",
+            on_change=on_cook_change,
+            args=(i,),
         )
 
-        new_method = "水煮" if chosen.startswith("水煮") else "煎炸"
-        if new_method != st.session_state.cook_method.get(i, "水煮"):
-            st.session_state.cook_method[i] = new_method
-            st.session_state.cook_picks[i] = pick_one(df_all, "1-2" if new_method == "水煮" else "1-1")
-            st.rerun()
-
         st.divider()
 
-    # 飲料
+
+@st.fragment(key=S1_DRINK)
+@profiler.timed("11 第一階段 › 飲料")
+def stage1_drink():
+    count_fragment_run(S1_DRINK)
     st.markdown("### 🥤 飲料（可選）")
-    drink_mode = st.radio(
+    st.radio(
         "飲料選項",
         ["隨機生成飲料", "我不喝飲料"],
         index=0 if st.session_state.drink_mode_state == "隨機生成飲料" else 1,
         horizontal=True,
         key="drink_mode_radio",
+        on_change=on_drink_mode_change,
     )
 
-    if drink_mode != st.session_state.drink_mode_state:
-        st.session_state.drink_mode_state = drink_mode
-        if drink_mode == "我不喝飲料":
-            st.session_state.drink_pick = None
-        else:
-            st.session_state.drink_pick = pick_one(df_all, "2") if len(df_drink) > 0 else None
-        st.rerun()
-
     if st.session_state.drink_mode_state == "隨機生成飲料":
-        if st.button("🔄 換一杯飲料", use_container_width=True):
-            st.session_state.drink_pick = pick_one(df_all, "2") if len(df_drink) > 0 else None
-            st.rerun()
+        st.button("🔄 換一杯飲料", use_container_width=True, on_click=on_drink_refresh)
 
     drink_cf = 0.0
     drink_name = "不喝飲料"
-    if st.session_state.drink_mode_state == "隨機生成飲料" and len(df_drink) > 0:
-        if st.session_state.drink_pick is None:
-            st.session_state.drink_pick = pick_one(df_all, "2")
-        dp = st.session_state.drink_pick
-        drink_cf = float(dp["cf_kgco2e"])
-        drink_name = dp["product_name"]
+    if st.session_state.drink_mode_state == "隨機生成飲料" and n_drink > 0:
+        if st.session_state.drink_row is None:
+            st.session_state.drink_row = draw_drink(sampler)
+        dr = st.session_state.drink_row
+        drink_cf = float(catalog_index.cf_kg[dr])
+        drink_name = catalog_index.names[dr]
         st.info(f"本次飲料：**{drink_name}**（{drink_cf:.3f} kgCO₂e）")
-    elif st.session_state.drink_mode_state == "隨機生成飲料" and len(df_drink) == 0:
+    elif st.session_state.drink_mode_state == "隨機生成飲料" and n_drink == 0:
         st.warning("找不到 code=2 的飲料資料，飲料目前固定為：不喝飲料。")
 
+
+@st.fragment(key=S1_TRANSPORT)
+@profiler.timed("11 第一階段 › 交通")
+def stage1_transport():
+    count_fragment_run(S1_TRANSPORT)
     # =========================
     # 交通：採買地點（定位中心 + 地圖點分店）
     # =========================
     st.markdown("### 🧭 採買交通（以你的定位/你設定的起點為中心）")
+    get_takeout_table()  # 第二階段才用：先讓帶回距離表在背景開始算
     st.caption("若定位被拒絕：可用手動座標或在地圖點一下當起點。")
 
     origin_lat = st.session_state.origin["lat"]
@@ -574,29 +847,36 @@ if st.session_state.stage == 1:
     st.markdown("#### ① 手動輸入起點座標（lat/lng）")
     colO1, colO2, colO3 = st.columns([1, 1, 1])
     with colO1:
-        lat_in = st.number_input("緯度 lat", value=float(origin_lat) if origin_lat else NTSU_LAT, format="%.6f")
+        st.number_input("緯度 lat", format="%.6f", key="origin_lat_in")
     with colO2:
-        lng_in = st.number_input("經度 lng", value=float(origin_lng) if origin_lng else NTSU_LNG, format="%.6f")
+        st.number_input("經度 lng", format="%.6f", key="origin_lng_in")
     with colO3:
-        if st.button("✅ 使用此座標當起點", use_container_width=True):
-            st.session_state.origin = {"lat": float(lat_in), "lng": float(lng_in)}
-            st.rerun()
+        st.button("✅ 使用此座標當起點", use_container_width=True, on_click=on_use_manual_origin)
 
     st.markdown("#### ② 或在地圖上點一下，把「點的位置」當起點")
     fallback_center = [origin_lat if origin_lat else NTSU_LAT, origin_lng if origin_lng else NTSU_LNG]
-    m_origin = folium.Map(location=fallback_center, zoom_start=13)
-    folium.Marker(fallback_center, tooltip="地圖中心（點地圖可改起點）").add_to(m_origin)
-    origin_map_state = st_folium(m_origin, height=320, use_container_width=True, key="origin_map")
+    with profiler.span("地圖 origin_map"):
+        origin_map_state = render_map(
+            "origin_map",
+            fallback_center,
+            13,
+            base=[MapMarker(*fallback_center, tooltip="地圖中心（點地圖可改起點）")],
+            height=320,
+            returned_objects=["last_clicked"],
+            tiles=map_tiles(),
+        )
 
     clicked_origin = origin_map_state.get("last_clicked")
     if clicked_origin:
         st.info(f"你點到：{clicked_origin['lat']:.6f}, {clicked_origin['lng']:.6f}")
-        if st.button("✅ 將此點設為起點", use_container_width=True):
-            st.session_state.origin = {"lat": float(clicked_origin["lat"]), "lng": float(clicked_origin["lng"])}
-            st.rerun()
+        st.button(
+            "✅ 將此點設為起點",
+            use_container_width=True,
+            on_click=on_set_origin,
+            args=(clicked_origin["lat"], clicked_origin["lng"], "將地圖點設為起點"),
+        )
 
-    # 交通方式
-    EF_MAP = {"走路": 0.0, "機車": 9.51e-2, "汽車（汽油）": 1.15e-1}
+    # 交通方式（改了只影響交通小計：重跑交通區 + 結果區）
     colA, colB, colC = st.columns([1.1, 1.2, 1.0])
 
     with colA:
@@ -605,6 +885,7 @@ if st.session_state.stage == 1:
             list(EF_MAP.keys()),
             index=list(EF_MAP.keys()).index(st.session_state.get("transport_mode", "汽車（汽油）")),
             key="transport_mode",
+            on_change=on_transport_param_change,
         )
 
     with colB:
@@ -612,10 +893,22 @@ if st.session_state.stage == 1:
         if EF_MAP[mode] == 0.0:
             st.number_input("排放係數（kgCO₂e/km）", min_value=0.0, value=0.0, step=0.01, disabled=True, key="ef_final")
         else:
-            st.number_input("排放係數（kgCO₂e/km，可微調）", min_value=0.0, value=float(EF_MAP[mode]), step=0.01, key="ef_final")
+            st.number_input(
+                "排放係數（kgCO₂e/km，可微調）",
+                min_value=0.0,
+                value=float(EF_MAP[mode]),
+                step=0.01,
+                key="ef_final",
+                on_change=on_transport_param_change,
+            )
 
     with colC:
-        st.checkbox("算來回（去＋回）", value=bool(st.session_state.get("round_trip", True)), key="round_trip")
+        st.checkbox(
+            "算來回（去＋回）",
+            value=bool(st.session_state.get("round_trip", True)),
+            key="round_trip",
+            on_change=on_transport_param_change,
+        )
 
     ef = float(st.session_state.get("ef_final", 0.0))
     round_trip = bool(st.session_state.get("round_trip", True))
@@ -624,6 +917,12 @@ if st.session_state.stage == 1:
     st.markdown("#### 🔎 搜尋附近分店（例如：全聯）")
     q = st.text_input("搜尋關鍵字", value="全聯", key="place_query")
 
+    # repo 根目錄有離線分店檔（OSM 匯出）時，可完全不連網搜尋
+    poi_index = get_poi_index(POI_PATH_DEFAULT)
+    use_offline = False
+    if poi_index is not None:
+        use_offline = st.checkbox(f"📴 使用離線分店資料（{len(poi_index)} 筆，不連網）", value=True, key="poi_offline")
+
     s1, s2 = st.columns([1, 1])
     with s1:
         if st.button("🔍 搜尋附近分店（最近 5 家）", use_container_width=True):
@@ -634,21 +933,34 @@ if st.session_state.stage == 1:
                     o_lat = st.session_state.origin["lat"]
                     o_lng = st.session_state.origin["lng"]
 
-                    raw = nominatim_search_nearby(q, o_lat, o_lng, radius_km=5, limit=60)
-                    if len(raw) < 5:
-                        raw = nominatim_search_nearby(q, o_lat, o_lng, radius_km=10, limit=60)
-
-                    results = []
-                    for r in raw:
-                        d = haversine_km(o_lat, o_lng, r["lat"], r["lng"])
-                        rr = dict(r)
-                        rr["dist_km"] = d
-                        results.append(rr)
-
-                    results.sort(key=lambda x: x["dist_km"])
-                    st.session_state.search = results[:5]
+                    # 結果直接給下面的地圖用（地圖在同一次執行的後面才畫），不必再 rerun
+                    if use_offline:
+                        with profiler.span("分店搜尋（離線）"):
+                            st.session_state.search = poi_index.nearest(q, o_lat, o_lng, k=5)
+                    else:
+                        geo_cache = get_geo_search_cache()
+                        scheduler = get_nominatim_scheduler()
+                        wait_box = st.empty()
+
+                        def show_queue(pos):
+                            if pos > 1:
+                                wait_box.info(f"⏳ 全班同時在搜尋，排隊中：前面還有 {pos - 1} 筆…")
+                            else:
+                                wait_box.info("⏳ 搜尋中…")
+
+                        search_kw = dict(limit=60, cache=geo_cache, scheduler=scheduler, on_wait=show_queue)
+                        # 逾時 / HTTP 錯誤也要收掉「排隊中」，不然會跟下面的錯誤訊息一起留著
+                        try:
+                            with profiler.span("分店搜尋（Nominatim）"):
+                                raw = cached_search_nearby(q, o_lat, o_lng, radius_km=5, **search_kw)
+                                if len(raw) < 5:
+                                    raw = cached_search_nearby(q, o_lat, o_lng, radius_km=10, **search_kw)
+                        finally:
+                            wait_box.empty()
+
+                        # 一次算完全部距離（NumPy），取最近 5 家
+                        st.session_state.search = rank_by_distance(o_lat, o_lng, raw, k=5)
                     st.session_state.decision = 0
-                    st.rerun()
                 except Exception as e:
                     st.session_state.search = []
                     st.session_state.decision = 0
@@ -656,80 +968,61 @@ if st.session_state.stage == 1:
                     st.exception(e)
 
     with s2:
-        if st.button("🧹 清空搜尋結果/已選分店", use_container_width=True):
-            st.session_state.search = []
-            st.session_state.stores = []
-            st.session_state.decision = 0
-            st.rerun()
+        st.button("🧹 清空搜尋結果/已選分店", use_container_width=True, on_click=on_clear_search)
 
     # 地圖點選分店
     st.markdown("#### 🗺️ 地圖（點橘色分店 marker 做決策）")
 
-    transport_cf = 0.0
-    transport_km = 0.0
-
     if st.session_state.origin["lat"] is None or st.session_state.origin["lng"] is None:
         st.warning("尚未設定起點，因此目前無法顯示附近分店地圖。")
     else:
         o_lat = st.session_state.origin["lat"]
         o_lng = st.session_state.origin["lng"]
 
-        m = folium.Map(location=[o_lat, o_lng], zoom_start=14)
-        folium.Marker([o_lat, o_lng], tooltip="起點", icon=folium.Icon(color="blue", icon="user")).add_to(m)
+        # 底圖只有起點（起點沒變就不重建、前端不重新載入）；分店 marker 放動態圖層
+        layer = []
 
         # 已確認分店（綠色）
         for p in st.session_state.stores:
-            folium.Marker(
-                [p["lat"], p["lng"]],
-                tooltip=f"已確認：{p['name']}",
-                popup=p.get("display_name", p["name"]),
-                icon=folium.Icon(color="green", icon="shopping-cart"),
-            ).add_to(m)
+            layer.append(
+                MapMarker(
+                    p["lat"],
+                    p["lng"],
+                    tooltip=f"已確認：{p['name']}",
+                    popup=p.get("display_name", p["name"]),
+                    color="green",
+                    icon="shopping-cart",
+                )
+            )
 
         # 搜尋到的 5 家（橘色＋編號）
-        bounds = [[o_lat, o_lng]]
+        bounds = [(o_lat, o_lng)]
         for i, r in enumerate(st.session_state.search, start=1):
-            bounds.append([r["lat"], r["lng"]])
-
-            folium.Marker(
-                [r["lat"], r["lng"]],
-                tooltip=f"{i}. {r['name']}（{r['dist_km']:.2f} km）",
-                popup=r["display_name"],
-                icon=folium.Icon(color="orange", icon="info-sign"),
-            ).add_to(m)
-
-            folium.Marker(
-                [r["lat"], r["lng"]],
-                icon=folium.DivIcon(
-                    html=f"""
-                    <div style="
-                        background: rgba(255,255,255,0.92);
-                        border: 2px solid #ff9800;
-                        border-radius: 999px;
-                        width: 26px; height: 26px;
-                        text-align: center;
-                        line-height: 22px;
-                        font-weight: 700;
-                        font-size: 14px;
-                    ">{i}</div>
-                    """
-                ),
-            ).add_to(m)
-
-        if len(bounds) >= 2:
-            m.fit_bounds(bounds)
-
-        map_state = st_folium(m, height=420, use_container_width=True, key="store_map")
-
-        def nearest_store_index(clicked_lat, clicked_lng, stores):
-            best_i = None
-            best_d = 10**9
-            for i, s in enumerate(stores):
-                d = haversine_km(clicked_lat, clicked_lng, s["lat"], s["lng"])
-                if d < best_d:
-                    best_d = d
-                    best_i = i
-            return best_i, best_d
+            bounds.append((r["lat"], r["lng"]))
+            layer.append(
+                MapMarker(
+                    r["lat"],
+                    r["lng"],
+                    tooltip=f"{i}. {r['name']}（{r['dist_km']:.2f} km）",
+                    popup=r["display_name"],
+                    color="orange",
+                    icon="info-sign",
+                )
+            )
+            layer.append(MapBadge(r["lat"], r["lng"], str(i)))
+
+        with profiler.span("地圖 store_map"):
+            map_state = render_map(
+                "store_map",
+                (o_lat, o_lng),
+                14,
+                base=[MapMarker(o_lat, o_lng, tooltip="起點", color="blue", icon="user")],
+                layer=layer,
+                view=fit_view(bounds, 420) if len(bounds) >= 2 else None,
+                height=420,
+                returned_objects=["last_object_clicked"],
+                tiles=map_tiles(),
+            )
 
         st.markdown("##### 🧠 做決策：點橘色分店 → 再按確認加入計算")
 
@@ -738,46 +1031,41 @@ if st.session_state.stage == 1:
         else:
             clicked = map_state.get("last_object_clicked")  # 點 marker 才會有
             if clicked:
-                ci, cd = nearest_store_index(clicked["lat"], clicked["lng"], st.session_state.search)
+                ci, cd = nearest_index(clicked["lat"], clicked["lng"], st.session_state.search)
                 # 閾值避免點空白也亂選（0.25 km 內算同一點）
                 if ci is not None and cd <= 0.25:
                     st.session_state.decision = ci
 
             picked = st.session_state.search[int(st.session_state.decision)]
-            trip_km_preview = picked["dist_km"] * (2 if round_trip else 1)
+            one_way_km, on_road = trip_km(o_lat, o_lng, picked["lat"], picked["lng"])
+            trip_km_preview = one_way_km * (2 if round_trip else 1)
             transport_cf_preview = trip_km_preview * ef
 
             st.info(
                 f"目前選擇：**{picked['name']}**\n\n"
-                f"- 單程距離：約 **{picked['dist_km']:.2f} km**\n"
+                f"- 單程距離：約 **{one_way_km:.2f} km**（{'道路距離' if on_road else '直線距離'}）\n"
                 f"- 里程（{'來回' if round_trip else '單程'}）：約 **{trip_km_preview:.2f} km**\n"
                 f"- 交通方式：**{st.session_state['transport_mode']}**\n"
                 f"- 交通碳足跡（預估）：**{transport_cf_preview:.3f} kgCO₂e**"
             )
 
-            if st.button("✅ 確認此分店（納入計算）", use_container_width=True):
-                st.session_state.stores = [picked]  # 只保留 1 家
-                st.success("已確認分店 ✅")
-                st.rerun()
+            st.button("✅ 確認此分店（納入計算）", use_container_width=True, on_click=on_confirm_store, args=(picked,))
 
-        # 若已確認分店 → 算交通
-        if st.session_state.stores:
-            picked = st.session_state.stores[0]
-            one_way = haversine_km(o_lat, o_lng, picked["lat"], picked["lng"])
-            transport_km = one_way * (2 if round_trip else 1)
-            transport_cf = transport_km * ef
 
+@st.fragment(key=S1_SUMMARY)
+@profiler.timed("11 第一階段 › 結果")
+def stage1_summary():
+    count_fragment_run(S1_SUMMARY)
     # =========================
     # 第一階段：加總與圖表
     # =========================
-    food_sum = float(meal_df["cf_kgco2e"].sum())
-
-    cook_sum = 0.0
-    for i in range(len(meal_df)):
-        pick = st.session_state.cook_picks.get(i)
-        cook_sum += float(pick["cf_kgco2e"]) if pick else 0.0
+    meal = current_meal()
+    bd = meal_footprint.breakdown(meal)
+    food_sum, cook_sum, drink_cf, transport_cf = bd.food, bd.cooking, bd.drink, bd.transport
+    drink_name = "不喝飲料" if current_drink() is None else catalog_index.names[current_drink()]
+    transport_km = meal.transport_km
 
-    stage1_total = food_sum + cook_sum + drink_cf + transport_cf
+    stage1_total = bd.stage1_total
 
     st.markdown("## ✅ 第一階段結果")
     st.markdown(
@@ -790,186 +1078,194 @@ if st.session_state.stage == 1:
 """
     )
 
-    # 圓餅/長條（含比例）
-    chart_data = pd.DataFrame(
-        [
-            {"cat": "Food", "kgCO2e": food_sum},
-            {"cat": "Cooking", "kgCO2e": cook_sum},
-            {"cat": "Drink", "kgCO2e": drink_cf},
-            {"cat": "Transport", "kgCO2e": transport_cf},
-        ]
+    # 圓餅/長條（含比例）：數值沒變就沿用快取的 spec
+    key = chart_key(
+        [("Food", food_sum), ("Cooking", cook_sum), ("Drink", drink_cf), ("Transport", transport_cf)]
     )
-    chart_data = chart_data[chart_data["kgCO2e"] > 0].copy()
-    if len(chart_data) == 0:
-        chart_data = pd.DataFrame([{"cat": "Food", "kgCO2e": 0.0}])
+    st.markdown("### 📊 第一階段圖表")
+    with profiler.span("圖表 第一階段"):
+        st.vega_lite_chart(bar_spec(key, 170), use_container_width=True)
+        st.vega_lite_chart(pie_spec(key, 260, 110), use_container_width=True)
 
-    denom = float(chart_data["kgCO2e"].sum()) if float(chart_data["kgCO2e"].sum()) > 0 else 1.0
-    chart_data["pct"] = chart_data["kgCO2e"] / denom
-    chart_data["pct_label"] = (chart_data["pct"] * 100).round(0).astype(int).astype(str) + "%"
 
-    st.markdown("### 📊 第一階段圖表")
-    bar = (
-        alt.Chart(chart_data)
-        .mark_bar()
-        .encode(
-            y=alt.Y("cat:N", sort="-x", title=""),
-            x=alt.X("kgCO2e:Q", title="kgCO₂e"),
-            tooltip=["cat", alt.Tooltip("kgCO2e:Q", format=".3f"), alt.Tooltip("pct:Q", format=".0%")],
-        )
-        .properties(height=170)
-    )
-    st.altair_chart(bar, use_container_width=True)
-
-    pie = (
-        alt.Chart(chart_data)
-        .mark_arc()
-        .encode(
-            theta=alt.Theta("kgCO2e:Q"),
-            color=alt.Color("cat:N", legend=alt.Legend(orient="right", title="Category")),
-            tooltip=["cat", alt.Tooltip("kgCO2e:Q", format=".3f"), alt.Tooltip("pct:Q", format=".0%")],
-        )
-        .properties(height=260)
+if st.session_state.stage == 1:
+    sections.enter("11 第一階段")
+    st.subheader("🍛 第一階段：主餐與採買")
+
+    # 抽食材 / 重置
+    c1, c2 = st.columns([1, 1])
+    with c1:
+        st.button("🎲 抽 3 項食材（主餐）", use_container_width=True, on_click=on_draw_meal)
+
+    with c2:
+        st.button("♻️ 全部重置（第一階段）", use_container_width=True, on_click=on_reset_stage1)
+
+    if st.session_state.meal_rows is None:
+        st.session_state.meal_rows = draw_meal(sampler)
+        st.session_state.cook_method = {i: "水煮" for i in range(len(st.session_state.meal_rows))}
+        st.session_state.cook_rows = {}
+        st.session_state.drink_row = None
+
+    # 主餐表（畫面用的小表，每次從共用目錄的欄位陣列取 3 列）
+    st.markdown("### 主餐（3 項）")
+    meal_rows = list(st.session_state.meal_rows)
+    food_table = pd.DataFrame(
+        {
+            "食材名稱": catalog_index.names[meal_rows],
+            "食材碳足跡(gCO₂e)": catalog_index.cf_g[meal_rows].round(1),
+            "宣告單位": catalog_index.units[meal_rows],
+        }
     )
-    labels = (
-        alt.Chart(chart_data)
-        .mark_text(radius=110)
-        .encode(
-            theta=alt.Theta("kgCO2e:Q"),
-            text=alt.Text("pct_label:N"),
-        )
+    st.dataframe(
+        food_table.style.apply(
+            lambda _: ["background-color: rgba(46, 204, 113, 0.20)"] * food_table.shape[1],
+            axis=1,
+        ),
+        use_container_width=True,
+        height=160,
     )
-    st.altair_chart(pie + labels, use_container_width=True)
+
+    stage1_cooking()
+    stage1_drink()
+    stage1_transport()
+    stage1_summary()
 
     # 進入第二階段（收起上面所有流程）
     st.markdown("---")
-    if st.button("➡️ 進入第二階段：甜點 / 餐具包材（收起第一階段流程）", use_container_width=True):
-        st.session_state.stage = 2
-        st.rerun()
+    st.button(
+        "➡️ 進入第二階段：甜點 / 餐具包材（收起第一階段流程）",
+        use_container_width=True,
+        on_click=on_switch_stage,
+        args=(2,),
+    )
 
 
 # =========================
 # 12) 第二階段：甜點/餐具包材（可複選） + 最終加總/圖表
 # =========================
 if st.session_state.stage == 2:
+    sections.enter("12 第二階段")
     st.subheader("🍰 第二階段：甜點與餐具包材")
     st.caption("第一階段流程已收起；你可以返回重做，但通常課堂上會直接進第二階段。")
 
-    # 重新計算第一階段（避免 stage 切換後失去）
-    meal_df = st.session_state.meal_items.reset_index(drop=True)
-    food_sum = float(meal_df["cf_kgco2e"].sum())
-
-    cook_sum = 0.0
-    for i in range(len(meal_df)):
-        pick = st.session_state.cook_picks.get(i)
-        cook_sum += float(pick["cf_kgco2e"]) if pick else 0.0
-
-    # drink
-    drink_cf = 0.0
-    drink_name = "不喝飲料"
-    if st.session_state.drink_mode_state == "隨機生成飲料" and len(df_drink) > 0:
-        if st.session_state.drink_pick is None:
-            st.session_state.drink_pick = pick_one(df_all, "2")
-        dp = st.session_state.drink_pick
-        drink_cf = float(dp["cf_kgco2e"])
-        drink_name = dp["product_name"]
-
-    # transport（已確認分店才算）
-    transport_cf = 0.0
-    transport_km = 0.0
-    if st.session_state.stores and st.session_state.origin["lat"] is not None:
-        o_lat = st.session_state.origin["lat"]
-        o_lng = st.session_state.origin["lng"]
-        ef = float(st.session_state.get("ef_final", 0.0))
-        round_trip = bool(st.session_state.get("round_trip", True))
-        picked = st.session_state.stores[0]
-        one_way = haversine_km(o_lat, o_lng, picked["lat"], picked["lng"])
-        transport_km = one_way * (2 if round_trip else 1)
-        transport_cf = transport_km * ef
+    # 第一階段的選擇仍在 session_state；最後與甜點/包材一起交給 MealFootprint 計算
+    if st.session_state.drink_mode_state == "隨機生成飲料" and n_drink > 0:
+        if st.session_state.drink_row is None:
+            st.session_state.drink_row = draw_drink(sampler)
+    drink_name = "不喝飲料" if current_drink() is None else catalog_index.names[current_drink()]
 
     # -------- 甜點：隨機 5 種，複選 2 --------
     st.markdown("### 🍰 今日甜點（隨機 5 種，請複選 2 種）")
-    if len(df_dessert) == 0:
+    if n_dessert == 0:
         st.warning("Excel 找不到 code=3 的甜點資料，因此甜點本次為 0。")
-        dessert_sum = 0.0
+        dessert_rows = []
         dessert_selected = []
+        dessert_msg = None
     else:
-        if st.session_state.dessert_pool is None:
-            st.session_state.dessert_pool = safe_sample(df_dessert, 5)
-
-        dessert_pool = st.session_state.dessert_pool.copy()
-        options = dessert_pool["product_name"].tolist()
+        if st.session_state.dessert_pool_rows is None:
+            st.session_state.dessert_pool_rows = tuple(int(r) for r in sampler.dessert_pool())
 
+        options = list(st.session_state.dessert_pool_rows)
         chosen = st.multiselect(
             "請選 2 種甜點（不夠 2 種不會算）",
             options=options,
-            default=[x for x in st.session_state.dessert_pick_names if x in options],
+            default=[r for r in st.session_state.dessert_pick_rows if r in options],
+            format_func=lambda r: catalog_index.names[r],
         )
-        st.session_state.dessert_pick_names = chosen
+        st.session_state.dessert_pick_rows = chosen
 
+        dessert_selected = [catalog_index.names[r] for r in chosen]
+        dessert_msg = None
         if len(chosen) != 2:
             st.warning("請務必選 **2 種** 甜點（目前不納入計算）。")
-            dessert_sum = 0.0
-            dessert_selected = chosen
+            dessert_rows = []
         else:
-            dessert_selected = chosen
-            dessert_sum = float(dessert_pool[dessert_pool["product_name"].isin(chosen)]["cf_kgco2e"].sum())
-            st.success(f"甜點已納入計算：{dessert_sum:.3f} kgCO₂e")
+            dessert_rows = chosen
+            dessert_msg = st.empty()  # 數字等下面算完再填
 
     # -------- 餐具/包材：可不選、可複選 4-1~4-6 --------
     st.markdown("### 🍴 餐具 / 包材（可不選、可複選）")
-    packaging_sum = 0.0
-    if len(df_packaging) == 0:
+    packaging_rows = []
+    if n_packaging == 0:
         st.warning("Excel 找不到 4-1~4-6 的餐具/包材資料，本次為 0。")
     else:
-        pk_opts = df_packaging["product_name"].tolist()
-        pk_selected = st.multiselect(
+        pk_opts = catalog_index.rows(*PACKAGING_CODES).tolist()
+        packaging_rows = st.multiselect(
             "選擇你使用的餐具/包材（可空）",
             options=pk_opts,
-            default=[x for x in st.session_state.packaging_pick if x in pk_opts],
+            default=[r for r in st.session_state.packaging_pick_rows if r in pk_opts],
+            format_func=lambda r: catalog_index.names[r],
         )
-        st.session_state.packaging_pick = pk_selected
-        packaging_sum = float(df_packaging[df_packaging["product_name"].isin(pk_selected)]["cf_kgco2e"].sum()) if pk_selected else 0.0
+        st.session_state.packaging_pick_rows = packaging_rows
 
     # -------- 內用 / 帶回台中教育大學 --------
-    st.markdown("### 🏫 內用或帶回台中教育大學")
+    st.markdown(f"### 🏫 內用或帶回{'／'.join(CAMPUSES)}")
+    dine_options = ["內用"] + [f"帶回{c}" for c in CAMPUSES]
     dine_mode = st.radio(
         "選擇方式",
-        ["內用", "帶回台中教育大學"],
-        index=0 if st.session_state.dine_mode == "內用" else 1,
+        dine_options,
+        index=dine_options.index(st.session_state.dine_mode) if st.session_state.dine_mode in dine_options else 0,
         horizontal=True,
         key="dine_mode_radio",
     )
     st.session_state.dine_mode = dine_mode
 
-    # 若帶回：再出現一次地圖（從分店到 NTCU）
-    extra_takeout_cf = 0.0
+    # 若帶回：再出現一次地圖（從分店到校區）
     extra_takeout_km = 0.0
+    takeout_on_road = False
+    takeout_msg = None
 
-    if dine_mode == "帶回台中教育大學":
-        st.info("你選擇「帶回」，將計算『分店 → 台中教育大學』的交通碳足跡。")
+    if dine_mode != "內用":
+        campus = dine_mode[len("帶回") :]
+        c_lat, c_lng = CAMPUSES[campus]
+        st.info(f"你選擇「帶回」，將計算『分店 → {campus}』的交通碳足跡。")
         if not st.session_state.stores:
             st.warning("你尚未在第一階段確認分店，所以無法計算帶回交通。請回第一階段先選分店。")
         else:
             picked = st.session_state.stores[0]
-            ef = float(st.session_state.get("ef_final", 0.0))  # 用同一交通係數
-            # 這段視為單程
-            extra_takeout_km = haversine_km(picked["lat"], picked["lng"], NTSU_LAT, NTSU_LNG)
-            extra_takeout_cf = extra_takeout_km * ef
-
-            m2 = folium.Map(location=[NTSU_LAT, NTSU_LNG], zoom_start=13)
-            folium.Marker([picked["lat"], picked["lng"]], tooltip=f"分店：{picked['name']}", icon=folium.Icon(color="green")).add_to(m2)
-            folium.Marker([NTSU_LAT, NTSU_LNG], tooltip="台中教育大學（預設）", icon=folium.Icon(color="blue")).add_to(m2)
-            folium.PolyLine([[picked["lat"], picked["lng"]], [NTSU_LAT, NTSU_LNG]], weight=3).add_to(m2)
-            st_folium(m2, height=320, use_container_width=True, key="takeout_map")
-
-            st.success(f"帶回交通：{extra_takeout_km:.2f} km（單程）→ {extra_takeout_cf:.3f} kgCO₂e")
+            # 這段視為單程（用同一交通係數）；離線分店直接查事先算好的距離表
+            extra_takeout_km, takeout_on_road = takeout_km(picked, campus)
+
+            # 顯示的是道路距離就畫道路路線；否則畫直線
+            route = None
+            router = get_router() if takeout_on_road else None
+            if router is not None:
+                mode = ROUTE_MODE.get(st.session_state.get("transport_mode"), "car")
+                route = road_path(mode, picked["lat"], picked["lng"], c_lat, c_lng, router.graph.version)
+            with profiler.span("地圖 takeout_map"):
+                render_map(
+                    "takeout_map",
+                    (c_lat, c_lng),
+                    13,
+                    base=[MapMarker(c_lat, c_lng, tooltip=f"{campus}（預設）", color="blue")],
+                    layer=[
+                        MapMarker(picked["lat"], picked["lng"], tooltip=f"分店：{picked['name']}", color="green"),
+                        MapLine(route or ((picked["lat"], picked["lng"]), (c_lat, c_lng))),
+                    ],
+                    height=320,
+                    returned_objects=[],
+                    tiles=map_tiles(),
+                )
+
+            takeout_msg = st.empty()
     else:
         st.caption("選擇「內用」：不計入帶回交通碳足跡。")
 
     # =========================
     # 最終加總 + 圖表（含比例）
     # =========================
-    total = food_sum + cook_sum + drink_cf + transport_cf + dessert_sum + packaging_sum + extra_takeout_cf
+    bd = meal_footprint.breakdown(current_meal(dessert=dessert_rows, packaging=packaging_rows, takeout_km=extra_takeout_km))
+    food_sum, cook_sum, drink_cf, transport_cf = bd.food, bd.cooking, bd.drink, bd.transport
+    dessert_sum, packaging_sum, extra_takeout_cf = bd.dessert, bd.packaging, bd.takeout
+    total = bd.total
+
+    if dessert_msg is not None:
+        dessert_msg.success(f"甜點已納入計算：{dessert_sum:.3f} kgCO₂e")
+    if takeout_msg is not None:
+        takeout_msg.success(
+            f"帶回交通：{extra_takeout_km:.2f} km（單程，{'道路距離' if takeout_on_road else '直線距離'}）"
+            f"→ {extra_takeout_cf:.3f} kgCO₂e"
+        )
 
     st.markdown("## ✅ 最終碳足跡")
     st.markdown(
@@ -986,55 +1282,85 @@ if st.session_state.stage == 2:
     )
 
     st.markdown("### 📊 最終圖表（含比例 %）")
-    chart_data = pd.DataFrame(
+    key = chart_key(
         [
-            {"cat": "Food", "kgCO2e": food_sum},
-            {"cat": "Cooking", "kgCO2e": cook_sum},
-            {"cat": "Drink", "kgCO2e": drink_cf},
-            {"cat": "Transport", "kgCO2e": transport_cf},
-            {"cat": "Dessert", "kgCO2e": dessert_sum},
-            {"cat": "Packaging", "kgCO2e": packaging_sum},
+            ("Food", food_sum),
+            ("Cooking", cook_sum),
+            ("Drink", drink_cf),
+            ("Transport", transport_cf),
+            ("Dessert", dessert_sum),
+            ("Packaging", packaging_sum),
+            ("Takeout", extra_takeout_cf),
         ]
     )
-    if extra_takeout_cf > 0:
-        chart_data = pd.concat([chart_data, pd.DataFrame([{"cat": "Takeout", "kgCO2e": extra_takeout_cf}])], ignore_index=True)
-
-    chart_data = chart_data[chart_data["kgCO2e"] > 0].copy()
-    denom = float(chart_data["kgCO2e"].sum()) if float(chart_data["kgCO2e"].sum()) > 0 else 1.0
-    chart_data["pct"] = chart_data["kgCO2e"] / denom
-    chart_data["pct_label"] = (chart_data["pct"] * 100).round(0).astype(int).astype(str) + "%"
-
-    bar = (
-        alt.Chart(chart_data)
-        .mark_bar()
-        .encode(
-            y=alt.Y("cat:N", sort="-x", title=""),
-            x=alt.X("kgCO2e:Q", title="kgCO₂e"),
-            tooltip=["cat", alt.Tooltip("kgCO2e:Q", format=".3f"), alt.Tooltip("pct:Q", format=".0%")],
-        )
-        .properties(height=200)
-    )
-    st.altair_chart(bar, use_container_width=True)
-
-    pie = (
-        alt.Chart(chart_data)
-        .mark_arc()
-        .encode(
-            theta=alt.Theta("kgCO2e:Q"),
-            color=alt.Color("cat:N", legend=alt.Legend(orient="right", title="Category")),
-            tooltip=["cat", alt.Tooltip("kgCO2e:Q", format=".3f"), alt.Tooltip("pct:Q", format=".0%")],
-        )
-        .properties(height=280)
-    )
-    labels = (
-        alt.Chart(chart_data)
-        .mark_text(radius=120)
-        .encode(
-            theta=alt.Theta("kgCO2e:Q"),
-            text=alt.Text("pct_label:N"),
-        )
-    )
-    st.altair_chart(pie + labels, use_container_width=True)
+    with profiler.span("圖表 最終"):
+        st.vega_lite_chart(bar_spec(key, 200), use_container_width=True)
+        st.vega_lite_chart(pie_spec(key, 280, 120), use_container_width=True)
+
+    # =========================
+    # 教師用：這一餐在所有可能餐點中的位置（蒙地卡羅模擬）
+    # =========================
+    with st.expander("👩‍🏫 教師用：這一餐在「所有可能的餐點」中排第幾？（模擬）"):
+        st.caption("依同樣的抽法隨機模擬大量餐點；不含採買/帶回交通（跟每個人的位置有關）。")
+        # 幾百萬餐的模擬很吃 CPU、結果還會存到磁碟：只有輸入教師密碼才能按
+        if teacher_unlocked("teacher_token_sim"):
+            sim_n = st.select_slider(
+                "模擬幾餐",
+                options=[100_000, 1_000_000, 3_000_000],
+                value=1_000_000,
+                format_func=lambda n: f"{n:,}",
+            )
+            if st.button("▶️ 執行模擬", use_container_width=True):
+                st.session_state.sim_n = sim_n
+        elif not st.session_state.get("sim_n"):
+            st.info("需要教師密碼才能執行模擬。")
+
+        if st.session_state.get("sim_n"):
+            spec = SimSpec.from_catalog(catalog_index, PACKAGING_CODES)
+            sim = run_meal_simulation(catalog_index.version, st.session_state.sim_n, SIM_SEED, spec.params(), _spec=spec)
+            mine = total - transport_cf - extra_takeout_cf
+            st.markdown(
+                f"""
+- 模擬 **{sim.n:,}** 餐：中位數 `{sim.percentile(50):.3f}`、平均 `{sim.mean:.3f}`、P10 `{sim.percentile(10):.3f}`、P90 `{sim.percentile(90):.3f}` kgCO₂e
+- 你的這一餐（不含交通）：`{mine:.3f}` kgCO₂e → 約在第 **{sim.percentile_of(mine):.0f}** 百分位
+"""
+            )
+            hist_df = pd.DataFrame({"lo": sim.edges[:-1], "hi": sim.edges[1:], "count": sim.counts})
+            hist = (
+                alt.Chart(hist_df)
+                .mark_bar()
+                .encode(
+                    x=alt.X("lo:Q", bin="binned", title="kgCO₂e（不含交通；最右一格含更高的值）"),
+                    x2="hi:Q",
+                    y=alt.Y("count:Q", title="餐數"),
+                )
+                .properties(height=220)
+            )
+            mine_rule = alt.Chart(pd.DataFrame({"x": [mine]})).mark_rule(color="red", strokeWidth=2).encode(x="x:Q")
+            with profiler.span("圖表 模擬分布"):
+                st.altair_chart(hist + mine_rule, use_container_width=True)
+
+    # =========================
+    # 教師用：離線分店檔裡每家分店的帶回交通（查事先算好的距離表，不重算）
+    # =========================
+    takeout_table = get_takeout_table()
+    if takeout_table is not None:
+        with st.expander("👩‍🏫 教師用：各分店帶回交通比較"):
+            cmp_campus = st.selectbox("帶回到", list(CAMPUSES), key="takeout_cmp_campus")
+            mode = st.session_state.get("transport_mode", "汽車（汽油）")
+            ef = float(st.session_state.get("ef_final", 0.0))
+            km, on_road = takeout_table.column(cmp_campus, ROUTE_MODE[mode])
+            poi = get_poi_index(POI_PATH_DEFAULT)
+            cmp_df = pd.DataFrame(
+                {
+                    "分店": poi.names,
+                    "單程 km": km.round(2),
+                    "距離": ["道路" if r else "直線" for r in on_road.tolist()],
+                    "kgCO₂e": (km * ef).round(3),
+                }
+            ).sort_values("單程 km", kind="stable")
+            st.caption(f"交通方式：{mode}（{ef:g} kgCO₂e/km）；共 {len(cmp_df)} 家分店")
+            st.dataframe(cmp_df, use_container_width=True, hide_index=True)
 
     # =========================
     # 記錄：下載 CSV +（可選）寫入 Google Sheet
@@ -1055,10 +1381,12 @@ if st.session_state.stage == 2:
         "Takeout_kgco2e": round(extra_takeout_cf, 6),
         "drink_name": drink_name,
         "dessert_selected": ", ".join(dessert_selected) if dessert_selected else "",
-        "packaging_selected": ", ".join(st.session_state.packaging_pick) if st.session_state.packaging_pick else "",
+        "packaging_selected": ", ".join(catalog_index.names[r] for r in st.session_state.packaging_pick_rows),
         "store_selected": st.session_state.stores[0]["name"] if st.session_state.stores else "",
         "origin_lat": st.session_state.origin["lat"],
         "origin_lng": st.session_state.origin["lng"],
+        "catalog_version": catalog_index.version,
+        "sample_key": sample_key(),
     }
 
     colR1, colR2 = st.columns([1, 1])
@@ -1092,19 +1420,92 @@ if st.session_state.stage == 2:
         )
 
     st.markdown("### 🧾 全班總表（Google Sheet，可選）")
-    SHEET_NAME = st.text_input("Google Sheet 檔名（要完全一樣）", value="學生碳足跡紀錄")
+    SHEET_NAME = st.text_input("Google Sheet 檔名（要完全一樣；也可貼 Sheet 網址）", value="學生碳足跡紀錄")
     if sheets_available():
         if st.button("📤 送出並寫入 Google Sheet（全班彙整）", use_container_width=True):
             try:
-                append_result_to_google_sheet(SHEET_NAME, row)
-                st.success("已成功寫入 Google Sheet ✅")
+                if append_result_to_google_sheet(SHEET_NAME, row):
+                    st.success("已送出 ✅（已先存到伺服器暫存區，會自動批次寫入 Google Sheet）")
+                else:
+                    st.info("這筆結果已經送出過了。")
             except Exception as e:
-                st.error("寫入失敗：請確認（1）服務帳戶已共用該 Sheet 為編輯者（2）Sheet 檔名正確。")
+                st.error("送出失敗：無法寫入伺服器暫存區，請先下載 CSV 保留結果。")
                 st.exception(e)
+
+        # 本裝置的送出狀態（背景寫入失敗會自動重試，不需要重按）
+        try:
+            ob_status = get_result_outbox().status(st.session_state.device_id)
+        except Exception:
+            ob_status = None
+        if ob_status and (ob_status["pending"] or ob_status["sent"] or ob_status["failed"]):
+            st.caption(
+                f"📮 本裝置：已寫入 {ob_status['sent']} 筆、等待寫入 {ob_status['pending']} 筆"
+                + (f"、寫入失敗 {ob_status['failed']} 筆" if ob_status["failed"] else "")
+            )
+            if ob_status["pending"] and ob_status["last_error"]:
+                st.warning("Google Sheet 暫時寫不進去（會自動重試）。請確認服務帳戶已共用該 Sheet 為編輯者、Sheet 檔名正確。")
+            if ob_status["failed"]:
+                st.error("有結果重試多次仍寫不進 Google Sheet，已停止重試；請下載 CSV 交給老師。")
     else:
         st.warning("尚未設定 Google Sheet 憑證（st.secrets['gcp_service_account']）。你仍可下載 CSV。")
 
     st.markdown("---")
-    if st.button("↩️ 回到第一階段（重新調整主餐/交通）", use_container_width=True):
-        st.session_state.stage = 1
-        st.rerun()
+    st.button("↩️ 回到第一階段（重新調整主餐/交通）", use_container_width=True, on_click=on_switch_stage, args=(1,))
+
+
+# =========================
+# 13) 開發者資訊（網址加 ?debug=1 才顯示）
+#     會影響全部使用者的操作（切換目錄、清除計時紀錄）要輸入教師密碼（teacher_unlocked）
+# =========================
+sections.close()
+if st.query_params.get("debug") == "1":
+    rs = st.session_state.run_stats
+    frag_runs = "、".join(f"{k} {v} 次" for k, v in rs["fragment_runs"].items()) or "無"
+    st.caption(f"🛠️ 上一個按鈕操作「{rs['action']}」之後整頁執行了 {rs['script_runs']} 次（0 = 只重跑局部區塊）；fragment：{frag_runs}")
+    is_teacher = teacher_unlocked()
+
+    # 目錄版本：背景監看到的各份 Excel；切換後新的一餐才會用新版本（做到一半的不受影響）
+    manager = get_catalog_manager()
+    st.caption(f"📚 本 session 目錄版本 `{catalog_index.version}`；最新 `{getattr(manager.current, 'version', '-')}`")
+    books = manager.workbooks()
+    if books:
+        st.dataframe(pd.DataFrame(books), use_container_width=True, hide_index=True)
+        usable = [b["name"] for b in books if b["version"]]
+        active = next((b["name"] for b in books if b["active"]), None)
+        if is_teacher:
+            picked = st.selectbox("改用這份 Excel（全部使用者）", usable, index=usable.index(active) if active in usable else 0)
+            if picked != active and st.button("切換目錄"):
+                manager.use(picked)
+                st.rerun()
+    if manager.last_diff is not None:
+        d = manager.last_diff
+        st.caption(f"上次切換 `{d.old_version}` → `{d.new_version}`：{d.summary()}")
+
+    # 各區段耗時：全部 session 最近 PROFILE_WINDOW 次（fragment 局部重跑記在「11 第一階段 › …」）
+    st.markdown("#### ⏱️ 各區段耗時（ms）")
+    prof_rows = profiler.summary()
+    if prof_rows:
+        st.dataframe(pd.DataFrame(prof_rows), use_container_width=True, hide_index=True)
+    st.caption(f"本 process 共記錄 {profiler.total} 筆；每個區段保留最近 {profiler.window} 筆")
+    colP1, colP2 = st.columns([1, 1])
+    with colP1:
+        st.download_button(
+            "⬇️ 下載計時紀錄（JSONL）",
+            data=profiler.to_jsonl().encode("utf-8"),
+            file_name=f"profile_{datetime.now():%Y%m%d_%H%M%S}.jsonl",
+            mime="application/jsonl",
+            use_container_width=True,
+        )
+    with colP2:
+        # 計時紀錄全班共用：清除也要教師密碼
+        if is_teacher and st.button("🧹 清除計時紀錄", use_container_width=True):
+            profiler.clear()
+            st.rerun()
+
+    tile_server = get_tile_server()
+    if tile_server is not None:
+        ts = tile_server.proxy.cache.stats()
+        st.caption(
+            f"🗺️ 圖磚快取：{ts['tiles']} 張、{ts['bytes'] / 2**20:.1f} / {ts['max_bytes'] / 2**20:.0f} MiB；"
+            f"本 process 命中 {ts['hits']}、未命中 {ts['misses']}；上游 {tile_server.proxy.scheduler.stats}"
+        )